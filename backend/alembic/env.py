@@ -5,6 +5,11 @@ from sqlalchemy import pool
 
 from alembic import context
 
+from app.database import Base, SQLALCHEMY_DATABASE_URL
+from app.search import is_search_object
+# Import every model module so its table is registered on Base.metadata
+from app.models import doctor, idempotency_key, medication, patient, pharmacist, prescription, prescription_medication, stock_movement, stock_reservation  # noqa: F401
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -14,11 +19,19 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# The application decides which database to migrate, unless a URL was
+# passed explicitly (for example by the test suite)
+if not config.get_main_option("sqlalchemy.url"):
+    config.set_main_option("sqlalchemy.url", SQLALCHEMY_DATABASE_URL.replace("%", "%%"))
+
 # add your model's MetaData object here
 # for 'autogenerate' support
-# from myapp import mymodel
-# target_metadata = mymodel.Base.metadata
-target_metadata = None
+target_metadata = Base.metadata
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # The search index objects are managed by hand (see app/search.py)
+    return not (reflected and compare_to is None and is_search_object(name))
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -42,6 +55,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -65,7 +79,11 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+            # SQLite cannot ALTER constraints in place, so table rebuilds are needed
+            render_as_batch=connection.dialect.name == "sqlite",
         )
 
         with context.begin_transaction():
@@ -0,0 +1,142 @@
+"""Initial schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-17 09:00:00.000000
+
+Mirrors what Base.metadata.create_all used to build. Databases created
+before migrations existed already have these tables; mark them with
+`alembic stamp 0001` and then run `alembic upgrade head`.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'patients',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('ssn', sa.String(), nullable=True),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('date_of_birth', sa.Date(), nullable=True),
+        sa.Column('contact_info', sa.String(), nullable=True),
+        sa.Column('allergies', sa.String(), nullable=True),
+        sa.Column('email', sa.String(), nullable=True),
+        sa.Column('hashed_password', sa.String(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_patients_id', 'patients', ['id'], unique=False)
+    op.create_index('ix_patients_ssn', 'patients', ['ssn'], unique=True)
+    op.create_index('ix_patients_email', 'patients', ['email'], unique=True)
+
+    op.create_table(
+        'pharmacists',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('license_number', sa.String(), nullable=True),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('email', sa.String(), nullable=True),
+        sa.Column('hashed_password', sa.String(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_pharmacists_id', 'pharmacists', ['id'], unique=False)
+    op.create_index('ix_pharmacists_license_number', 'pharmacists', ['license_number'], unique=True)
+    op.create_index('ix_pharmacists_email', 'pharmacists', ['email'], unique=True)
+
+    op.create_table(
+        'doctors',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('license_number', sa.String(), nullable=True),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('specialization', sa.String(), nullable=True),
+        sa.Column('contact_info', sa.String(), nullable=True),
+        sa.Column('email', sa.String(), nullable=True),
+        sa.Column('hashed_password', sa.String(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_doctors_id', 'doctors', ['id'], unique=False)
+    op.create_index('ix_doctors_license_number', 'doctors', ['license_number'], unique=True)
+    op.create_index('ix_doctors_email', 'doctors', ['email'], unique=True)
+
+    op.create_table(
+        'medications',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('dosage_form', sa.String(), nullable=True),
+        sa.Column('strength', sa.String(), nullable=True),
+        sa.Column('stock_quantity', sa.Integer(), nullable=True),
+        sa.Column('price', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_medications_id', 'medications', ['id'], unique=False)
+    op.create_index('ix_medications_name', 'medications', ['name'], unique=True)
+
+    op.create_table(
+        'prescriptions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('patient_ssn', sa.String(), nullable=True),
+        sa.Column('doctor_license', sa.String(), nullable=True),
+        sa.Column('date_issued', sa.Date(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['doctor_license'], ['doctors.license_number']),
+        sa.ForeignKeyConstraint(['patient_ssn'], ['patients.ssn']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_prescriptions_id', 'prescriptions', ['id'], unique=False)
+
+    op.create_table(
+        'prescription_medications',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('prescription_id', sa.Integer(), nullable=True),
+        sa.Column('medication_name', sa.String(), nullable=True),
+        sa.Column('dosage', sa.String(), nullable=True),
+        sa.Column('frequency', sa.String(), nullable=True),
+        sa.Column('duration', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['medication_name'], ['medications.name']),
+        sa.ForeignKeyConstraint(['prescription_id'], ['prescriptions.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sqlite_autoincrement=True
+    )
+    op.create_index('ix_prescription_medications_id', 'prescription_medications', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_prescription_medications_id', table_name='prescription_medications')
+    op.drop_table('prescription_medications')
+    op.drop_index('ix_prescriptions_id', table_name='prescriptions')
+    op.drop_table('prescriptions')
+    op.drop_index('ix_medications_name', table_name='medications')
+    op.drop_index('ix_medications_id', table_name='medications')
+    op.drop_table('medications')
+    op.drop_index('ix_doctors_email', table_name='doctors')
+    op.drop_index('ix_doctors_license_number', table_name='doctors')
+    op.drop_index('ix_doctors_id', table_name='doctors')
+    op.drop_table('doctors')
+    op.drop_index('ix_pharmacists_email', table_name='pharmacists')
+    op.drop_index('ix_pharmacists_license_number', table_name='pharmacists')
+    op.drop_index('ix_pharmacists_id', table_name='pharmacists')
+    op.drop_table('pharmacists')
+    op.drop_index('ix_patients_email', table_name='patients')
+    op.drop_index('ix_patients_ssn', table_name='patients')
+    op.drop_index('ix_patients_id', table_name='patients')
+    op.drop_table('patients')
@@ -0,0 +1,57 @@
+"""Repair the line-item medication FK in databases built by create_all
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 09:10:00.000000
+
+SQLite databases created before migrations existed declare
+prescription_medications.medication_name as referencing the integer
+medications.id, so every line fails once foreign keys are enforced. Such
+databases are stamped at 0001; this revision rebuilds the table so the
+constraint references medications.name. Other databases are left untouched.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FK_NAME = 'fk_prescription_medications_medication_name_medications'
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def _referenced_column():
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys('prescription_medications'):
+        if fk['constrained_columns'] == ['medication_name']:
+            return fk['referred_columns'][0]
+    return None
+
+
+def _repoint_fk(target_column: str) -> None:
+    # Unnamed constraints can only be dropped by rebuilding the table
+    with op.batch_alter_table(
+        'prescription_medications',
+        recreate='always',
+        naming_convention=NAMING_CONVENTION,
+        table_kwargs={'sqlite_autoincrement': True},
+    ) as batch_op:
+        batch_op.drop_constraint(FK_NAME, type_='foreignkey')
+        batch_op.create_foreign_key(FK_NAME, 'medications', ['medication_name'], [target_column])
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'sqlite' and _referenced_column() == 'id':
+        _repoint_fk('name')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Nothing to undo: the broken constraint is never reinstated
+    pass
@@ -0,0 +1,36 @@
+"""Composite indexes for the prescription listing filters
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 09:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_prescriptions_date_issued_id', 'prescriptions', ['date_issued', 'id'], unique=False)
+    op.create_index('ix_prescriptions_status_date_issued', 'prescriptions', ['status', 'date_issued', 'id'], unique=False)
+    op.create_index('ix_prescriptions_doctor_license_date_issued', 'prescriptions', ['doctor_license', 'date_issued', 'id'], unique=False)
+    op.create_index('ix_prescriptions_patient_ssn_date_issued', 'prescriptions', ['patient_ssn', 'date_issued', 'id'], unique=False)
+    op.create_index('ix_prescription_medications_prescription_id', 'prescription_medications', ['prescription_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_prescription_medications_prescription_id', table_name='prescription_medications')
+    op.drop_index('ix_prescriptions_patient_ssn_date_issued', table_name='prescriptions')
+    op.drop_index('ix_prescriptions_doctor_license_date_issued', table_name='prescriptions')
+    op.drop_index('ix_prescriptions_status_date_issued', table_name='prescriptions')
+    op.drop_index('ix_prescriptions_date_issued_id', table_name='prescriptions')
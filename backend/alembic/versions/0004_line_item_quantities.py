@@ -0,0 +1,62 @@
+"""Structured dispensing quantities on prescription lines
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 10:00:00.000000
+
+Existing lines are parsed once here, so fulfillment never has to parse
+strings.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.dispensing import dispensing_quantities
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('prescription_medications') as batch_op:
+        batch_op.add_column(sa.Column('units_per_dose', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('doses_per_day', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('days', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('quantity', sa.Integer(), nullable=True))
+
+    lines = sa.table(
+        'prescription_medications',
+        sa.column('id', sa.Integer),
+        sa.column('dosage', sa.String),
+        sa.column('frequency', sa.String),
+        sa.column('duration', sa.String),
+        sa.column('units_per_dose', sa.Float),
+        sa.column('doses_per_day', sa.Float),
+        sa.column('days', sa.Float),
+        sa.column('quantity', sa.Integer),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(lines.c.id, lines.c.dosage, lines.c.frequency, lines.c.duration)).all()
+    if rows:
+        bind.execute(
+            lines.update().where(lines.c.id == sa.bindparam('line_id')),
+            [
+                {'line_id': row.id, **dispensing_quantities(row.dosage, row.frequency, row.duration)}
+                for row in rows
+            ]
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('prescription_medications') as batch_op:
+        batch_op.drop_column('quantity')
+        batch_op.drop_column('days')
+        batch_op.drop_column('doses_per_day')
+        batch_op.drop_column('units_per_dose')
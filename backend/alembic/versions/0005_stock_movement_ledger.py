@@ -0,0 +1,75 @@
+"""Append-only stock movement ledger
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 12:00:00.000000
+
+medications.stock_quantity becomes the compacted snapshot. Each medication
+gets an opening movement for its current stock, so the ledger accounts for
+every unit from here on.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'stock_movements',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('medication_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('prescription_id', sa.Integer(), nullable=True),
+        sa.Column('note', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(['medication_id'], ['medications.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['prescription_id'], ['prescriptions.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_stock_movements_medication_id_id', 'stock_movements', ['medication_id', 'id'], unique=False)
+
+    op.execute("UPDATE medications SET stock_quantity = 0 WHERE stock_quantity IS NULL")
+    with op.batch_alter_table('medications') as batch_op:
+        batch_op.alter_column(
+            'stock_quantity', new_column_name='stock_snapshot',
+            existing_type=sa.Integer(), nullable=False, server_default='0'
+        )
+        batch_op.add_column(sa.Column('snapshot_movement_id', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute(
+        "INSERT INTO stock_movements (medication_id, kind, quantity, note) "
+        "SELECT id, 'adjust', stock_snapshot, 'Opening stock' FROM medications ORDER BY id"
+    )
+    op.execute(
+        "UPDATE medications SET snapshot_movement_id = "
+        "(SELECT MAX(id) FROM stock_movements WHERE stock_movements.medication_id = medications.id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Fold the movements recorded since the last compaction back into the stock column
+    op.execute(
+        "UPDATE medications SET stock_snapshot = stock_snapshot + COALESCE("
+        "(SELECT SUM(quantity) FROM stock_movements WHERE stock_movements.medication_id = medications.id "
+        "AND stock_movements.id > medications.snapshot_movement_id), 0)"
+    )
+    with op.batch_alter_table('medications') as batch_op:
+        batch_op.drop_column('snapshot_movement_id')
+        batch_op.alter_column(
+            'stock_snapshot', new_column_name='stock_quantity',
+            existing_type=sa.Integer(), nullable=True, server_default=None
+        )
+
+    op.drop_index('ix_stock_movements_medication_id_id', table_name='stock_movements')
+    op.drop_table('stock_movements')
@@ -0,0 +1,53 @@
+"""Stock reservations held for pending prescriptions
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'stock_reservations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('medication_id', sa.Integer(), nullable=False),
+        sa.Column('prescription_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(['medication_id'], ['medications.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['prescription_id'], ['prescriptions.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_stock_reservations_prescription_id'), 'stock_reservations', ['prescription_id'], unique=False)
+    active = sa.text("status = 'active'")
+    op.create_index(
+        'ix_stock_reservations_active_medication_id', 'stock_reservations', ['medication_id', 'status', 'quantity'],
+        unique=False, sqlite_where=active, postgresql_where=active
+    )
+    op.create_index(
+        'ix_stock_reservations_active_expires_at', 'stock_reservations', ['expires_at'],
+        unique=False, sqlite_where=active, postgresql_where=active
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_stock_reservations_active_expires_at', table_name='stock_reservations')
+    op.drop_index('ix_stock_reservations_active_medication_id', table_name='stock_reservations')
+    op.drop_index(op.f('ix_stock_reservations_prescription_id'), table_name='stock_reservations')
+    op.drop_table('stock_reservations')
@@ -0,0 +1,31 @@
+"""Search index over medication names, descriptions and strengths
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.search import create_search_index, drop_search_index
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # SQLite: FTS5 trigram table plus sync triggers, filled from the existing rows.
+    # PostgreSQL: pg_trgm GIN index (the extension must be available to the server)
+    create_search_index(op.get_bind())
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    drop_search_index(op.get_bind())
@@ -0,0 +1,80 @@
+"""Integer medication_id foreign key on prescription lines
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17 19:00:00.000000
+
+Lines referenced medications by name. They now carry medications.id, backfilled
+from the name, which stays on the line as a display field without a constraint.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NAME_FK = 'fk_prescription_medications_medication_name_medications'
+ID_FK = 'fk_prescription_medications_medication_id_medications'
+# Gives SQLite's unnamed constraints a name the batch rebuild can drop
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def _foreign_key_name(column: str, default: str):
+    """The constraint's reflected name, or the one the naming convention gives it on SQLite"""
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys('prescription_medications'):
+        if fk['constrained_columns'] == [column]:
+            return fk['name'] or default
+    return None
+
+
+def _batch():
+    return op.batch_alter_table(
+        'prescription_medications',
+        naming_convention=NAMING_CONVENTION,
+        table_kwargs={'sqlite_autoincrement': True},
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    name_fk = _foreign_key_name('medication_name', NAME_FK)
+    with _batch() as batch_op:
+        batch_op.add_column(sa.Column('medication_id', sa.Integer(), nullable=True))
+        if name_fk:
+            batch_op.drop_constraint(name_fk, type_='foreignkey')
+        batch_op.create_foreign_key(ID_FK, 'medications', ['medication_id'], ['id'])
+        batch_op.drop_index('ix_prescription_medications_prescription_id')
+        batch_op.create_index(
+            'ix_prescription_medications_prescription_id_medication_id',
+            ['prescription_id', 'medication_id', 'quantity'], unique=False
+        )
+        batch_op.create_index('ix_prescription_medications_medication_id', ['medication_id'], unique=False)
+
+    op.execute(
+        "UPDATE prescription_medications SET medication_id = "
+        "(SELECT medications.id FROM medications WHERE medications.name = prescription_medications.medication_name)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Names follow the medications they point to before the name becomes the key again
+    op.execute(
+        "UPDATE prescription_medications SET medication_name = "
+        "(SELECT medications.name FROM medications WHERE medications.id = prescription_medications.medication_id) "
+        "WHERE medication_id IS NOT NULL"
+    )
+    id_fk = _foreign_key_name('medication_id', ID_FK)
+    with _batch() as batch_op:
+        batch_op.drop_index('ix_prescription_medications_medication_id')
+        batch_op.drop_index('ix_prescription_medications_prescription_id_medication_id')
+        batch_op.create_index('ix_prescription_medications_prescription_id', ['prescription_id'], unique=False)
+        batch_op.drop_constraint(id_fk, type_='foreignkey')
+        batch_op.create_foreign_key(NAME_FK, 'medications', ['medication_name'], ['name'])
+        batch_op.drop_column('medication_id')
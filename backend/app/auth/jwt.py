@@ -1,21 +1,23 @@
 from datetime import datetime, timedelta
-from typing import Optional, Union
+from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, ConfigDict
 import os
+import time
 from dotenv import load_dotenv
 
 # Loading environment variables from .env file
 load_dotenv()
 
-from app.schemas.pharmacist import PharmacistResponse
 from app.models.pharmacist import Pharmacist
 from app.models.doctor import Doctor
 from app.models.patient import Patient
-from app.database import get_db
+from app.database import get_async_db
+from app.cache import principal_cache
 
 # JWT configuration
 # Using environment variable for security, with a fallback for development
@@ -23,21 +25,12 @@ SECRET_KEY = os.environ.get("JWT_SECRET_KEY","secretttt")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-# Token URLs - where clients will send username/password to get token
+# Every user type sends its token the same way, so one scheme reads it for all of them.
+# Pharmacists log in at auth/token, doctors at auth/doctor-token, patients at auth/patient-token
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl="auth/token", 
     auto_error=False,
-    scheme_name="pharmacistAuth"  # Same name as in main.py securitySchemes
-)
-doctor_oauth2_scheme = OAuth2PasswordBearer(
-    tokenUrl="auth/doctor-token", 
-    auto_error=False,
-    scheme_name="doctorAuth"  # Same name as in main.py securitySchemes
-)
-patient_oauth2_scheme = OAuth2PasswordBearer(
-    tokenUrl="auth/patient-token", 
-    auto_error=False,
-    scheme_name="patientAuth"  # Same name as in main.py securitySchemes
+    scheme_name="bearerAuth"  # Same name as in main.py securitySchemes
 )
 
 class TokenData(BaseModel):
@@ -49,10 +42,15 @@ class Token(BaseModel):
     token_type: str
 
 class UserInfo(BaseModel):
+    """An authenticated user; shared through the principal cache, so read-only"""
+    model_config = ConfigDict(frozen=True)
+
     id: int
     email: str
     user_type: str
     is_active: bool
+    license_number: Optional[str] = None  # pharmacists and doctors
+    ssn: Optional[str] = None  # patients
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
@@ -66,79 +64,69 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+USER_MODELS = {"pharmacist": Pharmacist, "doctor": Doctor, "patient": Patient}
+# The claim identifying each kind of user in prescriptions, and its column
+USER_KEYS = {"pharmacist": "license_number", "doctor": "license_number", "patient": "ssn"}
+
+def principal_claims(user, user_type: str) -> dict:
+    """Token claims for a user: enough to authorize requests without reading the user back"""
+    key = USER_KEYS[user_type]
+    return {"sub": user.email, "user_type": user_type, "uid": user.id, key: getattr(user, key)}
+
+async def load_principal(token: str, db: AsyncSession) -> Optional[UserInfo]:
+    """The user a token belongs to, from the principal cache or the token itself; None if invalid"""
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    email: str = payload.get("sub")
+    user_type: str = payload.get("user_type")
+    if email is None or user_type not in USER_MODELS:
+        return None
+
+    version = principal_cache.version()
+    model = USER_MODELS[user_type]
+    key = USER_KEYS[user_type]
+    if "uid" in payload:
+        # Identity comes from the claims; the database only confirms the account is still there and active
+        is_active = (await db.execute(
+            select(model.is_active).where(model.id == payload["uid"], model.email == email)
+        )).first()
+        if is_active is None:
+            return None
+        claims = {"id": payload["uid"], "is_active": bool(is_active[0]), key: payload.get(key)}
+    else:
+        # Tokens minted before the claims were added
+        user = (await db.execute(
+            select(model.id, model.is_active, getattr(model, key)).where(model.email == email)
+        )).first()
+        if user is None:
+            return None
+        claims = {"id": user.id, "is_active": bool(user.is_active), key: getattr(user, key)}
+
+    principal = UserInfo(email=email, user_type=user_type, **claims)
+    # Never trusted past the token's own expiry
+    expires_in = payload["exp"] - time.time() if "exp" in payload else None
+    principal_cache.put(token, principal, version, ttl=expires_in)
+    return principal
+
 # Unified authentication - can handle any user type
-async def get_current_user(
-    pharmacist_token: str = Depends(oauth2_scheme),
-    doctor_token: str = Depends(doctor_oauth2_scheme),
-    patient_token: str = Depends(patient_oauth2_scheme),
-    db: Session = Depends(get_db)
-):
-    """Try to authenticate as any user type and return user info with type"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    # Try pharmacist token first
-    if pharmacist_token:
-        try:
-            payload = jwt.decode(pharmacist_token, SECRET_KEY, algorithms=[ALGORITHM])
-            email: str = payload.get("sub")
-            user_type: str = payload.get("user_type")
-            if email and user_type == "pharmacist":
-                pharmacist = db.query(Pharmacist).filter(Pharmacist.email == email).first()
-                if pharmacist and pharmacist.is_active:
-                    return UserInfo(
-                        id=pharmacist.id,
-                        email=pharmacist.email,
-                        user_type="pharmacist",
-                        is_active=pharmacist.is_active
-                    )
-        except JWTError:
-            pass
-    
-    # Try doctor token
-    if doctor_token:
-        try:
-            payload = jwt.decode(doctor_token, SECRET_KEY, algorithms=[ALGORITHM])
-            email: str = payload.get("sub")
-            user_type: str = payload.get("user_type")
-            if email and user_type == "doctor":
-                doctor = db.query(Doctor).filter(Doctor.email == email).first()
-                if doctor and doctor.is_active:
-                    return UserInfo(
-                        id=doctor.id,
-                        email=doctor.email,
-                        user_type="doctor",
-                        is_active=doctor.is_active
-                    )
-        except JWTError:
-            pass
-    
-    # Try patient token
-    if patient_token:
-        try:
-            payload = jwt.decode(patient_token, SECRET_KEY, algorithms=[ALGORITHM])
-            email: str = payload.get("sub")
-            user_type: str = payload.get("user_type")
-            if email and user_type == "patient":
-                patient = db.query(Patient).filter(Patient.email == email).first()
-                if patient and patient.is_active:
-                    return UserInfo(
-                        id=patient.id,
-                        email=patient.email,
-                        user_type="patient",
-                        is_active=patient.is_active
-                    )
-        except JWTError:
-            pass
-    
-    raise credentials_exception
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """Authenticate any user type and return user info with type"""
+    user = await load_principal(token, db) if token else None
+    if user is None or not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
 
-# Pharmacist authentication - original implementation
-async def get_current_pharmacist(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Validate token and return current pharmacist"""
+async def authenticate(token: Optional[str], user_type: str, db: AsyncSession) -> UserInfo:
+    """Validate a token of the given user type and return its active user"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -149,100 +137,43 @@ async def get_current_pharmacist(token: str = Depends(oauth2_scheme), db: Sessio
     if not token:
         raise credentials_exception
         
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        user_type: str = payload.get("user_type")
-        if email is None or user_type != "pharmacist":
-            raise credentials_exception
-        token_data = TokenData(email=email, user_type=user_type)
-    except JWTError:
-        raise credentials_exception
-        
-    pharmacist = db.query(Pharmacist).filter(Pharmacist.email == token_data.email).first()
-    if pharmacist is None:
+    user = await load_principal(token, db)
+    if user is None or user.user_type != user_type:
         raise credentials_exception
-    if not pharmacist.is_active:
-        raise HTTPException(status_code=400, detail="Inactive pharmacist")
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail=f"Inactive {user_type}")
         
-    return pharmacist
+    return user
 
-async def get_current_active_pharmacist(current_pharmacist: Pharmacist = Depends(get_current_pharmacist)):
+# Pharmacist authentication
+async def get_current_pharmacist(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """Validate token and return current pharmacist"""
+    return await authenticate(token, "pharmacist", db)
+
+async def get_current_active_pharmacist(current_pharmacist: UserInfo = Depends(get_current_pharmacist)):
     """Check if current pharmacist is active"""
     if not current_pharmacist.is_active:
         raise HTTPException(status_code=400, detail="Inactive pharmacist")
     return current_pharmacist
 
-# Doctor authentication - original implementation
-async def get_current_doctor(token: str = Depends(doctor_oauth2_scheme), db: Session = Depends(get_db)):
+# Doctor authentication
+async def get_current_doctor(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     """Validate token and return current doctor"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    # Check if token exists before trying to decode it
-    if not token:
-        raise credentials_exception
-        
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        user_type: str = payload.get("user_type")
-        if email is None or user_type != "doctor":
-            raise credentials_exception
-        token_data = TokenData(email=email, user_type=user_type)
-    except JWTError:
-        raise credentials_exception
-        
-    doctor = db.query(Doctor).filter(Doctor.email == token_data.email).first()
-    if doctor is None:
-        raise credentials_exception
-    if not doctor.is_active:
-        raise HTTPException(status_code=400, detail="Inactive doctor")
-        
-    return doctor
+    return await authenticate(token, "doctor", db)
 
-async def get_current_active_doctor(current_doctor: Doctor = Depends(get_current_doctor)):
+async def get_current_active_doctor(current_doctor: UserInfo = Depends(get_current_doctor)):
     """Check if current doctor is active"""
     if not current_doctor.is_active:
         raise HTTPException(status_code=400, detail="Inactive doctor")
     return current_doctor
 
-# Patient authentication - original implementation
-async def get_current_patient(token: str = Depends(patient_oauth2_scheme), db: Session = Depends(get_db)):
+# Patient authentication
+async def get_current_patient(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     """Validate token and return current patient"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    # Check if token exists before trying to decode it
-    if not token:
-        raise credentials_exception
-        
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        user_type: str = payload.get("user_type")
-        if email is None or user_type != "patient":
-            raise credentials_exception
-        token_data = TokenData(email=email, user_type=user_type)
-    except JWTError:
-        raise credentials_exception
-        
-    patient = db.query(Patient).filter(Patient.email == token_data.email).first()
-    if patient is None:
-        raise credentials_exception
-    if not patient.is_active:
-        raise HTTPException(status_code=400, detail="Inactive patient")
-        
-    return patient
+    return await authenticate(token, "patient", db)
 
-async def get_current_active_patient(current_patient: Patient = Depends(get_current_patient)):
+async def get_current_active_patient(current_patient: UserInfo = Depends(get_current_patient)):
     """Check if current patient is active"""
     if not current_patient.is_active:
         raise HTTPException(status_code=400, detail="Inactive patient")
-    return current_patient
\ No newline at end of file
+    return current_patient
@@ -0,0 +1,157 @@
+"""
+Token buckets in front of the login endpoints.
+
+Each login attempt takes a token from the bucket of the client IP and from
+the bucket of the account it names, before the user is looked up or any
+bcrypt work is done. Buckets refill at a steady rate, and a successful login
+gives its tokens back, so only failed attempts drain them: a burst of bad
+passwords is refused with a 429 while staff sharing the pharmacy's IP still
+log in.
+
+Buckets live in process memory, least recently used first out past
+LOGIN_THROTTLE_MAX_KEYS. With several workers, point
+LOGIN_THROTTLE_BACKEND_URL (or CACHE_BACKEND_URL) at Redis so they share
+them.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from fastapi import HTTPException, Request, status
+
+from app.cache import CACHE_BACKEND_URL
+
+# Failed attempts allowed at once, and per minute after that, for one account and for one client IP
+LOGIN_ACCOUNT_BURST = float(os.environ.get("LOGIN_ACCOUNT_BURST", "5"))
+LOGIN_ACCOUNT_PER_MINUTE = float(os.environ.get("LOGIN_ACCOUNT_PER_MINUTE", "5"))
+LOGIN_IP_BURST = float(os.environ.get("LOGIN_IP_BURST", "30"))
+LOGIN_IP_PER_MINUTE = float(os.environ.get("LOGIN_IP_PER_MINUTE", "30"))
+LOGIN_THROTTLE_MAX_KEYS = int(os.environ.get("LOGIN_THROTTLE_MAX_KEYS", "100000"))
+LOGIN_THROTTLE_BACKEND_URL = os.environ.get("LOGIN_THROTTLE_BACKEND_URL", CACHE_BACKEND_URL)
+
+class MemoryBucketBackend:
+    """Buckets for a single worker process, as (tokens, updated) pairs"""
+
+    def __init__(self, max_keys: int = LOGIN_THROTTLE_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _refilled(self, key: str, capacity: float, rate: float, now: float) -> float:
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        return min(capacity, tokens + (now - updated) * rate)
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        """Take one token; returns 0 when granted, otherwise the seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._refilled(key, capacity, rate, now)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                # A forgotten bucket comes back full
+                self._buckets.popitem(last=False)
+            return wait
+
+    def give_back(self, key: str, capacity: float, rate: float):
+        now = time.monotonic()
+        with self._lock:
+            if key in self._buckets:
+                self._buckets[key] = (min(capacity, self._refilled(key, capacity, rate, now) + 1), now)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+# KEYS[1] bucket; ARGV capacity, rate, now, delta (-1 takes a token, 1 gives one back).
+# Returns the wait in milliseconds, 0 when granted
+REDIS_BUCKET_SCRIPT = """
+local capacity, rate, now, delta = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if delta < 0 and tokens < 1 then
+    wait = math.ceil((1 - tokens) / rate * 1000)
+else
+    tokens = math.min(capacity, tokens + delta)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return wait
+"""
+
+class RedisBucketBackend:
+    """Buckets shared by every worker through Redis (requires the redis package)"""
+
+    def __init__(self, url: str, prefix: str = "pharmacy:throttle:"):
+        try:
+            import redis
+        except ImportError as error:
+            raise RuntimeError("LOGIN_THROTTLE_BACKEND_URL points at Redis but the redis package is not installed") from error
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(REDIS_BUCKET_SCRIPT)
+        self._prefix = prefix
+
+    def _call(self, key: str, capacity: float, rate: float, delta: int) -> float:
+        # Wall-clock time: the workers do not share a monotonic clock
+        return self._script(keys=[self._prefix + key], args=[capacity, rate, time.time(), delta]) / 1000
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        return self._call(key, capacity, rate, -1)
+
+    def give_back(self, key: str, capacity: float, rate: float):
+        self._call(key, capacity, rate, 1)
+
+    def clear(self):
+        for key in self._client.scan_iter(self._prefix + "*"):
+            self._client.delete(key)
+
+def create_bucket_backend(url: Optional[str] = LOGIN_THROTTLE_BACKEND_URL):
+    if not url:
+        return MemoryBucketBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBucketBackend(url)
+    raise ValueError(f"Unsupported LOGIN_THROTTLE_BACKEND_URL {url!r}")
+
+class LoginAttempt(NamedTuple):
+    account_key: str
+    ip_key: str
+
+class LoginThrottle:
+    def __init__(self, backend):
+        self.backend = backend
+        self.account_limit = (LOGIN_ACCOUNT_BURST, LOGIN_ACCOUNT_PER_MINUTE / 60)
+        self.ip_limit = (LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE / 60)
+        self.rejected = 0
+
+    def check(self, user_type: str, username: str, request: Request) -> LoginAttempt:
+        """Count an attempt against the client and the account, or refuse it with a 429"""
+        client_ip = request.client.host if request.client else "unknown"
+        attempt = LoginAttempt(f"account:{user_type}:{username.strip().lower()}", f"ip:{client_ip}")
+        wait = self.backend.take(attempt.ip_key, *self.ip_limit)
+        if not wait:
+            wait = self.backend.take(attempt.account_key, *self.account_limit)
+            if wait:
+                # Refused attempts do not count against the client as well
+                self.backend.give_back(attempt.ip_key, *self.ip_limit)
+        if wait:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, try again later",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+        return attempt
+
+    def succeeded(self, attempt: LoginAttempt):
+        """Give back the tokens of a successful login"""
+        self.backend.give_back(attempt.account_key, *self.account_limit)
+        self.backend.give_back(attempt.ip_key, *self.ip_limit)
+
+login_throttle = LoginThrottle(create_bucket_backend())
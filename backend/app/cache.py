@@ -0,0 +1,174 @@
+# app/cache.py
+"""
+Versioned caches for hot, rarely changing responses.
+
+A cache holds one serialized payload tagged with the version it was built
+at. Writers bump the version after committing, and readers rebuild when the
+version they see is newer than their copy. The version lives in a pluggable
+backend: process memory by default, or Redis when CACHE_BACKEND_URL is set
+so every worker sees every invalidation.
+
+Authenticated principals are cached the same way, many entries per version:
+a write to any user account bumps the version and every worker drops what
+it holds.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+CACHE_BACKEND_URL = os.environ.get("CACHE_BACKEND_URL")
+# Principals kept per worker, and seconds one is trusted before the database is read again
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.environ.get("PRINCIPAL_CACHE_TTL", "300"))
+
+class MemoryVersionBackend:
+    """Versions for a single worker process"""
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> int:
+        return self._versions.get(key, 0)
+
+    def bump(self, key: str) -> int:
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            return self._versions[key]
+
+class RedisVersionBackend:
+    """Versions shared by every worker through Redis (requires the redis package)"""
+
+    def __init__(self, url: str, prefix: str = "pharmacy:cache:"):
+        try:
+            import redis
+        except ImportError as error:
+            raise RuntimeError("CACHE_BACKEND_URL points at Redis but the redis package is not installed") from error
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key: str) -> int:
+        return int(self._client.get(self._prefix + key) or 0)
+
+    def bump(self, key: str) -> int:
+        return self._client.incr(self._prefix + key)
+
+def create_version_backend(url: Optional[str] = CACHE_BACKEND_URL):
+    if not url:
+        return MemoryVersionBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisVersionBackend(url)
+    raise ValueError(f"Unsupported CACHE_BACKEND_URL {url!r}")
+
+class VersionedCache:
+    """One payload plus its strong ETag, rebuilt whenever the shared version moves"""
+
+    def __init__(self, key: str, backend):
+        self.key = key
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._entry = None  # (version, payload, etag)
+        self._lock = threading.Lock()
+
+    def get(self, build: Callable[[], bytes]) -> Tuple[bytes, str]:
+        """The cached (payload, etag), calling build() on a miss"""
+        # Read the version before building: an invalidation that lands while the payload
+        # is being built leaves it tagged with the old version, so the next read rebuilds
+        version = self.backend.get(self.key)
+        entry = self._entry
+        if entry and entry[0] == version:
+            self.hits += 1
+            return entry[1], entry[2]
+        with self._lock:
+            # Another thread may have rebuilt it while this one waited
+            entry = self._entry
+            if entry and entry[0] == version:
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+            payload = build()
+            etag = f'"{hashlib.sha256(payload).hexdigest()}"'
+            self._entry = (version, payload, etag)
+            return payload, etag
+
+    def invalidate(self):
+        """Call after committing a change to the cached data"""
+        self._entry = None
+        self.backend.bump(self.key)
+
+class LRUCache:
+    """
+    Bounded entries with a time to live, dropped wholesale when the shared version moves.
+
+    Callers read version() before loading a value and pass it to put(), so a
+    value loaded across an invalidation is never served.
+    """
+
+    def __init__(self, key: str, backend, maxsize: int, ttl: float):
+        self.key = key
+        self.backend = backend
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (version, expires, value)
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def version(self) -> int:
+        return self.backend.get(self.key)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        version = self.version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any, version: int, ttl: Optional[float] = None):
+        """Store value for at most `ttl` seconds (capped at the cache's own TTL)"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Call after committing a change to the cached data"""
+        with self._lock:
+            self._entries.clear()
+        self.backend.bump(self.key)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses the weak comparison: a W/ prefix on the client's tag is ignored"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+version_backend = create_version_backend()
+
+# Serialized GET /medications/ response. Invalidated by every write that changes a
+# medication or its stock: create, update, delete, import, receipts, fulfillment, reservations
+catalog_cache = VersionedCache("catalog", version_backend)
+
+# Authenticated users by bearer token, for the get_current_* dependencies. Invalidated by
+# every update or deletion of a pharmacist, doctor or patient
+principal_cache = LRUCache("principals", version_backend, PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
@@ -0,0 +1,92 @@
+# app/catalog_import.py
+"""
+Bulk import of a supplier catalog from CSV or NDJSON.
+
+The file is parsed one line at a time and written a chunk at a time, so
+memory use does not grow with the size of the file. Each chunk is upserted
+with a single executemany and committed on its own.
+"""
+import csv
+import json
+from itertools import islice
+from typing import IO, Iterator, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app.crud.medication import upsert_medications
+from app.schemas.medication import MedicationImport
+
+IMPORT_CHUNK_SIZE = 1000
+# Errors listed in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ("csv", "ndjson")
+
+def guess_format(filename: Optional[str]) -> Optional[str]:
+    if filename:
+        extension = filename.rsplit(".", 1)[-1].lower()
+        if extension == "csv":
+            return "csv"
+        if extension in ("ndjson", "jsonl"):
+            return "ndjson"
+    return None
+
+def iter_rows(stream: IO[str], format: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Yield (line number, row, error) for every record of the file; exactly one of row/error is set"""
+    if format == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield validate(reader.line_num, {key: value for key, value in record.items() if value not in ("", None)})
+    elif format == "ndjson":
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as error:
+                yield line_number, None, f"Invalid JSON: {error.msg}"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, "Expected a JSON object"
+                continue
+            yield validate(line_number, record)
+    else:
+        raise ValueError(f"Unknown format {format!r}")
+
+def validate(line_number: int, record: dict):
+    try:
+        return line_number, MedicationImport.model_validate(record).model_dump(), None
+    except ValidationError as error:
+        problems = "; ".join(
+            f"{'.'.join(str(part) for part in problem['loc']) or 'row'}: {problem['msg']}"
+            for problem in error.errors()
+        )
+        return line_number, None, problems
+
+def import_medications(db: Session, stream: IO[str], format: str, chunk_size: int = IMPORT_CHUNK_SIZE) -> dict:
+    """
+    Upsert every medication of a catalog file and report what happened.
+
+    New medications are created with the file's stock_quantity as opening
+    stock; existing ones have their details updated and keep their stock.
+    """
+    report = {"processed": 0, "inserted": 0, "updated": 0, "failed": 0, "errors": []}
+    rows = iter_rows(stream, format)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return report
+        valid = []
+        for line_number, row, error in chunk:
+            report["processed"] += 1
+            if error:
+                report["failed"] += 1
+                if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                    report["errors"].append({"line": line_number, "error": error})
+            else:
+                valid.append(row)
+        if valid:
+            inserted, updated = upsert_medications(db, valid)
+            report["inserted"] += inserted
+            report["updated"] += updated
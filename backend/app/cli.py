@@ -0,0 +1,104 @@
+"""
+Maintenance commands, run from backend/:
+
+    python -m app.cli compact-stock
+    python -m app.cli reconcile-stock [--dry-run]
+    python -m app.cli reorder-report [--only-reorder]
+    python -m app.cli import-medications FILE [--format csv|ndjson]
+"""
+import argparse
+import sys
+
+from app.database import SessionLocal
+# Every mapped class must be imported before the first query configures the mappers
+from app.models import doctor, idempotency_key, medication, patient, pharmacist, prescription, prescription_medication, stock_movement, stock_reservation  # noqa: F401
+from app.crud.stock import compact_stock, reconcile_stock
+from app.forecast import build_reorder_report
+from app.catalog_import import FORMATS, guess_format, import_medications
+
+def compact_stock_command(args) -> int:
+    db = SessionLocal()
+    try:
+        print(f"Compacted {compact_stock(db)} medication(s)")
+    finally:
+        db.close()
+    return 0
+
+def reconcile_stock_command(args) -> int:
+    db = SessionLocal()
+    try:
+        report = reconcile_stock(db, apply=not args.dry_run)
+    finally:
+        db.close()
+    for row in report:
+        print(f"{row['name']} (id {row['medication_id']}): snapshot {row['snapshot']}, "
+              f"ledger {row['ledger']}, drift {row['drift']:+d}")
+    if not report:
+        print("No drift")
+    elif args.dry_run:
+        print(f"{len(report)} medication(s) drifted, nothing changed (--dry-run)")
+        return 1
+    else:
+        print(f"{len(report)} medication(s) drifted, snapshots recomputed from the ledger")
+    return 0
+
+def reorder_report_command(args) -> int:
+    db = SessionLocal()
+    try:
+        report = build_reorder_report(db)
+    finally:
+        db.close()
+    print(f"{'Medication':<30} {'Stock':>7} {'Per day':>8} {'Safety':>7} {'Reorder at':>10} {'Order':>6}")
+    for item in report["items"]:
+        if args.only_reorder and not item["reorder"]:
+            continue
+        print(f"{item['name']:<30} {item['stock_quantity']:>7} {item['forecast_daily_demand']:>8.2f} "
+              f"{item['safety_stock']:>7.1f} {item['reorder_point']:>10} {item['order_quantity']:>6}"
+              f"{'  REORDER' if item['reorder'] else ''}")
+    return 0
+
+def import_medications_command(args) -> int:
+    format = args.format or guess_format(args.file)
+    if not format:
+        print("Cannot tell the file format, pass --format csv or --format ndjson", file=sys.stderr)
+        return 2
+    db = SessionLocal()
+    try:
+        with open(args.file, encoding="utf-8-sig", newline="") as stream:
+            report = import_medications(db, stream, format)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    for error in report["errors"]:
+        print(f"line {error['line']}: {error['error']}", file=sys.stderr)
+    print(f"{report['processed']} rows: {report['inserted']} inserted, "
+          f"{report['updated']} updated, {report['failed']} failed")
+    return 1 if report["failed"] else 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Pharmacy maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compact = commands.add_parser("compact-stock", help="Fold recent stock movements into the snapshots")
+    compact.set_defaults(handler=compact_stock_command)
+
+    reconcile = commands.add_parser("reconcile-stock", help="Recompute stock snapshots from the ledger and report drift")
+    reconcile.add_argument("--dry-run", action="store_true", help="Only report drift; exit with status 1 if any")
+    reconcile.set_defaults(handler=reconcile_stock_command)
+
+    reorder = commands.add_parser("reorder-report", help="Forecast demand and list the medications to reorder")
+    reorder.add_argument("--only-reorder", action="store_true", help="Only list medications below their reorder point")
+    reorder.set_defaults(handler=reorder_report_command)
+
+    importer = commands.add_parser("import-medications", help="Create or update medications from a CSV or NDJSON file")
+    importer.add_argument("file")
+    importer.add_argument("--format", choices=FORMATS, help="Defaults to the file extension")
+    importer.set_defaults(handler=import_medications_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 from app.models.doctor import Doctor
 from app.schemas.doctor import DoctorCreate, DoctorUpdate
 from app.utils import get_password_hash
+from app.cache import principal_cache
 
 def create_doctor(db: Session, doctor: DoctorCreate):
     if get_doctor_by_email(db, doctor.email):
@@ -42,6 +43,8 @@ def update_doctor(db: Session, doctor_id: int, doctor_update: DoctorUpdate):
         setattr(db_doctor, key, value)
     
     db.commit()
+    # Cached principals may hold the old email or active flag
+    principal_cache.invalidate()
     db.refresh(db_doctor)
     return db_doctor
 
@@ -51,4 +54,5 @@ def delete_doctor(db: Session, doctor_id: int):
         return False
     db.delete(db_doctor)
     db.commit()
+    principal_cache.invalidate()
     return True
\ No newline at end of file
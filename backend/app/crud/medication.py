@@ -1,27 +1,57 @@
+from typing import List, Tuple
+from fastapi import HTTPException
+from sqlalchemy import bindparam, exists, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 from app.models.medication import Medication
-from app.schemas.medication import MedicationCreate, MedicationUpdate
+from app.models.prescription import Prescription
+from app.models.prescription_medication import PrescriptionMedication
+from app.models.stock_movement import StockMovement
+from pydantic import TypeAdapter
+from app.schemas.medication import MedicationCreate, MedicationResponse, MedicationUpdate
+from app.crud.stock import adjust_stock_to, record_movement
+from app.cache import catalog_cache
+
+MEDICATION_LIST = TypeAdapter(List[MedicationResponse])
 
 def create_medication(db: Session, medication: MedicationCreate):
-    db_medication = Medication(**medication.model_dump())
+    # Opening stock goes through the ledger like any other change
+    db_medication = Medication(**medication.model_dump(exclude={"stock_quantity"}))
     db.add(db_medication)
+    db.flush()
+    record_movement(db, db_medication.id, "adjust", medication.stock_quantity, note="Opening stock")
     db.commit()
+    catalog_cache.invalidate()
     db.refresh(db_medication)
     return db_medication
 
+def get_catalog_json(db: Session) -> bytes:
+    """The whole catalog serialized as the GET /medications/ response body"""
+    return MEDICATION_LIST.dump_json(db.query(Medication).order_by(Medication.id).all())
+
 def get_medication(db: Session, medication_id: int):
     return db.query(Medication).filter(Medication.id == medication_id).first()
 
 def get_medication_by_name(db: Session, name: str):
     return db.query(Medication).filter(Medication.name == name).first()
 
+def get_medications_by_names(db: Session, names: List[str]) -> List[Medication]:
+    """Medications with any of the given names, from one IN query"""
+    return db.query(Medication).filter(Medication.name.in_(set(names))).all()
+
 def update_medication(db: Session, medication_id: int, medication: MedicationUpdate):
     db_medication = get_medication(db, medication_id)
     if not db_medication:
         return None
-    for key, value in medication.model_dump(exclude_unset=True).items():
+    changes = medication.model_dump(exclude_unset=True)
+    # A new stock level is recorded as an adjustment, never written over the snapshot
+    stock_quantity = changes.pop("stock_quantity", None)
+    for key, value in changes.items():
         setattr(db_medication, key, value)
+    if stock_quantity is not None:
+        adjust_stock_to(db, medication_id, stock_quantity, note="Manual stock update")
     db.commit()
+    catalog_cache.invalidate()
     db.refresh(db_medication)
     return db_medication
 
@@ -29,6 +59,69 @@ def delete_medication(db: Session, medication_id: int):
     db_medication = get_medication(db, medication_id)
     if not db_medication:
         return False
+    # Pending prescriptions would lose the line they still have to dispense
+    pending = db.query(exists().where(
+        PrescriptionMedication.medication_id == medication_id,
+        PrescriptionMedication.prescription_id == Prescription.id,
+        Prescription.status == "pending"
+    )).scalar()
+    if pending:
+        raise HTTPException(status_code=409, detail="Medication is on pending prescriptions and cannot be deleted")
     db.delete(db_medication)
     db.commit()
-    return True
\ No newline at end of file
+    catalog_cache.invalidate()
+    return True
+
+# Columns an import overwrites on existing medications; stock only changes through the ledger
+UPSERT_COLUMNS = ("description", "dosage_form", "strength", "price")
+
+def upsert_medications(db: Session, rows: List[dict]) -> Tuple[int, int]:
+    """
+    Insert or update a chunk of medications by name with one executemany
+    INSERT ... ON CONFLICT (name) DO UPDATE, then commit.
+
+    New medications get an opening stock movement for their stock_quantity.
+    Returns (inserted, updated). Later rows win when a name repeats. Raises
+    ValueError on databases other than PostgreSQL and SQLite.
+    """
+    rows = list({row["name"]: row for row in rows}.values())
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        statement = postgresql.insert(Medication.__table__)
+    elif dialect == "sqlite":
+        statement = sqlite.insert(Medication.__table__)
+    else:
+        raise ValueError(f"Bulk import is not supported on {dialect} databases")
+    statement = statement.on_conflict_do_update(
+        index_elements=["name"],
+        set_={column: statement.excluded[column] for column in UPSERT_COLUMNS}
+    )
+
+    try:
+        existing = set(db.execute(
+            select(Medication.name).where(Medication.name.in_([row["name"] for row in rows]))
+        ).scalars())
+        db.execute(statement, [
+            {"name": row["name"], **{column: row.get(column) for column in UPSERT_COLUMNS}}
+            for row in rows
+        ])
+        openings = [
+            {"medication_name": row["name"], "opening_stock": row["stock_quantity"]}
+            for row in rows if row["name"] not in existing and row.get("stock_quantity")
+        ]
+        if openings:
+            db.execute(
+                insert(StockMovement.__table__).from_select(
+                    ["medication_id", "kind", "quantity", "note"],
+                    select(
+                        Medication.id, literal("adjust"), bindparam("opening_stock"), literal("Opening stock")
+                    ).where(Medication.name == bindparam("medication_name"))
+                ),
+                openings
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    catalog_cache.invalidate()
+    return len(rows) - len(existing), len(existing)
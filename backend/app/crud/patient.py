@@ -3,6 +3,7 @@ from fastapi import HTTPException
 from app.models.patient import Patient
 from app.schemas.patient import PatientCreate, PatientUpdate
 from app.utils import get_password_hash
+from app.cache import principal_cache
 
 def create_patient(db: Session, patient: PatientCreate):
     if get_patient_by_email(db, patient.email):
@@ -42,6 +43,8 @@ def update_patient(db: Session, ssn: str, patient: PatientUpdate):
     for key, value in update_data.items():
         setattr(db_patient, key, value)
     db.commit()
+    # Cached principals may hold the old email or active flag
+    principal_cache.invalidate()
     db.refresh(db_patient)
     return db_patient
 
@@ -51,4 +54,5 @@ def delete_patient(db: Session, ssn: str):
         return False
     db.delete(db_patient)
     db.commit()
+    principal_cache.invalidate()
     return True
\ No newline at end of file
@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 from app.models.pharmacist import Pharmacist
 from app.schemas.pharmacist import PharmacistCreate, PharmacistUpdate
 from app.utils import get_password_hash
+from app.cache import principal_cache
 
 def create_pharmacist(db: Session, pharmacist: PharmacistCreate):
     if get_pharmacist_by_email(db, pharmacist.email):
@@ -42,6 +43,8 @@ def update_pharmacist(db: Session, pharmacist_id: int, pharmacist_update: Pharma
         setattr(db_pharmacist, key, value)
     
     db.commit()
+    # Cached principals may hold the old email or active flag
+    principal_cache.invalidate()
     db.refresh(db_pharmacist)
     return db_pharmacist
 
@@ -51,4 +54,5 @@ def delete_pharmacist(db: Session, pharmacist_id: int):
         return False
     db.delete(db_pharmacist)
     db.commit()
+    principal_cache.invalidate()
     return True
\ No newline at end of file
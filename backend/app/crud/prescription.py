@@ -1,14 +1,27 @@
+from sqlalchemy import Select, case, delete, exists, func, insert, literal, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.models.prescription_medication import PrescriptionMedication
 from app.models.prescription import Prescription 
 from app.models.patient import Patient
 from app.models.doctor import Doctor
 from app.models.medication import Medication
+from app.models.stock_movement import StockMovement
+from app.models.stock_reservation import StockReservation
+from app.crud.stock import STOCK_RESERVATION_TTL
 from app.schemas.prescription import PrescriptionCreate, PrescriptionUpdate
+from app.dispensing import dispensing_quantities
+from app.idempotency import TransientHTTPException
+from app.utils import utcnow
+from app.cache import LRUCache, MemoryVersionBackend, catalog_cache
 from fastapi import HTTPException
-from datetime import date
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+import base64
 
 def create_prescription(db: Session, prescription: PrescriptionCreate):
+    """Validate, then write the prescription, its lines and any stock holds in one transaction"""
     # Validate patient exists
     patient = db.query(Patient).filter(Patient.ssn == prescription.patient_ssn).first()
     if not patient:
@@ -19,6 +32,9 @@ def create_prescription(db: Session, prescription: PrescriptionCreate):
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
 
+    # Every medication is resolved up front, with one query
+    medication_ids = resolve_medication_ids(db, [med.medication_name for med in prescription.medications])
+
     # Create prescription
     db_prescription = Prescription(
         patient_ssn=prescription.patient_ssn,
@@ -26,48 +42,538 @@ def create_prescription(db: Session, prescription: PrescriptionCreate):
         date_issued=date.today(),
         status="pending"
     )
-    db.add(db_prescription)
-    db.commit()
-    db.refresh(db_prescription)
-
-    # Add medications to prescription
-    for med in prescription.medications:
-        # Validate medication exists
-        medication = db.query(Medication).filter(Medication.name == med.medication_name).first()
-        if not medication:
-            raise HTTPException(status_code=404, detail=f"Medication {med.medication_name} not found")
-
-        # Create prescription-medication link
-        db_med = PrescriptionMedication(
-            prescription_id=db_prescription.id,
-            medication_name=med.medication_name,
-            dosage=med.dosage,
-            frequency=med.frequency,
-            duration=med.duration
-        )
-        db.add(db_med)
-    
-    db.commit()
+    try:
+        db.add(db_prescription)
+        db.flush()
+        # Add medications to prescription, as one executemany
+        lines = prescription_line_rows(prescription.medications, medication_ids, db_prescription.id)
+        if lines:
+            db.execute(insert(PrescriptionMedication), lines)
+        if prescription.reserve_stock:
+            # Nothing is kept when the stock cannot be held
+            reserve_prescription_stock(db, db_prescription.id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    if prescription.reserve_stock:
+        catalog_cache.invalidate()
     return db_prescription
 
+def create_prescriptions(
+    db: Session,
+    prescriptions: List[PrescriptionCreate],
+    all_or_nothing: bool = False,
+    doctor_license: Optional[str] = None
+) -> dict:
+    """
+    Create many prescriptions with a fixed number of queries and one commit.
+
+    Patients, doctors and medications are each validated by one IN query,
+    then headers and lines are inserted with executemany. Only stock holds
+    are written per prescription. Every result reports whether its
+    prescription was created and why not. With a doctor_license, only that
+    doctor's prescriptions are accepted.
+    """
+    patients = set(db.scalars(
+        select(Patient.ssn).where(Patient.ssn.in_({prescription.patient_ssn for prescription in prescriptions}))
+    ))
+    doctors = set(db.scalars(
+        select(Doctor.license_number)
+        .where(Doctor.license_number.in_({prescription.doctor_license for prescription in prescriptions}))
+    ))
+    medication_ids = dict(db.execute(
+        select(Medication.name, Medication.id).where(Medication.name.in_(
+            {med.medication_name for prescription in prescriptions for med in prescription.medications}
+        ))
+    ).all())
+
+    failures = {}
+    for index, prescription in enumerate(prescriptions):
+        unknown = [med.medication_name for med in prescription.medications if med.medication_name not in medication_ids]
+        if doctor_license is not None and prescription.doctor_license != doctor_license:
+            failures[index] = "You can only create prescriptions with your own license number"
+        elif prescription.patient_ssn not in patients:
+            failures[index] = "Patient not found"
+        elif prescription.doctor_license not in doctors:
+            failures[index] = "Doctor not found"
+        elif unknown:
+            failures[index] = f"Medication {unknown[0]} not found"
+
+    created = {}
+    reserved = False
+    committed = not (failures and all_or_nothing)
+    valid = [index for index in range(len(prescriptions)) if index not in failures]
+    if committed and valid:
+        try:
+            today = date.today()
+            # Batched on PostgreSQL; SQLite cannot order the RETURNING rows of a batch, so there
+            # the headers go one statement each (in process, without a network round trip)
+            prescription_ids = db.scalars(
+                insert(Prescription).returning(Prescription.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "patient_ssn": prescriptions[index].patient_ssn,
+                        "doctor_license": prescriptions[index].doctor_license,
+                        "date_issued": today,
+                        "status": "pending",
+                    }
+                    for index in valid
+                ]
+            ).all()
+            created = dict(zip(valid, prescription_ids))
+            lines = [
+                line
+                for index in valid
+                for line in prescription_line_rows(prescriptions[index].medications, medication_ids, created[index])
+            ]
+            if lines:
+                db.execute(insert(PrescriptionMedication), lines)
+
+            for index in valid:
+                if not prescriptions[index].reserve_stock:
+                    continue
+                prescription_id = created[index]
+                try:
+                    reserve_prescription_stock(db, prescription_id)
+                    reserved = True
+                except HTTPException as error:
+                    # Undo this prescription only: the holds it got, its lines and itself
+                    failures[index] = error.detail
+                    del created[index]
+                    db.execute(delete(StockReservation).where(StockReservation.prescription_id == prescription_id))
+                    db.execute(delete(PrescriptionMedication).where(PrescriptionMedication.prescription_id == prescription_id))
+                    db.execute(delete(Prescription).where(Prescription.id == prescription_id))
+
+            if failures and all_or_nothing:
+                committed = False
+                created = {}
+                db.rollback()
+            else:
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    if committed and reserved:
+        catalog_cache.invalidate()
+
+    results = []
+    for index in range(len(prescriptions)):
+        detail = failures.get(index)
+        if not committed and not detail:
+            detail = "Rolled back: another prescription in the batch failed"
+        results.append({"index": index, "created": index in created, "prescription_id": created.get(index), "detail": detail})
+    return {"committed": committed, "created": len(created), "results": results}
+
+def prescription_line_rows(medications, medication_ids: dict, prescription_id: Optional[int] = None) -> List[dict]:
+    """PrescriptionMedication column values for the given lines, quantities parsed"""
+    rows = []
+    for med in medications:
+        row = {
+            "medication_id": medication_ids[med.medication_name],
+            "medication_name": med.medication_name,
+            "dosage": med.dosage,
+            "frequency": med.frequency,
+            "duration": med.duration,
+            **dispensing_quantities(med.dosage, med.frequency, med.duration)
+        }
+        if prescription_id is not None:
+            row["prescription_id"] = prescription_id
+        rows.append(row)
+    return rows
+
+def resolve_medication_ids(db: Session, names: List[str]) -> dict:
+    """Medication ids by name, from one IN query; 404 naming the first unknown medication"""
+    medication_ids = dict(db.query(Medication.name, Medication.id).filter(Medication.name.in_(set(names))).all())
+    for name in names:
+        if name not in medication_ids:
+            raise HTTPException(status_code=404, detail=f"Medication {name} not found")
+    return medication_ids
+
 def get_prescription(db: Session, prescription_id: int):
     return db.query(Prescription).filter(Prescription.id == prescription_id).first()
 
-def fulfill_prescription(db: Session, prescription_id: int):
-    prescription = get_prescription(db, prescription_id)
-    if not prescription:
-        raise HTTPException(status_code=404, detail="Prescription not found")
-    
-    # Deduct medication stock and mark as fulfilled
-    for med in prescription.medications:
-        medication = db.query(Medication).filter(Medication.name == med.medication_name).first()
-        if medication.stock_quantity <= 0:
-            raise HTTPException(status_code=400, detail=f"{med.medication_name} out of stock")
-        medication.stock_quantity -= 1
-    
-    prescription.status = "fulfilled"
-    db.commit()
-    return prescription
+# Default and longest work-queue lease, in seconds
+PRESCRIPTION_LEASE_SECONDS = 300
+MAX_PRESCRIPTION_LEASE_SECONDS = 3600
+
+def lease_expired(now: Optional[datetime] = None):
+    """Condition on Prescription: no live lease. Leases expire on their own, so a crashed client never strands work"""
+    now = now or utcnow()
+    return or_(Prescription.lease_expires_at.is_(None), Prescription.lease_expires_at <= now)
+
+def lease_available(pharmacist_license: Optional[str]):
+    """Condition on Prescription: nobody but this pharmacist holds a live lease. Without a pharmacist the lease is ignored"""
+    if pharmacist_license is None:
+        return literal(True)
+    return or_(lease_expired(), Prescription.claimed_by == pharmacist_license)
+
+def queue_order() -> list:
+    """
+    Work-queue priority: prescriptions that can be dispensed first (they
+    hold a reservation, or every line fits in the free stock), then oldest
+    first.
+    """
+    holds_stock = exists().where(
+        StockReservation.prescription_id == Prescription.id,
+        StockReservation.status == "active"
+    )
+    line_short = exists().where(
+        PrescriptionMedication.prescription_id == Prescription.id,
+        ~exists().where(
+            Medication.id == PrescriptionMedication.medication_id,
+            Medication.available_quantity >= func.coalesce(PrescriptionMedication.quantity, 1)
+        )
+    )
+    return [case((~holds_stock & line_short, 1), else_=0), Prescription.date_issued, Prescription.id]
+
+async def claim_prescriptions(db: AsyncSession, pharmacist_license: str, limit: int, lease_seconds: int) -> List[dict]:
+    """
+    Lease the next `limit` pending prescriptions to a pharmacist.
+
+    One UPDATE claims them: on PostgreSQL the candidates are selected with
+    FOR UPDATE SKIP LOCKED, so concurrent claims never wait on or return the
+    same rows; SQLite runs the statement under its single write lock.
+    """
+    now = utcnow()
+    candidates = (
+        select(Prescription.id)
+        .where(Prescription.status == "pending", lease_expired(now))
+        .order_by(*queue_order())
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    try:
+        claimed = (await db.execute(
+            update(Prescription)
+            .where(Prescription.id.in_(candidates))
+            .values(claimed_by=pharmacist_license, lease_expires_at=now + timedelta(seconds=lease_seconds))
+            .returning(Prescription.id)
+            .execution_options(synchronize_session=False)
+        )).scalars().all()
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    if not claimed:
+        return []
+    results = (await db.execute(
+        build_prescription_query().where(Prescription.id.in_(claimed)).order_by(*queue_order())
+    )).all()
+    return await serialize_prescriptions(db, results)
+
+async def release_prescriptions(db: AsyncSession, pharmacist_license: str, prescription_ids: List[int]) -> int:
+    """Hand leased prescriptions back to the queue; returns how many were released"""
+    try:
+        released = (await db.execute(
+            update(Prescription)
+            .where(Prescription.id.in_(prescription_ids), Prescription.claimed_by == pharmacist_license)
+            .values(claimed_by=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )).rowcount
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return released
+
+def reserved_for(prescription_id: int):
+    """Units of the correlated medication held by this prescription's active reservations"""
+    return func.coalesce(
+        select(func.sum(StockReservation.quantity)).where(
+            StockReservation.medication_id == Medication.id,
+            StockReservation.prescription_id == prescription_id,
+            StockReservation.status == "active"
+        ).correlate_except(StockReservation).scalar_subquery(),
+        0
+    )
+
+def dispensable_quantity(prescription_id: int):
+    """What a prescription may take of the correlated medication: the free stock plus its own holds"""
+    return Medication.available_quantity + reserved_for(prescription_id)
+
+def reserve_prescription_stock(db: Session, prescription_id: int, ttl_seconds: int = STOCK_RESERVATION_TTL):
+    """
+    Hold the stock a prescription needs until it is fulfilled or the hold expires.
+
+    Same pattern as fulfillment: lock the medications in id order, then one
+    conditional INSERT that only writes the lines with enough free stock.
+    Raises a 400 naming the medications that are short. The caller commits,
+    or rolls back on error.
+    """
+    needed = units_needed_query(prescription_id).subquery()
+    db.execute(
+        select(Medication.id)
+        .where(Medication.id.in_(select(needed.c.medication_id)))
+        .order_by(Medication.id)
+        .with_for_update()
+    )
+    held = db.execute(
+        insert(StockReservation).from_select(
+            ["medication_id", "prescription_id", "quantity", "status", "expires_at"],
+            select(
+                Medication.id,
+                literal(prescription_id),
+                needed.c.quantity,
+                literal("active"),
+                literal(utcnow() + timedelta(seconds=ttl_seconds))
+            )
+            .join(needed, needed.c.medication_id == Medication.id)
+            .where(Medication.available_quantity >= needed.c.quantity)
+        )
+    ).rowcount
+    expected = db.execute(select(func.count()).select_from(needed)).scalar_one()
+    if held != expected:
+        short = db.execute(
+            short_medications_query(prescription_id, needed, Medication.available_quantity)
+        ).scalars().all()
+        raise TransientHTTPException(status_code=400, detail=f"{', '.join(short) or 'Stock'} not available to reserve")
+
+def units_needed_query(prescription_id: int):
+    """Units of each medication a prescription dispenses, one row per medication"""
+    # Lines written before quantities were parsed count as one unit, as they always did
+    return select(
+        PrescriptionMedication.medication_id,
+        func.sum(func.coalesce(PrescriptionMedication.quantity, 1)).label("quantity")
+    ).where(
+        PrescriptionMedication.prescription_id == prescription_id
+    ).group_by(PrescriptionMedication.medication_id)
+
+def short_medications_query(prescription_id: int, needed, usable):
+    """Names, as prescribed, of the lines whose medication is gone or has less than `usable` units (error path only)"""
+    return select(PrescriptionMedication.medication_name).distinct().outerjoin(
+        Medication, Medication.id == PrescriptionMedication.medication_id
+    ).outerjoin(
+        needed, needed.c.medication_id == PrescriptionMedication.medication_id
+    ).where(
+        PrescriptionMedication.prescription_id == prescription_id,
+        or_(Medication.id.is_(None), usable < needed.c.quantity)
+    ).order_by(PrescriptionMedication.medication_name)
+
+def fulfill_prescription(db: Session, prescription_id: int, pharmacist_license: Optional[str] = None):
+    """
+    Dispense a pending prescription in one transaction.
+
+    The status flip is a conditional UPDATE and the stock deduction a
+    conditional INSERT into the stock ledger, so two pharmacists fulfilling at once can neither dispense the same
+    prescription twice nor take stock below zero. Any shortfall rolls back
+    the whole fulfillment.
+
+    With a pharmacist_license, a prescription leased to another pharmacist is
+    refused; fulfilling releases the lease.
+    """
+    try:
+        # Claim the prescription first: this takes the write lock on SQLite before anything is read
+        claimed = db.execute(
+            update(Prescription)
+            .where(
+                Prescription.id == prescription_id,
+                Prescription.status == "pending",
+                lease_available(pharmacist_license)
+            )
+            .values(status="fulfilled", claimed_by=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not claimed:
+            prescription = get_prescription(db, prescription_id)
+            if not prescription:
+                raise HTTPException(status_code=404, detail="Prescription not found")
+            if prescription.status == "pending":
+                raise HTTPException(status_code=409, detail="Prescription is claimed by another pharmacist")
+            raise HTTPException(status_code=400, detail=f"Prescription is already {prescription.status}")
+
+        needed = units_needed_query(prescription_id).subquery()
+        # Lock the rows in a stable order so concurrent multi-line fulfillments cannot deadlock
+        # (no-op on SQLite, where the claim above already serialises writers)
+        db.execute(
+            select(Medication.id)
+            .where(Medication.id.in_(select(needed.c.medication_id)))
+            .order_by(Medication.id)
+            .with_for_update()
+        )
+
+        # Stock is deducted by appending dispense movements, one per medication that has enough
+        deducted = db.execute(
+            insert(StockMovement).from_select(
+                ["medication_id", "kind", "quantity", "prescription_id"],
+                select(Medication.id, literal("dispense"), -needed.c.quantity, literal(prescription_id))
+                .join(needed, needed.c.medication_id == Medication.id)
+                # Stock reserved by other prescriptions is off limits
+                .where(dispensable_quantity(prescription_id) >= needed.c.quantity)
+            )
+        ).rowcount
+        expected = db.execute(select(func.count()).select_from(needed)).scalar_one()
+
+        if deducted != expected:
+            db.rollback()
+            short = db.execute(
+                short_medications_query(prescription_id, needed, dispensable_quantity(prescription_id))
+            ).scalars().all()
+            detail = f"{', '.join(short)} out of stock" if short else "Insufficient stock"
+            raise TransientHTTPException(status_code=400, detail=detail)
+
+        # The holds became dispense movements
+        db.execute(
+            update(StockReservation)
+            .where(StockReservation.prescription_id == prescription_id, StockReservation.status == "active")
+            .values(status="consumed")
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    catalog_cache.invalidate()
+    return get_prescription(db, prescription_id)
+
+def fulfill_prescriptions(
+    db: Session,
+    prescription_ids: List[int],
+    all_or_nothing: bool = False,
+    pharmacist_license: Optional[str] = None
+) -> dict:
+    """
+    Dispense many prescriptions with a fixed number of queries and one commit.
+
+    Every result reports whether its prescription was fulfilled and why not.
+    Best effort commits the prescriptions that could be dispensed; with
+    all_or_nothing a single failure rolls the whole batch back.
+    """
+    prescription_ids = list(dict.fromkeys(prescription_ids))
+    failures = {}
+    try:
+        # Claim every pending prescription at once, which also takes the SQLite write lock.
+        # Leases stay in place until the outcome is known, so failures keep theirs
+        claimed = set(db.execute(
+            update(Prescription)
+            .where(
+                Prescription.id.in_(prescription_ids),
+                Prescription.status == "pending",
+                lease_available(pharmacist_license)
+            )
+            .values(status="fulfilled")
+            .returning(Prescription.id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+
+        unclaimed = [prescription_id for prescription_id in prescription_ids if prescription_id not in claimed]
+        if unclaimed:
+            statuses = dict(db.execute(
+                select(Prescription.id, Prescription.status).where(Prescription.id.in_(unclaimed))
+            ).all())
+            for prescription_id in unclaimed:
+                if prescription_id not in statuses:
+                    failures[prescription_id] = "Prescription not found"
+                elif statuses[prescription_id] == "pending":
+                    failures[prescription_id] = "Prescription is claimed by another pharmacist"
+                else:
+                    failures[prescription_id] = f"Prescription is already {statuses[prescription_id]}"
+
+        # Units needed per prescription and medication, with what the prescription already holds
+        own_hold = select(func.sum(StockReservation.quantity)).where(
+            StockReservation.prescription_id == PrescriptionMedication.prescription_id,
+            StockReservation.medication_id == PrescriptionMedication.medication_id,
+            StockReservation.status == "active"
+        ).scalar_subquery()
+        needed = defaultdict(dict)
+        held = defaultdict(dict)
+        for row in db.execute(
+            select(
+                PrescriptionMedication.prescription_id,
+                PrescriptionMedication.medication_id,
+                func.sum(func.coalesce(PrescriptionMedication.quantity, 1)).label("quantity"),
+                func.coalesce(own_hold, 0).label("held")
+            ).where(
+                PrescriptionMedication.prescription_id.in_(claimed)
+            ).group_by(PrescriptionMedication.prescription_id, PrescriptionMedication.medication_id)
+        ):
+            needed[row.prescription_id][row.medication_id] = row.quantity
+            held[row.prescription_id][row.medication_id] = row.held
+
+        # Every medication the batch touches, locked in id order like a single fulfillment. Stock is
+        # read by a second statement so it sees movements committed while the lock was awaited
+        medication_ids = {medication_id for lines in needed.values() for medication_id in lines}
+        db.execute(select(Medication.id).where(Medication.id.in_(medication_ids)).order_by(Medication.id).with_for_update())
+        medications = db.execute(
+            select(Medication.id, Medication.name, Medication.available_quantity).where(Medication.id.in_(medication_ids))
+        ).all()
+        names = {row.id: row.name for row in medications}
+        available = {row.id: row.available_quantity for row in medications}
+
+        # Stock is handed out in request order, so earlier prescriptions win a shortfall.
+        # Each prescription can also take what it reserved, and nothing reserved by the others
+        movements = []
+        consumed = []
+        for prescription_id in prescription_ids:
+            if prescription_id not in claimed:
+                continue
+            lines = needed[prescription_id]
+            holds = held[prescription_id]
+            short = sorted(
+                names.get(medication_id, "Unknown medication") for medication_id, quantity in lines.items()
+                if medication_id not in available or available[medication_id] + holds[medication_id] < quantity
+            )
+            if short:
+                failures[prescription_id] = f"{', '.join(short)} out of stock"
+                continue
+            if any(holds.values()):
+                consumed.append(prescription_id)
+            for medication_id, quantity in lines.items():
+                available[medication_id] -= quantity - holds[medication_id]
+                movements.append({
+                    "medication_id": medication_id,
+                    "kind": "dispense",
+                    "quantity": -quantity,
+                    "prescription_id": prescription_id,
+                })
+
+        committed = not (failures and all_or_nothing)
+        if committed:
+            if claimed:
+                # Failures go back to the queue under the lease they held; dispensed ones drop it
+                released = Prescription.id.in_([prescription_id for prescription_id in claimed if prescription_id in failures])
+                db.execute(
+                    update(Prescription)
+                    .where(Prescription.id.in_(claimed))
+                    .values(
+                        status=case((released, "pending"), else_="fulfilled"),
+                        claimed_by=case((released, Prescription.claimed_by), else_=None),
+                        lease_expires_at=case((released, Prescription.lease_expires_at), else_=None)
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+            if movements:
+                db.execute(insert(StockMovement), movements)
+            if consumed:
+                db.execute(
+                    update(StockReservation)
+                    .where(StockReservation.prescription_id.in_(consumed), StockReservation.status == "active")
+                    .values(status="consumed")
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+            if movements:
+                catalog_cache.invalidate()
+        else:
+            db.rollback()
+    except Exception:
+        db.rollback()
+        raise
+
+    results = []
+    for prescription_id in prescription_ids:
+        detail = failures.get(prescription_id)
+        if not committed and not detail:
+            detail = "Rolled back: another prescription in the batch failed"
+        results.append({"prescription_id": prescription_id, "fulfilled": detail is None, "detail": detail})
+    return {
+        "committed": committed,
+        "fulfilled": sum(result["fulfilled"] for result in results),
+        "results": results,
+    }
 
 def update_prescription(db: Session, prescription_id: int, prescription_update: PrescriptionUpdate):
     prescription = get_prescription(db, prescription_id)
@@ -84,134 +590,219 @@ def update_prescription(db: Session, prescription_id: int, prescription_update:
     
     # Update medications if provided
     if prescription_update.medications is not None:
-        # Remove existing medication links
-        db.query(PrescriptionMedication).filter(
-            PrescriptionMedication.prescription_id == prescription.id
-        ).delete()
-        
-        # Add new medications
-        for med in prescription_update.medications:
-            # Validate medication exists
-            medication = db.query(Medication).filter(Medication.name == med.medication_name).first()
-            if not medication:
-                raise HTTPException(status_code=404, detail=f"Medication {med.medication_name} not found")
-
-            # Create prescription-medication link
-            db_med = PrescriptionMedication(
-                prescription_id=prescription.id,
-                medication_name=med.medication_name,
-                dosage=med.dosage,
-                frequency=med.frequency,
-                duration=med.duration
+        try:
+            # Remove existing medication links
+            db.query(PrescriptionMedication).filter(
+                PrescriptionMedication.prescription_id == prescription.id
+            ).delete()
+            # Stock held for the old lines goes back to the shelf
+            reserved = db.query(StockReservation).filter(
+                StockReservation.prescription_id == prescription.id,
+                StockReservation.status == "active"
+            ).update({"status": "released"}, synchronize_session=False)
+            
+            # Add new medications, resolved with one query
+            medication_ids = resolve_medication_ids(db, [med.medication_name for med in prescription_update.medications])
+            db.add_all(
+                PrescriptionMedication(**line)
+                for line in prescription_line_rows(prescription_update.medications, medication_ids, prescription.id)
             )
-            db.add(db_med)
+            if reserved:
+                # A reserved prescription keeps its hold, now for the new lines; a shortfall undoes the whole edit
+                db.flush()
+                reserve_prescription_stock(db, prescription.id)
+        except Exception:
+            db.rollback()
+            raise
     
     db.commit()
+    if prescription_update.medications is not None:
+        # Its stock holds changed
+        catalog_cache.invalidate()
     db.refresh(prescription)
     return prescription
 
-def get_doctor_prescriptions(db: Session, doctor_license: str):
-    """Get all prescriptions written by a specific doctor"""
-    # Return prescription objects with patient and doctor names via join
-    results = db.query(
-        Prescription, 
-        Patient.name.label("patient_name"), 
+def build_prescription_query(
+    patient_ssn: Optional[str] = None,
+    doctor_license: Optional[str] = None,
+    status: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> Select:
+    """Prescriptions joined with patient and doctor names, with optional filters"""
+    query = select(
+        Prescription,
+        Patient.name.label("patient_name"),
         Doctor.name.label("doctor_name")
     ).join(
         Patient, Prescription.patient_ssn == Patient.ssn
     ).join(
         Doctor, Prescription.doctor_license == Doctor.license_number
-    ).filter(
-        Prescription.doctor_license == doctor_license
-    ).all()
-    
-    # Process results to include names in the response
-    prescriptions = []
-    for result in results:
-        prescription, patient_name, doctor_name = result
-        
-        # Load medications for the prescription with medication name
-        medications_data = db.query(PrescriptionMedication).filter(
-            PrescriptionMedication.prescription_id == prescription.id
-        ).all()
-        
-        # Create the formatted medications list with complete information
-        medications = []
-        for med in medications_data:
-            medications.append({
+    )
+
+    if patient_ssn:
+        query = query.where(Prescription.patient_ssn == patient_ssn)
+    if doctor_license:
+        query = query.where(Prescription.doctor_license == doctor_license)
+    if status:
+        query = query.where(Prescription.status == status)
+    if start_date:
+        query = query.where(Prescription.date_issued >= start_date)
+    if end_date:
+        query = query.where(Prescription.date_issued <= end_date)
+
+    return query
+
+# How long an estimated total for /prescriptions/all stays cached, per filter combination,
+# and how many combinations are kept; estimates need no invalidation, so each worker keeps its own
+PRESCRIPTION_COUNT_CACHE_SECONDS = 60
+PRESCRIPTION_COUNT_CACHE_SIZE = 1000
+prescription_count_cache = LRUCache(
+    "prescription_counts", MemoryVersionBackend(), PRESCRIPTION_COUNT_CACHE_SIZE, PRESCRIPTION_COUNT_CACHE_SECONDS
+)
+
+def encode_prescription_cursor(date_issued: date, prescription_id: int) -> str:
+    """Opaque keyset cursor pointing just after the given (date_issued, id) position"""
+    raw = f"{date_issued.isoformat()}|{prescription_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_prescription_cursor(cursor: str):
+    """Inverse of encode_prescription_cursor, raises ValueError on a malformed cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date_part, id_part = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return date.fromisoformat(date_part), int(id_part)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def paginate_prescription_query(query: Select, limit: int, cursor: Optional[str] = None, skip: int = 0) -> Select:
+    """
+    Order newest first by (date_issued, id) and restrict to one page.
+
+    With a cursor the page starts right after the cursor position (keyset
+    pagination), otherwise the legacy offset is used. One extra row is
+    fetched so split_prescription_page can tell whether a next page exists
+    without a COUNT.
+    """
+    query = query.order_by(Prescription.date_issued.desc(), Prescription.id.desc())
+    if cursor:
+        last_date, last_id = decode_prescription_cursor(cursor)
+        query = query.where(tuple_(Prescription.date_issued, Prescription.id) < (last_date, last_id))
+    elif skip:
+        query = query.offset(skip)
+    return query.limit(limit + 1)
+
+def split_prescription_page(results, limit: int):
+    """Rows of a paginated query and the cursor of the next page, or None on the last page"""
+    results = list(results)
+    if len(results) <= limit:
+        return results, None
+    results = results[:limit]
+    last = results[-1][0]
+    return results, encode_prescription_cursor(last.date_issued, last.id)
+
+async def count_prescriptions(db: AsyncSession, query: Select, cache_key=None) -> int:
+    """
+    Count the rows matched by a prescription query.
+
+    With a cache_key the count is an estimate served from a short-lived cache,
+    so repeated page loads with the same filters do not rescan the join.
+    """
+    count_query = select(func.count()).select_from(query.order_by(None).subquery())
+    if cache_key is None:
+        return (await db.execute(count_query)).scalar_one()
+
+    cached = prescription_count_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    version = prescription_count_cache.version()
+    total = (await db.execute(count_query)).scalar_one()
+    prescription_count_cache.put(cache_key, total, version)
+    return total
+
+def serialize_prescription(prescription: Prescription, patient_name, doctor_name, medications) -> dict:
+    """Project a prescription row and its medication lines into the PrescriptionResponse shape"""
+    return {
+        "id": prescription.id,
+        "patient_ssn": prescription.patient_ssn,
+        "doctor_license": prescription.doctor_license,
+        "date_issued": prescription.date_issued,
+        "status": prescription.status,
+        "medications": [
+            {
                 "id": med.id,
                 "prescription_id": med.prescription_id,
+                "medication_id": med.medication_id,
                 "medication_name": med.medication_name,
                 "dosage": med.dosage,
                 "frequency": med.frequency,
-                "duration": med.duration
-            })
-        
-        # Create a dictionary representation of the prescription with names
-        prescription_dict = {
-            "id": prescription.id,
-            "patient_ssn": prescription.patient_ssn,
-            "doctor_license": prescription.doctor_license,
-            "date_issued": prescription.date_issued,
-            "status": prescription.status,
-            "medications": medications,
-            "patient_name": patient_name,
-            "doctor_name": doctor_name
-        }
-        
-        prescriptions.append(prescription_dict)
-    
-    return prescriptions
+                "duration": med.duration,
+                "units_per_dose": med.units_per_dose,
+                "doses_per_day": med.doses_per_day,
+                "days": med.days,
+                "quantity": med.quantity
+            }
+            for med in medications
+        ],
+        "patient_name": patient_name,
+        "doctor_name": doctor_name,
+        "claimed_by": prescription.claimed_by,
+        "lease_expires_at": prescription.lease_expires_at
+    }
+
+def prescription_lines_query(prescription_ids) -> Select:
+    """Medication lines of many prescriptions in one IN query"""
+    return select(PrescriptionMedication).where(
+        PrescriptionMedication.prescription_id.in_(prescription_ids)
+    ).order_by(PrescriptionMedication.id)
+
+async def serialize_prescriptions(db: AsyncSession, results) -> List[dict]:
+    """
+    Project (prescription, patient_name, doctor_name) rows into response dicts.
+
+    The medication lines of every row are fetched with one IN query, so a page
+    costs the same number of round trips whatever its size.
+    """
+    results = list(results)
+    prescription_ids = [prescription.id for prescription, _, _ in results]
+
+    lines_by_prescription = defaultdict(list)
+    if prescription_ids:
+        lines = (await db.execute(prescription_lines_query(prescription_ids))).scalars()
+        for line in lines:
+            lines_by_prescription[line.prescription_id].append(line)
+
+    return [
+        serialize_prescription(prescription, patient_name, doctor_name, lines_by_prescription[prescription.id])
+        for prescription, patient_name, doctor_name in results
+    ]
+
+async def get_prescriptions_details(db: AsyncSession, prescription_ids: List[int]) -> List[dict]:
+    """Many prescriptions with patient/doctor names and medication lines, in two queries whatever their number"""
+    results = (await db.execute(
+        build_prescription_query().where(Prescription.id.in_(prescription_ids))
+    )).all()
+    return await serialize_prescriptions(db, results)
 
-def get_patient_prescriptions(db: Session, patient_ssn: str):
+async def get_prescription_details(db: AsyncSession, prescription_id: int):
+    """Get one prescription with patient/doctor names and medication lines, or None"""
+    details = await get_prescriptions_details(db, [prescription_id])
+    return details[0] if details else None
+
+async def get_doctor_prescriptions(db: AsyncSession, doctor_license: str):
+    """Get all prescriptions written by a specific doctor"""
+    results = await db.execute(
+        build_prescription_query(doctor_license=doctor_license).order_by(
+            Prescription.date_issued.desc(), Prescription.id.desc()
+        )
+    )
+    return await serialize_prescriptions(db, results.all())
+
+async def get_patient_prescriptions(db: AsyncSession, patient_ssn: str):
     """Get all prescriptions for a specific patient"""
-    # Return prescription objects with patient and doctor names via join
-    results = db.query(
-        Prescription, 
-        Patient.name.label("patient_name"), 
-        Doctor.name.label("doctor_name")
-    ).join(
-        Patient, Prescription.patient_ssn == Patient.ssn
-    ).join(
-        Doctor, Prescription.doctor_license == Doctor.license_number
-    ).filter(
-        Prescription.patient_ssn == patient_ssn
-    ).all()
-    
-    # Process results to include names in the response
-    prescriptions = []
-    for result in results:
-        prescription, patient_name, doctor_name = result
-        
-        # Load medications for the prescription with medication name
-        medications_data = db.query(PrescriptionMedication).filter(
-            PrescriptionMedication.prescription_id == prescription.id
-        ).all()
-        
-        # Create the formatted medications list with complete information
-        medications = []
-        for med in medications_data:
-            medications.append({
-                "id": med.id,
-                "prescription_id": med.prescription_id,
-                "medication_name": med.medication_name,
-                "dosage": med.dosage,
-                "frequency": med.frequency,
-                "duration": med.duration
-            })
-        
-        # Create a dictionary representation of the prescription with names
-        prescription_dict = {
-            "id": prescription.id,
-            "patient_ssn": prescription.patient_ssn,
-            "doctor_license": prescription.doctor_license,
-            "date_issued": prescription.date_issued,
-            "status": prescription.status,
-            "medications": medications,
-            "patient_name": patient_name,
-            "doctor_name": doctor_name
-        }
-        
-        prescriptions.append(prescription_dict)
-    
-    return prescriptions
\ No newline at end of file
+    results = await db.execute(
+        build_prescription_query(patient_ssn=patient_ssn).order_by(
+            Prescription.date_issued.desc(), Prescription.id.desc()
+        )
+    )
+    return await serialize_prescriptions(db, results.all())
@@ -0,0 +1,199 @@
+import os
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import exists, func, insert, literal, select, text, update
+from sqlalchemy.orm import Session
+from app.models.medication import Medication
+from app.models.stock_movement import StockMovement
+from app.models.stock_reservation import StockReservation
+from app.utils import utcnow
+from app.cache import catalog_cache
+
+# How long stock reserved at prescription creation is held, in seconds
+STOCK_RESERVATION_TTL = int(os.environ.get("STOCK_RESERVATION_TTL", str(48 * 3600)))
+
+def record_movement(
+    db: Session,
+    medication_id: int,
+    kind: str,
+    quantity: int,
+    prescription_id: Optional[int] = None,
+    note: Optional[str] = None
+):
+    """Append a movement to the ledger. The caller commits."""
+    movement = StockMovement(
+        medication_id=medication_id,
+        kind=kind,
+        quantity=quantity,
+        prescription_id=prescription_id,
+        note=note
+    )
+    db.add(movement)
+    return movement
+
+def adjust_stock_to(db: Session, medication_id: int, level: int, note: Optional[str] = None) -> int:
+    """
+    Record the adjustment that brings a medication's stock to `level`.
+
+    The difference is computed inside the INSERT so a dispense landing at the
+    same time cannot be lost. Returns the number of movements written (0 or 1).
+    The caller commits.
+    """
+    difference = select(
+        Medication.id, literal("adjust"), level - Medication.stock_quantity, literal(note)
+    ).where(Medication.id == medication_id, Medication.stock_quantity != level)
+    return db.execute(
+        insert(StockMovement).from_select(["medication_id", "kind", "quantity", "note"], difference)
+    ).rowcount
+
+def receive_stock(db: Session, lines: Iterable[Tuple[int, int]], note: Optional[str] = None) -> List[Medication]:
+    """
+    Book a delivery of (medication_id, quantity) lines: one receive movement
+    per medication, written by a single executemany INSERT and committed once.
+    Returns the medications, restocked.
+
+    Nothing is updated in place, and the movements are inserted in medication
+    id order. On PostgreSQL each insert takes a key-share lock on its medication
+    for the foreign key, so taking them in the same order as fulfillment's row
+    locks rules out deadlocks.
+    """
+    quantities = Counter()
+    for medication_id, quantity in lines:
+        quantities[medication_id] += quantity
+    medication_ids = sorted(quantities)
+    found = set(db.execute(select(Medication.id).where(Medication.id.in_(medication_ids))).scalars())
+    missing = [medication_id for medication_id in medication_ids if medication_id not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Medications not found: {', '.join(map(str, missing))}")
+
+    try:
+        db.execute(insert(StockMovement.__table__), [
+            {"medication_id": medication_id, "kind": "receive", "quantity": quantities[medication_id], "note": note}
+            for medication_id in medication_ids
+        ])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    catalog_cache.invalidate()
+    return db.query(Medication).filter(Medication.id.in_(medication_ids)).order_by(Medication.id).all()
+
+def get_movements(db: Session, medication_id: int, skip: int = 0, limit: int = 100) -> List[StockMovement]:
+    """Newest first"""
+    return db.query(StockMovement).filter(
+        StockMovement.medication_id == medication_id
+    ).order_by(StockMovement.id.desc()).offset(skip).limit(limit).all()
+
+def compact_stock(db: Session) -> int:
+    """
+    Fold every medication's movement tail into its snapshot.
+
+    Returns the number of medications compacted. Movements are left in
+    place: the snapshot only moves the point from which the tail is summed.
+    """
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            # Waits for in-flight movement inserts and holds new ones back until commit, so every
+            # id below the cutoff is committed and none can appear behind the snapshot later.
+            # SQLite needs nothing: writers are serialised and ids only grow
+            db.execute(text("LOCK TABLE stock_movements IN SHARE MODE"))
+
+        cutoff = db.execute(select(func.max(StockMovement.id))).scalar()
+        if cutoff is None:
+            db.commit()
+            return 0
+
+        medications = Medication.__table__
+        in_tail = (
+            (StockMovement.medication_id == medications.c.id)
+            & (StockMovement.id > medications.c.snapshot_movement_id)
+            & (StockMovement.id <= cutoff)
+        )
+        tail_total = select(func.coalesce(func.sum(StockMovement.quantity), 0)).where(in_tail).scalar_subquery()
+        compacted = db.execute(
+            update(medications)
+            .where(exists().where(in_tail))
+            .values(stock_snapshot=medications.c.stock_snapshot + tail_total, snapshot_movement_id=cutoff)
+        ).rowcount
+        db.commit()
+        return compacted
+    except Exception:
+        db.rollback()
+        raise
+
+def reconcile_stock(db: Session, apply: bool = True) -> List[dict]:
+    """
+    Recompute every snapshot from the ledger and report the medications that drifted.
+
+    A snapshot must equal the sum of the movements up to its snapshot id; any
+    difference comes from a write that bypassed the ledger. With apply=True
+    the snapshots are corrected, otherwise they are only reported.
+    """
+    medications = Medication.__table__
+    ledger_total = select(func.coalesce(func.sum(StockMovement.quantity), 0)).where(
+        StockMovement.medication_id == medications.c.id,
+        StockMovement.id <= medications.c.snapshot_movement_id
+    ).scalar_subquery()
+
+    try:
+        drifted = db.execute(
+            select(medications.c.id, medications.c.name, medications.c.stock_snapshot, ledger_total.label("ledger_total"))
+            .where(medications.c.stock_snapshot != ledger_total)
+            .order_by(medications.c.id)
+        ).all()
+        report = [
+            {
+                "medication_id": row.id,
+                "name": row.name,
+                "snapshot": row.stock_snapshot,
+                "ledger": row.ledger_total,
+                "drift": row.stock_snapshot - row.ledger_total,
+            }
+            for row in drifted
+        ]
+        if apply and report:
+            db.execute(
+                update(medications)
+                .where(medications.c.stock_snapshot != ledger_total)
+                .values(stock_snapshot=ledger_total)
+            )
+        db.commit()
+        if apply and report:
+            catalog_cache.invalidate()
+        return report
+    except Exception:
+        db.rollback()
+        raise
+
+def release_expired_reservations(db: Session, batch_size: int = 1000) -> int:
+    """
+    Mark every active reservation past its expiry as expired, a batch per
+    UPDATE and commit so holds on the hot rows stay short. Returns the count.
+    """
+    now = utcnow()
+    released = 0
+    try:
+        while True:
+            expired = (
+                select(StockReservation.id)
+                .where(StockReservation.status == "active", StockReservation.expires_at <= now)
+                .limit(batch_size)
+                # Holds being consumed by a fulfillment right now are left for the next pass
+                .with_for_update(skip_locked=True)
+            )
+            count = db.execute(
+                update(StockReservation)
+                .where(StockReservation.id.in_(expired))
+                .values(status="expired")
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            released += count
+            if count < batch_size:
+                if released:
+                    catalog_cache.invalidate()
+                return released
+    except Exception:
+        db.rollback()
+        raise
@@ -1,13 +1,119 @@
-from sqlalchemy import create_engine
+import os
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./pharmacy.db"
+# Loading environment variables from .env file
+load_dotenv()
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# Database configuration
+# Every setting can be overridden through the environment; the defaults keep
+# the local SQLite file used during development
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./pharmacy.db")
+
+# Connection pool (PostgreSQL and other server databases)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))  # seconds
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "30000"))  # 0 disables it
+
+# SQLite tuning, applied to every new connection
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes
+SQLITE_FOREIGN_KEYS = _env_bool("SQLITE_FOREIGN_KEYS", True)
+
+# Async drivers used by the AsyncSession path, per backend
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def to_async_url(url) -> str:
+    """Same database, reached through the backend's async driver"""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(hide_password=False)
+
+def is_sqlite(url) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """Connection hook: WAL lets readers proceed while a pharmacist is writing"""
+    cursor = dbapi_connection.cursor()
+    # In-memory databases have no journal file to switch to WAL
+    cursor.execute("PRAGMA database_list")
+    on_disk = any(row[2] for row in cursor.fetchall())
+    if on_disk:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA foreign_keys={'ON' if SQLITE_FOREIGN_KEYS else 'OFF'}")
+    cursor.close()
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL, **engine_kwargs):
+    """Build an engine for the given URL with the configured pooling or SQLite tuning"""
+    if is_sqlite(url):
+        options = {
+            "connect_args": {
+                "check_same_thread": False,
+                # Seconds the driver waits on a locked database, in step with busy_timeout
+                "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+            },
+        }
+    else:
+        options = {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+            "pool_recycle": DB_POOL_RECYCLE,
+        }
+        if DB_STATEMENT_TIMEOUT_MS and make_url(url).get_backend_name() == "postgresql":
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    options.update(engine_kwargs)
+
+    new_engine = create_engine(url, **options)
+    if is_sqlite(url):
+        event.listen(new_engine, "connect", apply_sqlite_pragmas)
+    return new_engine
+
+def create_async_db_engine(url: str = None, **engine_kwargs):
+    """Async counterpart of create_db_engine, with the same pooling and SQLite tuning"""
+    url = url or to_async_url(SQLALCHEMY_DATABASE_URL)
+    if is_sqlite(url):
+        options = {"connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    else:
+        options = {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+            "pool_recycle": DB_POOL_RECYCLE,
+        }
+        if DB_STATEMENT_TIMEOUT_MS and make_url(url).get_backend_name() == "postgresql":
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    options.update(engine_kwargs)
+
+    new_engine = create_async_engine(url, **options)
+    if is_sqlite(url):
+        event.listen(new_engine.sync_engine, "connect", apply_sqlite_pragmas)
+    return new_engine
+
+engine = create_db_engine()
+async_engine = create_async_db_engine(os.environ.get("ASYNC_DATABASE_URL"))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay usable after commit: async code cannot lazy-load expired attributes
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 def get_db():
@@ -17,6 +123,11 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Session for async def handlers: queries are awaited instead of blocking the event loop"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def reset_database():
     Base.metadata.drop_all(engine)
-    Base.metadata.create_all(engine)
\ No newline at end of file
+    Base.metadata.create_all(engine)
@@ -0,0 +1,139 @@
+# app/dispensing.py
+"""
+Turn the free-text dosage, frequency and duration of a prescription line into
+numbers, so fulfillment can deduct the real quantity with plain SQL.
+
+Parsing happens once, when a line is written. Anything that cannot be
+understood falls back to 1, which is what fulfillment used to deduct.
+"""
+import math
+import re
+from fractions import Fraction
+from typing import Optional
+
+WORD_NUMBERS = {
+    "half": 0.5, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "twelve": 12,
+}
+
+# Amounts measured in mass or volume describe the strength taken, not how many
+# packaged units (tablets, vials...) are used, so they count as one unit per dose
+MEASURE_UNITS = {"mg", "mcg", "µg", "g", "ml", "l", "iu", "ui"}
+
+# Common latin abbreviations: doses per day
+FREQUENCY_ABBREVIATIONS = {
+    "qd": 1, "od": 1, "qam": 1, "qpm": 1, "qhs": 1, "hs": 1,
+    "bid": 2, "bd": 2, "tid": 3, "tds": 3, "qid": 4, "qds": 4,
+    "qod": 0.5, "eod": 0.5,
+}
+
+TIMES_WORDS = {"once": 1, "twice": 2, "thrice": 3}
+
+# English and French period words, singular, in days
+PERIOD_DAYS = {
+    "hour": 1 / 24, "hr": 1 / 24, "h": 1 / 24, "heure": 1 / 24,
+    "day": 1, "d": 1, "jour": 1, "j": 1,
+    "week": 7, "wk": 7, "w": 7, "semaine": 7, "sem": 7,
+    "month": 30, "mo": 30, "mois": 30,
+}
+
+_PERIOD = r"(hours?|hrs?|h|heures?|days?|d|jours?|j|weeks?|wks?|w|semaines?|sem|months?|mo|mois)"
+
+_NUMBER = r"(\d+/\d+|\d+(?:[.,]\d+)?|\b(?:" + "|".join(WORD_NUMBERS) + r")\b)"
+
+def _to_number(token: str) -> Optional[float]:
+    token = token.strip().lower().replace(",", ".")
+    if token in WORD_NUMBERS:
+        return float(WORD_NUMBERS[token])
+    try:
+        return float(Fraction(token))
+    except (ValueError, ZeroDivisionError):
+        return None
+
+def _period_days(token: str) -> Optional[float]:
+    token = token.lower()
+    if token in PERIOD_DAYS:
+        return PERIOD_DAYS[token]
+    return PERIOD_DAYS.get(token[:-1]) if token.endswith("s") else None
+
+def parse_units_per_dose(dosage: Optional[str]) -> float:
+    """'2 tablets' -> 2, '1/2 tablet' -> 0.5, '500mg' -> 1"""
+    if not dosage:
+        return 1.0
+    match = re.search(_NUMBER + r"\s*([a-zµ]+)?", dosage.lower())
+    if not match:
+        return 1.0
+    amount = _to_number(match.group(1))
+    unit = match.group(2)
+    if amount is None or amount <= 0 or (unit and unit in MEASURE_UNITS):
+        return 1.0
+    return amount
+
+def parse_doses_per_day(frequency: Optional[str]) -> float:
+    """'twice a day' -> 2, 'every 8 hours' -> 3, 'TID' -> 3, 'once a week' -> 1/7, '3 fois /jour' -> 3"""
+    if not frequency:
+        return 1.0
+    text = frequency.lower()
+
+    # "every 8 hours", "every other day", "q8h", "q2d", "toutes les 8 heures"
+    match = re.search(r"(?:every|q|toutes\s+les|tous\s+les)\s*" + _NUMBER + r"?\s*(other\s+)?" + _PERIOD + r"\b", text)
+    if match:
+        count = _to_number(match.group(1)) if match.group(1) else 1.0
+        if match.group(2):
+            count = 2.0
+        days = _period_days(match.group(3))
+        if count and days:
+            return 1 / (count * days)
+
+    for abbreviation, doses in FREQUENCY_ABBREVIATIONS.items():
+        if re.search(rf"\b{abbreviation}\b", text):
+            return float(doses)
+
+    # "twice a day", "3 times daily", "2x/day", "once weekly", "3 fois /jour"
+    match = re.search(
+        r"(" + "|".join(TIMES_WORDS) + r"|" + _NUMBER[1:-1] + r")\s*(?:times?|x|fois)?\s*(?:a|an|per|par|/|each)?\s*"
+        r"(daily|weekly|monthly|" + _PERIOD[1:-1] + r")?\b",
+        text
+    )
+    if match:
+        count = TIMES_WORDS.get(match.group(1)) or _to_number(match.group(1))
+        period = {"daily": "day", "weekly": "week", "monthly": "month"}.get(match.group(2), match.group(2) or "day")
+        days = _period_days(period)
+        if count and days:
+            return count / days
+
+    if re.search(r"\bweekly\b", text):
+        return 1 / 7
+    return 1.0
+
+def parse_days(duration: Optional[str]) -> float:
+    """'5 days' -> 5, '2 weeks' -> 14, '1 month' -> 30, '4 jours' -> 4, '10' -> 10"""
+    if not duration:
+        return 1.0
+    match = re.search(_NUMBER + r"\s*" + _PERIOD + r"?\b", duration.lower())
+    if not match:
+        return 1.0
+    count = _to_number(match.group(1))
+    days = _period_days(match.group(2)) if match.group(2) else 1
+    if not count or count <= 0:
+        return 1.0
+    return count * days
+
+def dispensing_quantities(dosage: Optional[str], frequency: Optional[str], duration: Optional[str]) -> dict:
+    """
+    Structured columns for a PrescriptionMedication row.
+
+    quantity is the number of units to dispense, rounded up so a course is
+    never short.
+    """
+    units_per_dose = parse_units_per_dose(dosage)
+    doses_per_day = parse_doses_per_day(frequency)
+    days = parse_days(duration)
+    # Rounded first so float noise such as 2.0000000001 does not add a unit
+    quantity = max(1, math.ceil(round(units_per_dose * doses_per_day * days, 6)))
+    return {
+        "units_per_dose": units_per_dose,
+        "doses_per_day": doses_per_day,
+        "days": days,
+        "quantity": quantity,
+    }
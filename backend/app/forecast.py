@@ -0,0 +1,181 @@
+# app/forecast.py
+"""
+Demand forecasting and reorder points for the whole catalog.
+
+Daily units dispensed per medication are loaded into one (medications x days)
+NumPy array, and the forecast, safety stock and reorder point of every
+medication are computed together from it. The report is rebuilt by a
+periodic job and served from memory in between.
+
+Units are counted on the day they left the shelf, from the dispense movements
+of the stock ledger. Prescriptions fulfilled before the ledger existed have no
+movements and are counted on the day they were issued instead.
+"""
+import math
+import os
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import Date, func, select
+from sqlalchemy.orm import Session
+
+from app.models.medication import Medication
+from app.models.prescription import Prescription
+from app.models.prescription_medication import PrescriptionMedication
+from app.models.stock_movement import StockMovement
+from app.utils import utcnow
+
+# Days of dispensing history the forecast looks at
+REORDER_HISTORY_DAYS = int(os.environ.get("REORDER_HISTORY_DAYS", "90"))
+# "ewma" (exponential smoothing) or "sma" (moving average over the last REORDER_SMA_WINDOW days)
+REORDER_FORECAST_METHOD = os.environ.get("REORDER_FORECAST_METHOD", "ewma")
+REORDER_SMOOTHING_ALPHA = float(os.environ.get("REORDER_SMOOTHING_ALPHA", "0.3"))
+REORDER_SMA_WINDOW = int(os.environ.get("REORDER_SMA_WINDOW", "28"))
+# Days between placing an order and the stock arriving
+REORDER_LEAD_TIME_DAYS = float(os.environ.get("REORDER_LEAD_TIME_DAYS", "7"))
+# Standard normal quantile of the target service level: 1.65 keeps ~95% of lead times out of stock-outs
+REORDER_SERVICE_LEVEL_Z = float(os.environ.get("REORDER_SERVICE_LEVEL_Z", "1.65"))
+# Days between two orders of the same medication; an order covers this much demand on top of the reorder point
+REORDER_REVIEW_PERIOD_DAYS = float(os.environ.get("REORDER_REVIEW_PERIOD_DAYS", "7"))
+
+_reorder_report: Optional[dict] = None
+
+def load_demand(db: Session, history_days: int = REORDER_HISTORY_DAYS, today: Optional[date] = None):
+    """
+    The catalog and its daily demand: (medications, demand) where demand[i, d]
+    is the number of units of medications[i] dispensed d days after the start
+    of the window. One query for the catalog, one for the ledger and one for
+    prescriptions fulfilled before it.
+    """
+    today = today or date.today()
+    start = today - timedelta(days=history_days - 1)
+
+    medications = db.execute(
+        select(Medication.id, Medication.name, Medication.stock_quantity).order_by(Medication.id)
+    ).all()
+    day_dispensed = func.date(StockMovement.created_at, type_=Date)
+    rows = db.execute(
+        select(StockMovement.medication_id, day_dispensed, func.sum(-StockMovement.quantity).label("units"))
+        .where(
+            StockMovement.kind == "dispense",
+            StockMovement.created_at >= datetime.combine(start, datetime.min.time()),
+            StockMovement.created_at < datetime.combine(today + timedelta(days=1), datetime.min.time())
+        )
+        .group_by(StockMovement.medication_id, day_dispensed)
+    ).all()
+    ledgered = select(StockMovement.prescription_id).where(
+        StockMovement.kind == "dispense", StockMovement.prescription_id.is_not(None)
+    )
+    rows += db.execute(
+        select(
+            PrescriptionMedication.medication_id,
+            Prescription.date_issued,
+            func.sum(func.coalesce(PrescriptionMedication.quantity, 1))
+        )
+        .join(Prescription, Prescription.id == PrescriptionMedication.prescription_id)
+        .where(
+            Prescription.status == "fulfilled",
+            Prescription.date_issued >= start,
+            Prescription.date_issued <= today,
+            Prescription.id.not_in(ledgered)
+        )
+        .group_by(PrescriptionMedication.medication_id, Prescription.date_issued)
+    ).all()
+
+    demand = np.zeros((len(medications), history_days))
+    position = {medication.id: i for i, medication in enumerate(medications)}
+    rows = [row for row in rows if row[0] in position]
+    if rows:
+        medication_ids, days, units = zip(*rows)
+        np.add.at(
+            demand,
+            (np.array([position[medication_id] for medication_id in medication_ids]), np.array([(day - start).days for day in days])),
+            np.array(units, dtype=float)
+        )
+    return medications, demand
+
+def forecast_daily_demand(
+    demand: np.ndarray,
+    method: str = REORDER_FORECAST_METHOD,
+    alpha: float = REORDER_SMOOTHING_ALPHA,
+    window: int = REORDER_SMA_WINDOW
+) -> np.ndarray:
+    """Expected units per day for every row of demand"""
+    days = demand.shape[1]
+    if method == "sma":
+        return demand[:, -window:].mean(axis=1)
+    if method != "ewma":
+        raise ValueError(f"Unknown forecast method {method!r}")
+    # The smoothing recursion s = alpha * x + (1 - alpha) * s, seeded with the first day,
+    # unrolled into one weight per day so all medications are smoothed by a single product
+    weights = alpha * (1 - alpha) ** np.arange(days - 1, -1, -1)
+    weights[0] = (1 - alpha) ** (days - 1)
+    return demand @ weights
+
+def reorder_points(
+    demand: np.ndarray,
+    forecast: np.ndarray,
+    lead_time_days: float = REORDER_LEAD_TIME_DAYS,
+    service_level_z: float = REORDER_SERVICE_LEVEL_Z
+):
+    """(safety_stock, reorder_point) per row: demand over the lead time plus a buffer for its variability"""
+    spread = demand.std(axis=1, ddof=1) if demand.shape[1] > 1 else np.zeros(len(demand))
+    safety_stock = service_level_z * spread * math.sqrt(lead_time_days)
+    return safety_stock, forecast * lead_time_days + safety_stock
+
+def order_quantities(
+    stock: np.ndarray,
+    forecast: np.ndarray,
+    reorder_point: np.ndarray,
+    review_period_days: float = REORDER_REVIEW_PERIOD_DAYS
+) -> np.ndarray:
+    """
+    Units to order for every medication below its reorder point.
+
+    Orders go up to the reorder point plus the forecast demand of one review
+    period, so stock arriving after the lead time lasts until the next order
+    instead of dropping below the reorder point again the day after.
+    """
+    order_up_to = np.ceil(np.round(reorder_point + forecast * review_period_days, 6))
+    return np.where(stock < reorder_point, order_up_to - stock, 0)
+
+def build_reorder_report(db: Session, today: Optional[date] = None) -> dict:
+    medications, demand = load_demand(db, today=today)
+    forecast = forecast_daily_demand(demand)
+    safety_stock, reorder_point = reorder_points(demand, forecast)
+    reorder_point = np.ceil(np.round(reorder_point, 6))
+    stock = np.array([medication.stock_quantity or 0 for medication in medications], dtype=float)
+    reorder = stock < reorder_point
+    order_quantity = order_quantities(stock, forecast, reorder_point)
+
+    return {
+        "generated_at": utcnow(),
+        "method": REORDER_FORECAST_METHOD,
+        "history_days": REORDER_HISTORY_DAYS,
+        "lead_time_days": REORDER_LEAD_TIME_DAYS,
+        "review_period_days": REORDER_REVIEW_PERIOD_DAYS,
+        "items": [
+            {
+                "medication_id": medication.id,
+                "name": medication.name,
+                "stock_quantity": int(stock[i]),
+                "forecast_daily_demand": round(float(forecast[i]), 3),
+                "safety_stock": round(float(safety_stock[i]), 3),
+                "reorder_point": int(reorder_point[i]),
+                "reorder": bool(reorder[i]),
+                "order_quantity": int(order_quantity[i]),
+            }
+            for i, medication in enumerate(medications)
+        ],
+    }
+
+def refresh_reorder_report(db: Session) -> dict:
+    """Rebuild the cached report; run by the periodic job"""
+    global _reorder_report
+    _reorder_report = build_reorder_report(db)
+    return _reorder_report
+
+def get_reorder_report(db: Session) -> dict:
+    """The report from the last run, built on first use"""
+    return _reorder_report or refresh_reorder_report(db)
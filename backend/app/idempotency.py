@@ -0,0 +1,160 @@
+# app/idempotency.py
+"""
+Replay of retried writes sent with an Idempotency-Key header.
+
+The first request with a key inserts a row for it before running; the
+primary key makes that claim atomic across workers. When it finishes, its
+status and JSON body are stored on the row, and a retry within
+IDEMPOTENCY_TTL gets them back without the prescription tables being read.
+A duplicate arriving while the first is still running waits for its result
+instead of executing a second time.
+
+Keys are scoped to the caller, so two users cannot collide, and bound to the
+request: reusing a key for another method, path or body is refused.
+"""
+import hashlib
+import json
+import os
+import time
+from datetime import timedelta
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.idempotency_key import IdempotencyKey
+from app.utils import utcnow
+
+# Seconds a completed request's response is replayed for
+IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", str(24 * 3600)))
+# Seconds a claim is held for a running request; a worker that dies mid-request frees its key after this
+IDEMPOTENCY_LOCK_SECONDS = float(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "60"))
+# Seconds a concurrent duplicate waits for the first request before giving up with a 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "10"))
+IDEMPOTENCY_POLL_SECONDS = 0.05
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+# Client errors that depend on the moment (lease conflicts, locks, rate limits), so a retry may succeed
+TRANSIENT_STATUS_CODES = {409, 423, 429}
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+class TransientHTTPException(HTTPException):
+    """A client error that may not recur, such as a stock shortfall; a retry with the same key runs again"""
+
+def _replayable(exc: BaseException) -> bool:
+    """Whether a failure is the request's final answer: deterministic client errors only"""
+    return (
+        isinstance(exc, HTTPException)
+        and exc.status_code < 500
+        and exc.status_code not in TRANSIENT_STATUS_CODES
+        and not isinstance(exc, TransientHTTPException)
+    )
+
+def _sha256(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+def scoped_key(principal: str, key: str) -> str:
+    """The stored key: fixed-size, and distinct per caller"""
+    return _sha256(f"{principal}\n{key}")
+
+def request_fingerprint(method: str, path: str, body: Optional[str] = None) -> str:
+    return _sha256(f"{method}\n{path}\n{body or ''}")
+
+def _claim(db: Session, key: str, fingerprint: str) -> bool:
+    """Take the key for this request; False when another request holds it or already completed it"""
+    now = utcnow()
+    held_until = now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
+    try:
+        db.execute(insert(IdempotencyKey).values(key=key, fingerprint=fingerprint, expires_at=held_until))
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+    # An expired row, completed or abandoned, is taken over in place
+    taken = db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.key == key, IdempotencyKey.expires_at <= now)
+        .values(fingerprint=fingerprint, status_code=None, response=None, expires_at=held_until, created_at=now)
+    ).rowcount
+    db.commit()
+    return bool(taken)
+
+def _replay(status_code: int, response: str) -> Response:
+    return Response(
+        content=response,
+        status_code=status_code,
+        media_type="application/json",
+        headers={REPLAY_HEADER: "true"}
+    )
+
+def _wait_for_result(db: Session, key: str, fingerprint: str) -> Response:
+    """The stored response of the request holding the key, once it completes"""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        row = db.execute(
+            select(IdempotencyKey.fingerprint, IdempotencyKey.status_code, IdempotencyKey.response)
+            .where(IdempotencyKey.key == key)
+        ).first()
+        # Ends the read transaction, so the next poll sees the other request's commit
+        db.rollback()
+        if row is not None and row.fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if row is not None and row.status_code is not None:
+            return _replay(row.status_code, row.response)
+        if row is None or time.monotonic() >= deadline:
+            # Abandoned by a failed request, or still running
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress")
+        time.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+def _store(db: Session, key: str, status_code: int, response: str):
+    db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.key == key)
+        .values(status_code=status_code, response=response, expires_at=utcnow() + timedelta(seconds=IDEMPOTENCY_TTL))
+    )
+    db.commit()
+
+def run_idempotent(
+    db: Session,
+    principal: str,
+    key: Optional[str],
+    fingerprint: str,
+    execute: Callable[[], Any],
+    serialize: Callable[[Any], str]
+) -> Response:
+    """
+    Run execute() once per caller and key, returning its result serialized to JSON.
+
+    Without a key this is a plain call. Deterministic client errors (a 404,
+    a 403, a refused body) are stored and replayed like successes; transient
+    ones (see TRANSIENT_STATUS_CODES and TransientHTTPException) and any other
+    failure free the key so a retry runs again.
+    """
+    if key is None:
+        return Response(content=serialize(execute()), media_type="application/json")
+    key = scoped_key(principal, key)
+    if not _claim(db, key, fingerprint):
+        return _wait_for_result(db, key, fingerprint)
+
+    try:
+        result = execute()
+    except BaseException as exc:
+        db.rollback()
+        if _replayable(exc):
+            _store(db, key, exc.status_code, json.dumps({"detail": exc.detail}))
+        else:
+            db.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+            db.commit()
+        raise
+
+    response = serialize(result)
+    _store(db, key, 200, response)
+    return Response(content=response, media_type="application/json")
+
+def purge_expired_idempotency_keys(db: Session) -> int:
+    """Delete keys past their replay window; returns how many were removed"""
+    purged = db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= utcnow())).rowcount
+    db.commit()
+    return purged
@@ -1,13 +1,26 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import Base, engine
 from app.routes import patient, medication, prescription, doctor, pharmacist, auth
+from app.tasks import start_background_tasks, stop_background_tasks
+from app.utils import configure_password_hashing
 
-Base.metadata.create_all(bind=engine)
+# The schema is managed by Alembic: run `alembic upgrade head` from backend/ before starting
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fit the bcrypt cost to this machine before the first login (see app/utils.py)
+    await asyncio.to_thread(configure_password_hashing)
+    # Periodic maintenance such as stock snapshot compaction (see app/tasks.py)
+    tasks = start_background_tasks()
+    yield
+    await stop_background_tasks(tasks)
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Pharmacy Management API",
     description="API for managing pharmacy operations, prescriptions, and inventory",
     version="1.0.0",
@@ -29,6 +42,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination metadata for /prescriptions/all, idempotent replays and login throttling travel in headers
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "Idempotent-Replayed", "Retry-After"],
 )
 
 # Inclusion des routes de chaque ressource
@@ -43,7 +58,7 @@ app.include_router(pharmacist.router)
 def read_root():
     return {"message": "Welcome to the Pharmacy !!! "}
 
-# Customize the OpenAPI schema to support multiple security schemes
+# Customize the OpenAPI schema to document the security scheme
 def custom_openapi():
     if app.openapi_schema:
         return app.openapi_schema
@@ -55,34 +70,17 @@ def custom_openapi():
         routes=app.routes,
     )
     
-    # Define the security schemes
+    # Define the security scheme: one bearer token for every user type
     openapi_schema["components"]["securitySchemes"] = {
-        "pharmacistAuth": {
+        "bearerAuth": {
             "type": "oauth2",
+            "description": "Pharmacists log in at auth/token, doctors at auth/doctor-token, patients at auth/patient-token",
             "flows": {
                 "password": {
                     "tokenUrl": "auth/token",
                     "scopes": {}
                 }
             }
-        },
-        "doctorAuth": {
-            "type": "oauth2",
-            "flows": {
-                "password": {
-                    "tokenUrl": "auth/doctor-token",
-                    "scopes": {}
-                }
-            }
-        },
-        "patientAuth": {
-            "type": "oauth2",
-            "flows": {
-                "password": {
-                    "tokenUrl": "auth/patient-token",
-                    "scopes": {}
-                }
-            }
         }
     }
     
@@ -0,0 +1,14 @@
+from __future__ import annotations
+from sqlalchemy import Column, Integer, String, Text, DateTime, func
+from app.database import Base
+
+class IdempotencyKey(Base):
+    """The stored outcome of a request sent with an Idempotency-Key header"""
+    __tablename__ = 'idempotency_keys'
+
+    key = Column(String(64), primary_key=True)  # sha256 of the caller and their key
+    fingerprint = Column(String(64), nullable=False)  # sha256 of the method, path and body
+    status_code = Column(Integer, nullable=True)  # NULL while the first request is running
+    response = Column(Text, nullable=True)  # JSON body
+    expires_at = Column(DateTime, nullable=False, index=True)  # UTC
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
@@ -1,7 +1,9 @@
 from __future__ import annotations 
-from sqlalchemy import Column, Integer, String, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, func, select
+from sqlalchemy.orm import relationship, column_property
 from app.database import Base
+from app.models.stock_movement import StockMovement
+from app.models.stock_reservation import StockReservation
 
 class Medication(Base):
     __tablename__ = 'medications'
@@ -11,7 +13,33 @@ class Medication(Base):
     description = Column(String)                    
     dosage_form = Column(String)                   
     strength = Column(String)                      
-    stock_quantity = Column(Integer)               
     price = Column(Float) 
 
-    prescriptions = relationship("app.models.prescription_medication.PrescriptionMedication", back_populates="medication")
\ No newline at end of file
+    # Stock is never overwritten: it is the compacted snapshot plus the movements
+    # recorded after snapshot_movement_id (see app/crud/stock.py)
+    stock_snapshot = Column(Integer, nullable=False, default=0, server_default="0")
+    snapshot_movement_id = Column(Integer, nullable=False, default=0, server_default="0")
+    stock_quantity = column_property(
+        stock_snapshot + func.coalesce(
+            select(func.sum(StockMovement.quantity)).where(
+                StockMovement.medication_id == id,
+                StockMovement.id > snapshot_movement_id
+            ).correlate_except(StockMovement).scalar_subquery(),
+            0
+        )
+    )
+    # Held by pending prescriptions (see app/models/stock_reservation.py)
+    reserved_quantity = column_property(
+        func.coalesce(
+            select(func.sum(StockReservation.quantity)).where(
+                StockReservation.medication_id == id,
+                StockReservation.status == "active"
+            ).correlate_except(StockReservation).scalar_subquery(),
+            0
+        )
+    )
+    available_quantity = column_property(stock_quantity.expression - reserved_quantity.expression)
+
+    prescriptions = relationship("app.models.prescription_medication.PrescriptionMedication", back_populates="medication")
+    movements = relationship(StockMovement, back_populates="medication", cascade="all", passive_deletes=True)
+    reservations = relationship(StockReservation, back_populates="medication", cascade="all", passive_deletes=True)
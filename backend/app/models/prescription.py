@@ -1,16 +1,27 @@
 from __future__ import annotations 
-from sqlalchemy import Column, Integer,Date, String, ForeignKey
+from sqlalchemy import Column, Integer,Date, DateTime, String, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import date 
 
 class Prescription(Base):
     __tablename__ = 'prescriptions'
+    # One composite index per listing filter, each ending in the (date_issued, id)
+    # sort key so filtered pages are read straight from the index in order
+    __table_args__ = (
+        Index('ix_prescriptions_date_issued_id', 'date_issued', 'id'),
+        Index('ix_prescriptions_status_date_issued', 'status', 'date_issued', 'id'),
+        Index('ix_prescriptions_doctor_license_date_issued', 'doctor_license', 'date_issued', 'id'),
+        Index('ix_prescriptions_patient_ssn_date_issued', 'patient_ssn', 'date_issued', 'id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     patient_ssn = Column(String, ForeignKey("patients.ssn"))  
     doctor_license = Column(String, ForeignKey("doctors.license_number"))  
     date_issued = Column(Date,default=date.today())
     status = Column(String,default="pending")  # "pending", "fulfilled", "cancelled"
+    # Work-queue lease: the pharmacist working on a pending prescription, until the lease expires (UTC)
+    claimed_by = Column(String, nullable=True)  # pharmacist license_number
+    lease_expires_at = Column(DateTime, nullable=True)
 
     medications = relationship("app.models.prescription_medication.PrescriptionMedication", back_populates="prescription")
\ No newline at end of file
@@ -1,18 +1,29 @@
 from __future__ import annotations 
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 class PrescriptionMedication(Base):
     __tablename__ = 'prescription_medications'
-    __table_args__ = {'extend_existing': True , 'sqlite_autoincrement': True}  
+    __table_args__ = (
+        # Covers the units-needed aggregate of fulfillment and reservations without touching the table
+        Index('ix_prescription_medications_prescription_id_medication_id', 'prescription_id', 'medication_id', 'quantity'),
+        {'extend_existing': True , 'sqlite_autoincrement': True}
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     prescription_id = Column(Integer, ForeignKey('prescriptions.id'))
-    medication_name = Column(String, ForeignKey('medications.id'))  
+    medication_id = Column(Integer, ForeignKey('medications.id'), index=True)
+    # Name as prescribed, for display only; every join goes through medication_id
+    medication_name = Column(String)
     dosage = Column(String)  
     frequency = Column(String)  
     duration = Column(String)  
+    # Parsed from dosage/frequency/duration when the line is written (see app/dispensing.py)
+    units_per_dose = Column(Float)
+    doses_per_day = Column(Float)
+    days = Column(Float)
+    quantity = Column(Integer)  # units dispensed on fulfillment
 
     prescription = relationship("app.models.prescription.Prescription", back_populates="medications")
     medication = relationship("app.models.medication.Medication", back_populates="prescriptions")
\ No newline at end of file
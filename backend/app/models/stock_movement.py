@@ -0,0 +1,25 @@
+from __future__ import annotations
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, func
+from sqlalchemy.orm import relationship
+from app.database import Base
+
+# Why stock changed. Dispenses are negative, receipts and returns positive, adjustments either
+MOVEMENT_KINDS = ("dispense", "receive", "adjust", "return")
+
+class StockMovement(Base):
+    """One change to a medication's stock. Rows are only ever inserted."""
+    __tablename__ = 'stock_movements'
+    # Current stock sums the movements of one medication after its snapshot id
+    __table_args__ = (
+        Index('ix_stock_movements_medication_id_id', 'medication_id', 'id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    medication_id = Column(Integer, ForeignKey('medications.id', ondelete='CASCADE'), nullable=False)
+    kind = Column(String, nullable=False)  # "dispense", "receive", "adjust", "return"
+    quantity = Column(Integer, nullable=False)  # signed: negative when stock leaves
+    prescription_id = Column(Integer, ForeignKey('prescriptions.id', ondelete='SET NULL'), nullable=True)
+    note = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    medication = relationship("app.models.medication.Medication", back_populates="movements")
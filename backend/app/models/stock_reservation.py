@@ -0,0 +1,30 @@
+from __future__ import annotations
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, func
+from sqlalchemy.orm import relationship
+from app.database import Base
+
+class StockReservation(Base):
+    """Stock held for a pending prescription until it is fulfilled or the hold expires"""
+    __tablename__ = 'stock_reservations'
+
+    id = Column(Integer, primary_key=True)
+    medication_id = Column(Integer, ForeignKey('medications.id', ondelete='CASCADE'), nullable=False)
+    prescription_id = Column(Integer, ForeignKey('prescriptions.id', ondelete='CASCADE'), nullable=False, index=True)
+    quantity = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="active")  # "active", "consumed", "released", "expired"
+    expires_at = Column(DateTime, nullable=False)  # UTC
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    medication = relationship("app.models.medication.Medication", back_populates="reservations")
+
+# Partial indexes over the active holds only: the per-medication total is read from the first
+# (it covers the query, status included) and the sweeper finds expired holds through the second
+Index(
+    'ix_stock_reservations_active_medication_id',
+    StockReservation.medication_id, StockReservation.status, StockReservation.quantity,
+    sqlite_where=StockReservation.status == "active", postgresql_where=StockReservation.status == "active"
+)
+Index(
+    'ix_stock_reservations_active_expires_at', StockReservation.expires_at,
+    sqlite_where=StockReservation.status == "active", postgresql_where=StockReservation.status == "active"
+)
@@ -1,30 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
-from app.database import get_db
-from app.utils import verify_password
+from app.database import get_async_db
+from app.utils import verify_and_update_password_async
 from app.models.pharmacist import Pharmacist
 from app.models.doctor import Doctor
 from app.models.patient import Patient
-from app.auth.jwt import create_access_token, Token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.auth.jwt import create_access_token, principal_claims, Token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.auth.throttle import login_throttle
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
+async def check_password(db: AsyncSession, user, password: str) -> bool:
+    """Verify a login's password, replacing its stored hash when that was made with an outdated cost"""
+    if user is None:
+        return False
+    verified, new_hash = await verify_and_update_password_async(password, user.hashed_password)
+    if verified and new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+    return verified
+
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     OAuth2 compatible token login for pharmacists, get an access token for future requests
     """
+    # Refuse bursts of attempts before any lookup or password hashing
+    attempt = login_throttle.check("pharmacist", form_data.username, request)
+
     # Find pharmacist by email
-    pharmacist = db.query(Pharmacist).filter(Pharmacist.email == form_data.username).first()
+    pharmacist = (await db.execute(select(Pharmacist).where(Pharmacist.email == form_data.username))).scalar_one_or_none()
     
     # Verify pharmacist exists and password is correct
-    if not pharmacist or not verify_password(form_data.password, pharmacist.hashed_password):
+    if not await check_password(db, pharmacist, form_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -38,10 +54,12 @@ async def login_for_access_token(
             detail="Inactive pharmacist account"
         )
     
-    # Create access token with sub claim containing pharmacist's email
+    login_throttle.succeeded(attempt)
+
+    # The token carries the pharmacist's email, id and license number, so requests are authorized from it
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": pharmacist.email, "user_type": "pharmacist"}, 
+        data=principal_claims(pharmacist, "pharmacist"), 
         expires_delta=access_token_expires
     )
     
@@ -49,17 +67,21 @@ async def login_for_access_token(
 
 @router.post("/doctor-token", response_model=Token)
 async def doctor_login_for_access_token(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     OAuth2 compatible token login for doctors, get an access token for future requests
     """
+    # Refuse bursts of attempts before any lookup or password hashing
+    attempt = login_throttle.check("doctor", form_data.username, request)
+
     # Find doctor by email
-    doctor = db.query(Doctor).filter(Doctor.email == form_data.username).first()
+    doctor = (await db.execute(select(Doctor).where(Doctor.email == form_data.username))).scalar_one_or_none()
     
     # Verify doctor exists and password is correct
-    if not doctor or not verify_password(form_data.password, doctor.hashed_password):
+    if not await check_password(db, doctor, form_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -73,10 +95,12 @@ async def doctor_login_for_access_token(
             detail="Inactive doctor account"
         )
     
-    # Create access token with sub claim containing doctor's email
+    login_throttle.succeeded(attempt)
+
+    # The token carries the doctor's email, id and license number, so requests are authorized from it
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": doctor.email, "user_type": "doctor"}, 
+        data=principal_claims(doctor, "doctor"), 
         expires_delta=access_token_expires
     )
     
@@ -84,17 +108,21 @@ async def doctor_login_for_access_token(
 
 @router.post("/patient-token", response_model=Token)
 async def patient_login_for_access_token(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     OAuth2 compatible token login for patients, get an access token for future requests
     """
+    # Refuse bursts of attempts before any lookup or password hashing
+    attempt = login_throttle.check("patient", form_data.username, request)
+
     # Find patient by email
-    patient = db.query(Patient).filter(Patient.email == form_data.username).first()
+    patient = (await db.execute(select(Patient).where(Patient.email == form_data.username))).scalar_one_or_none()
     
     # Verify patient exists and password is correct
-    if not patient or not verify_password(form_data.password, patient.hashed_password):
+    if not await check_password(db, patient, form_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -108,10 +136,12 @@ async def patient_login_for_access_token(
             detail="Inactive patient account"
         )
     
-    # Create access token with sub claim containing patient's email
+    login_throttle.succeeded(attempt)
+
+    # The token carries the patient's email, id and SSN, so requests are authorized from it
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": patient.email, "user_type": "patient"}, 
+        data=principal_claims(patient, "patient"), 
         expires_delta=access_token_expires
     )
     
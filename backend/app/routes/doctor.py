@@ -4,7 +4,7 @@ from typing import List
 from app.database import get_db
 from app.models.doctor import Doctor
 from app.schemas.doctor import DoctorCreate, DoctorResponse, DoctorUpdate
-from app.auth.jwt import get_current_active_doctor, get_current_active_pharmacist, get_current_user
+from app.auth.jwt import get_current_active_doctor, get_current_active_pharmacist, get_current_user, UserInfo
 from app.crud.doctor import (
     create_doctor, 
     get_doctor, 
@@ -34,9 +34,13 @@ def list_doctors(
     return db.query(Doctor).all()
 
 @router.get("/me", response_model=DoctorResponse)
-def read_current_doctor(current_doctor: Doctor = Depends(get_current_active_doctor)):
+def read_current_doctor(
+    db: Session = Depends(get_db),
+    current_doctor: UserInfo = Depends(get_current_active_doctor)
+):
     """Get the current authenticated doctor's information"""
-    return current_doctor
+    # The principal only carries what authorization needs; the profile is read here
+    return get_doctor(db, current_doctor.id)
 
 @router.get("/{doctor_id}", response_model=DoctorResponse)
 def read_doctor(
@@ -77,7 +81,7 @@ def edit_doctor(
     doctor_id: int, 
     doctor_update: DoctorUpdate, 
     db: Session = Depends(get_db),
-    current_doctor: Doctor = Depends(get_current_active_doctor)
+    current_doctor: UserInfo = Depends(get_current_active_doctor)
 ):
     """Update a doctor - requires authentication"""
     # Only allow doctors to update their own profile
@@ -93,7 +97,7 @@ def edit_doctor(
 def remove_doctor(
     doctor_id: int, 
     db: Session = Depends(get_db),
-    current_doctor: Doctor = Depends(get_current_active_doctor)
+    current_doctor: UserInfo = Depends(get_current_active_doctor)
 ):
     """Delete a doctor - requires authentication"""
     # Only allow doctors to delete their own profile
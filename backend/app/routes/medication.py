@@ -1,29 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException
+import io
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Response, UploadFile
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Literal, Optional
 from app.database import get_db
-from app.models.medication import Medication
 from app.schemas.medication import (
     MedicationCreate,
     MedicationResponse,
-    MedicationUpdate
+    MedicationImportReport,
+    MedicationBatchLookup,
+    MAX_LOOKUP_BATCH,
+    MedicationUpdate,
+    ReorderReport
 )
+from app.schemas.stock_movement import StockMovementResponse, StockReceipt
 from app.crud.medication import (
     create_medication,
     get_medication,
     get_medication_by_name,
+    get_medications_by_names,
     update_medication,
-    delete_medication
+    delete_medication,
+    get_catalog_json
 )
-from app.auth.jwt import get_current_pharmacist, get_current_active_pharmacist
-from app.models.pharmacist import Pharmacist
+from app.crud.stock import get_movements, receive_stock
+from app.forecast import get_reorder_report
+from app.catalog_import import guess_format, import_medications
+from app.cache import catalog_cache, etag_matches
+from app.search import search_medications
+from app.auth.jwt import get_current_active_pharmacist, UserInfo
 
 router = APIRouter(prefix="/medications", tags=["medications"])
 
 @router.post("/", response_model=MedicationResponse)
 def add_medication(
     medication: MedicationCreate, 
-    current_pharmacist: Pharmacist = Depends(get_current_active_pharmacist),
+    current_pharmacist: UserInfo = Depends(get_current_active_pharmacist),
     db: Session = Depends(get_db)
 ):
     # Only pharmacists can add medications (enforced by the dependency)
@@ -31,9 +42,98 @@ def add_medication(
         raise HTTPException(status_code=400, detail="Medication already exists")
     return create_medication(db, medication)
 
+@router.post("/import", response_model=MedicationImportReport)
+def import_medication_catalog(
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "ndjson"]] = Query(None, description="Defaults to the file extension"),
+    current_pharmacist: UserInfo = Depends(get_current_active_pharmacist),
+    db: Session = Depends(get_db)
+):
+    """
+    Create or update medications in bulk from a CSV (with a header row) or NDJSON file - pharmacists only
+
+    Columns: name, description, dosage_form, strength, price, stock_quantity.
+    Existing medications (matched by name) are updated but keep their stock.
+    """
+    format = format or guess_format(file.filename)
+    if not format:
+        raise HTTPException(status_code=400, detail="Cannot tell the file format, pass format=csv or format=ndjson")
+    # The upload is spooled to disk by the server and read back line by line
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        return import_medications(db, stream, format)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="The file must be UTF-8 encoded")
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    finally:
+        stream.detach()
+
+@router.post("/receive", response_model=List[MedicationResponse])
+def receive_medications(
+    receipt: StockReceipt,
+    current_pharmacist: UserInfo = Depends(get_current_active_pharmacist),
+    db: Session = Depends(get_db)
+):
+    # A whole delivery in one transaction; repeated medications are added up
+    lines = [(line.medication_id, line.quantity) for line in receipt.lines]
+    return receive_stock(db, lines, note=receipt.note)
+
 @router.get("/", response_model=List[MedicationResponse])
-def list_medications(db: Session = Depends(get_db)):
-    return db.query(Medication).all()
+def list_medications(
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    # Served from the catalog cache; clients revalidate with If-None-Match and get a 304 when nothing changed
+    payload, etag = catalog_cache.get(lambda: get_catalog_json(db))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+@router.get("/search", response_model=List[MedicationResponse])
+def search_medication_catalog(
+    q: str = Query(..., min_length=1, max_length=100),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """
+    Search medications by name, description and strength, best matches first
+
+    - q: Words to look for; each one may be part of a word ("aspi", "500mg").
+      When nothing contains them all, close spellings are returned instead ("asprin")
+    """
+    return search_medications(db, q, skip, limit)
+
+@router.get("/by-names", response_model=MedicationBatchLookup)
+def read_medications_by_names(
+    names: List[str] = Query(..., min_length=1, max_length=MAX_LOOKUP_BATCH),
+    db: Session = Depends(get_db)
+):
+    """
+    Look up many medications by name in one request (?names=Aspirin&names=Ibuprofen)
+
+    Names that match nothing are listed in missing instead of failing the request.
+    """
+    by_name = {medication.name: medication for medication in get_medications_by_names(db, names)}
+    names = list(dict.fromkeys(names))
+    return {
+        "medications": [by_name[name] for name in names if name in by_name],
+        "missing": [name for name in names if name not in by_name],
+    }
+
+@router.get("/reorder-report", response_model=ReorderReport)
+def read_reorder_report(
+    only_reorder: bool = False,
+    current_pharmacist: UserInfo = Depends(get_current_active_pharmacist),
+    db: Session = Depends(get_db)
+):
+    # Served from the last forecast run (see app/forecast.py), so this is a cheap read
+    report = get_reorder_report(db)
+    if only_reorder:
+        report = {**report, "items": [item for item in report["items"] if item["reorder"]]}
+    return report
 
 @router.get("/{medication_id}", response_model=MedicationResponse)
 def read_medication(medication_id: int, db: Session = Depends(get_db)):
@@ -49,11 +149,24 @@ def read_medication_by_name(medication_name:str ,db:Session=Depends(get_db)):
         raise HTTPException(status_code=404, detail="Medication not found")
     return db_medication
 
+@router.get("/{medication_id}/movements", response_model=List[StockMovementResponse])
+def read_medication_movements(
+    medication_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    current_pharmacist: UserInfo = Depends(get_current_active_pharmacist),
+    db: Session = Depends(get_db)
+):
+    # Stock history, newest first: every dispense, receipt, adjustment and return
+    if not get_medication(db, medication_id):
+        raise HTTPException(status_code=404, detail="Medication not found")
+    return get_movements(db, medication_id, skip, limit)
+
 @router.patch("/{medication_id}", response_model=MedicationResponse)
 def edit_medication(
     medication_id: int, 
     medication: MedicationUpdate, 
-    current_pharmacist: Pharmacist = Depends(get_current_active_pharmacist),
+    current_pharmacist: UserInfo = Depends(get_current_active_pharmacist),
     db: Session = Depends(get_db)
 ):
     # Only pharmacists can edit medications (enforced by the dependency)
@@ -65,7 +178,7 @@ def edit_medication(
 @router.delete("/{medication_id}")
 def remove_medication(
     medication_id: int, 
-    current_pharmacist: Pharmacist = Depends(get_current_active_pharmacist),
+    current_pharmacist: UserInfo = Depends(get_current_active_pharmacist),
     db: Session = Depends(get_db)
 ):
     # Only pharmacists can delete medications (enforced by the dependency)
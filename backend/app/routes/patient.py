@@ -4,7 +4,7 @@ from typing import List
 from app.database import get_db
 from app.models.patient import Patient
 from app.schemas.patient import PatientCreate, PatientResponse, PatientUpdate
-from app.auth.jwt import get_current_active_patient, get_current_active_pharmacist, get_current_user, get_current_active_doctor
+from app.auth.jwt import get_current_active_patient, get_current_active_pharmacist, get_current_user, get_current_active_doctor, UserInfo
 from app.crud.patient import (
     create_patient,
     get_patient,
@@ -34,9 +34,13 @@ def list_patients(
     return db.query(Patient).all()
 
 @router.get("/me", response_model=PatientResponse)
-def read_current_patient(current_patient: Patient = Depends(get_current_active_patient)):
+def read_current_patient(
+    db: Session = Depends(get_db),
+    current_patient: UserInfo = Depends(get_current_active_patient)
+):
     """Get the current authenticated patient's information"""
-    return current_patient
+    # The principal only carries what authorization needs; the profile is read here
+    return get_patient(db, current_patient.id)
 
 @router.get("/doctor", response_model=List[PatientResponse])
 def list_doctor_patients(
@@ -55,14 +59,14 @@ def read_patient(
     current_user = Depends(get_current_user)
 ):
     """Get a patient by SSN - requires authentication (patient themself or pharmacist)"""
+    # Only allow patients to view their own information or pharmacists to view any patient
+    if current_user.user_type == "patient" and current_user.ssn != ssn:
+        raise HTTPException(status_code=403, detail="Not authorized to view other patient profiles")
+        
     db_patient = get_patient_by_ssn(db, ssn)
     if not db_patient:
         raise HTTPException(status_code=404, detail="Patient not found")
         
-    # Only allow patients to view their own information or pharmacists to view any patient
-    if current_user.user_type == "patient" and db_patient.ssn != ssn:
-        raise HTTPException(status_code=403, detail="Not authorized to view other patient profiles")
-        
     return db_patient
 
 @router.patch("/{ssn}", response_model=PatientResponse)
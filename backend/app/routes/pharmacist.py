@@ -4,7 +4,7 @@ from typing import List
 from app.database import get_db
 from app.models.pharmacist import Pharmacist
 from app.schemas.pharmacist import PharmacistCreate, PharmacistResponse
-from app.auth.jwt import get_current_active_pharmacist
+from app.auth.jwt import get_current_active_pharmacist, UserInfo
 from app.crud.pharmacist import (
     create_pharmacist, 
     get_pharmacist, 
@@ -24,21 +24,25 @@ def register_pharmacist(pharmacist: PharmacistCreate, db: Session = Depends(get_
 @router.get("/", response_model=List[PharmacistResponse])
 def list_pharmacists(
     db: Session = Depends(get_db),
-    current_pharmacist: Pharmacist = Depends(get_current_active_pharmacist)
+    current_pharmacist: UserInfo = Depends(get_current_active_pharmacist)
 ):
     """List all pharmacists - requires authentication"""
     return db.query(Pharmacist).all()
 
 @router.get("/me", response_model=PharmacistResponse)
-def read_current_pharmacist(current_pharmacist: Pharmacist = Depends(get_current_active_pharmacist)):
+def read_current_pharmacist(
+    db: Session = Depends(get_db),
+    current_pharmacist: UserInfo = Depends(get_current_active_pharmacist)
+):
     """Get the current authenticated pharmacist's information"""
-    return current_pharmacist
+    # The principal only carries what authorization needs; the profile is read here
+    return get_pharmacist(db, current_pharmacist.id)
 
 @router.get("/{pharmacist_id}", response_model=PharmacistResponse)
 def read_pharmacist(
     pharmacist_id: int, 
     db: Session = Depends(get_db),
-    current_pharmacist: Pharmacist = Depends(get_current_active_pharmacist)
+    current_pharmacist: UserInfo = Depends(get_current_active_pharmacist)
 ):
     """Get a pharmacist by ID - requires authentication"""
     db_pharmacist = get_pharmacist(db, pharmacist_id)
@@ -50,7 +54,7 @@ def read_pharmacist(
 def read_pharmacist_by_license(
     license_number: str, 
     db: Session = Depends(get_db),
-    current_pharmacist: Pharmacist = Depends(get_current_active_pharmacist)
+    current_pharmacist: UserInfo = Depends(get_current_active_pharmacist)
 ):
     """Get a pharmacist by license number - requires authentication"""
     db_pharmacist = get_pharmacist_by_license(db, license_number)
@@ -63,7 +67,7 @@ def edit_pharmacist(
     pharmacist_id: int, 
     pharmacist_update: dict, 
     db: Session = Depends(get_db),
-    current_pharmacist: Pharmacist = Depends(get_current_active_pharmacist)
+    current_pharmacist: UserInfo = Depends(get_current_active_pharmacist)
 ):
     """Update a pharmacist - requires authentication"""
     # Only allow pharmacists to update their own profile
@@ -79,7 +83,7 @@ def edit_pharmacist(
 def remove_pharmacist(
     pharmacist_id: int, 
     db: Session = Depends(get_db),
-    current_pharmacist: Pharmacist = Depends(get_current_active_pharmacist)
+    current_pharmacist: UserInfo = Depends(get_current_active_pharmacist)
 ):
     """Delete a pharmacist - requires authentication"""
     # Add additional authorization check here if needed
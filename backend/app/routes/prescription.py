@@ -1,70 +1,160 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
-from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from typing import List, Literal, Optional, Tuple
 from datetime import date
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.models.prescription import Prescription
-from app.schemas.prescription import PrescriptionCreate, PrescriptionResponse, PrescriptionUpdate
+from app.schemas.prescription import (
+    PrescriptionBatchFulfill,
+    PrescriptionBatchFulfillResponse,
+    PrescriptionBatchLookup,
+    PrescriptionBulkCreate,
+    PrescriptionBulkCreateResponse,
+    PrescriptionCreate,
+    PrescriptionRelease,
+    PrescriptionResponse,
+    PrescriptionUpdate
+)
 from app.models.prescription_medication import PrescriptionMedication
-from app.crud.prescription import create_prescription, get_prescription, fulfill_prescription, update_prescription
+from app.crud.prescription import (
+    create_prescription,
+    create_prescriptions,
+    get_prescription,
+    fulfill_prescription,
+    fulfill_prescriptions,
+    update_prescription,
+    build_prescription_query,
+    paginate_prescription_query,
+    split_prescription_page,
+    count_prescriptions,
+    serialize_prescriptions,
+    get_prescription_details,
+    get_prescriptions_details,
+    get_doctor_prescriptions,
+    get_patient_prescriptions,
+    claim_prescriptions,
+    release_prescriptions,
+    PRESCRIPTION_LEASE_SECONDS,
+    MAX_PRESCRIPTION_LEASE_SECONDS
+)
 from app.auth.jwt import get_current_doctor, get_current_pharmacist, get_current_patient, get_current_user, UserInfo
-from app.models.doctor import Doctor
-from app.models.patient import Patient
-from app.models.pharmacist import Pharmacist
+from app.schemas.medication import MAX_LOOKUP_BATCH
+from app.cache import catalog_cache
+from app.idempotency import MAX_IDEMPOTENCY_KEY_LENGTH, request_fingerprint, run_idempotent
 
 router = APIRouter(prefix="/prescriptions", tags=["prescriptions"])
 
+def viewer_scope(current_user: UserInfo) -> Tuple[Optional[str], Optional[str]]:
+    """
+    The (doctor_license, patient_ssn) a user may view prescriptions for.
+
+    Pharmacists view everything, (None, None); doctors the prescriptions they
+    wrote, patients their own. Anyone else is refused. Read from the
+    principal, so checking costs no query.
+    """
+    if current_user.user_type == "pharmacist":
+        return None, None
+    if current_user.user_type == "doctor":
+        return current_user.license_number, None
+    if current_user.user_type == "patient":
+        return None, current_user.ssn
+    raise HTTPException(status_code=403, detail="Unauthorized")
+
+def view_denied(prescription: dict, scope: Tuple[Optional[str], Optional[str]]) -> Optional[str]:
+    """Why a prescription is outside the viewer's scope, or None when they may view it"""
+    doctor_license, patient_ssn = scope
+    if doctor_license is not None and prescription["doctor_license"] != doctor_license:
+        return "You can only view prescriptions you created"
+    if patient_ssn is not None and prescription["patient_ssn"] != patient_ssn:
+        return "You can only view your own prescriptions"
+    return None
+
+def serialize_prescription(prescription: Prescription) -> str:
+    return PrescriptionResponse.model_validate(prescription).model_dump_json()
+
 @router.post("/", response_model=PrescriptionResponse)
 def create_new_prescription(
     prescription: PrescriptionCreate, 
-    current_doctor: Doctor = Depends(get_current_doctor),
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_IDEMPOTENCY_KEY_LENGTH),
+    current_doctor: UserInfo = Depends(get_current_doctor),
     db: Session = Depends(get_db)
 ):
     # Only doctors can create prescriptions
-    # Ensure the doctor creating the prescription is using their own license
-    if current_doctor.license_number != prescription.doctor_license:
-        raise HTTPException(
-            status_code=403, 
-            detail="You can only create prescriptions with your own license number"
-        )
-    
-    return create_prescription(db, prescription)
+    def create():
+        # Ensure the doctor creating the prescription is using their own license
+        if current_doctor.license_number != prescription.doctor_license:
+            raise HTTPException(
+                status_code=403, 
+                detail="You can only create prescriptions with your own license number"
+            )
+        return create_prescription(db, prescription)
+
+    # A retry with the same Idempotency-Key replays the first response instead of creating a duplicate
+    return run_idempotent(
+        db,
+        f"doctor:{current_doctor.email}",
+        idempotency_key,
+        request_fingerprint(request.method, request.url.path, prescription.model_dump_json()),
+        create,
+        serialize_prescription
+    )
+
+@router.post("/bulk", response_model=PrescriptionBulkCreateResponse)
+def create_prescriptions_endpoint(
+    batch: PrescriptionBulkCreate,
+    current_doctor: UserInfo = Depends(get_current_doctor),
+    db: Session = Depends(get_db)
+):
+    """
+    Create up to 500 prescriptions in one request, for EHR integrations
+
+    Each prescription follows the rules of POST /prescriptions/, including the
+    doctor's own license number. Results come back in request order.
+    """
+    outcome = create_prescriptions(
+        db,
+        batch.prescriptions,
+        all_or_nothing=batch.mode == "all_or_nothing",
+        doctor_license=current_doctor.license_number
+    )
+    return {"mode": batch.mode, **outcome}
 
 # Fixed routes with specific paths must come BEFORE variable routes
 @router.get("/doctor", response_model=List[PrescriptionResponse])
 async def get_doctor_prescriptions_endpoint(
-    current_doctor: Doctor = Depends(get_current_doctor),
-    db: Session = Depends(get_db)
+    current_doctor: UserInfo = Depends(get_current_doctor),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all prescriptions written by the currently authenticated doctor"""
-    from app.crud.prescription import get_doctor_prescriptions
-    
     # Get prescriptions for the current doctor using their license number
-    prescriptions = get_doctor_prescriptions(db, current_doctor.license_number)
+    prescriptions = await get_doctor_prescriptions(db, current_doctor.license_number)
     
     # Return all prescriptions written by this doctor
     return prescriptions
 
 @router.get("/patient", response_model=List[PrescriptionResponse])
 async def get_patient_prescriptions_endpoint(
-    current_patient: Patient = Depends(get_current_patient),
-    db: Session = Depends(get_db)
+    current_patient: UserInfo = Depends(get_current_patient),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all prescriptions for the currently authenticated patient"""
-    from app.crud.prescription import get_patient_prescriptions
-    
     # Get prescriptions for the current patient using their SSN
-    prescriptions = get_patient_prescriptions(db, current_patient.ssn)
+    prescriptions = await get_patient_prescriptions(db, current_patient.ssn)
     
     # Return all prescriptions for this patient
     return prescriptions
 
 @router.get("/all", response_model=List[PrescriptionResponse])
 async def get_all_prescriptions(
-    current_pharmacist: Pharmacist = Depends(get_current_pharmacist),
-    db: Session = Depends(get_db),
+    response: Response,
+    current_pharmacist: UserInfo = Depends(get_current_pharmacist),
+    db: AsyncSession = Depends(get_async_db),
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = None,
+    total: Optional[Literal["exact", "estimate"]] = None,
     patient_ssn: Optional[str] = None,
     doctor_license: Optional[str] = None,
     status: Optional[str] = None,
@@ -79,153 +169,150 @@ async def get_all_prescriptions(
     - status: Filter by status (pending/fulfilled)
     - start_date: Filter prescriptions issued on or after this date
     - end_date: Filter prescriptions issued on or before this date
+    - cursor: Value of the X-Next-Cursor header from the previous page; takes precedence over skip
+    - total: "exact" or "estimate" to receive the X-Total-Count header (not computed by default)
     """
     # Only pharmacists can access all prescriptions
     # The get_current_pharmacist dependency already ensures this
+    query = build_prescription_query(
+        patient_ssn=patient_ssn,
+        doctor_license=doctor_license,
+        status=status,
+        start_date=start_date,
+        end_date=end_date
+    )
     
-    # Start building the query
-    # Modified to join with Patient and Doctor to get names
-    query = db.query(Prescription, Patient.name.label("patient_name"), Doctor.name.label("doctor_name")).\
-        join(Patient, Prescription.patient_ssn == Patient.ssn).\
-        join(Doctor, Prescription.doctor_license == Doctor.license_number)
-    
-    # Apply filters if provided
-    if patient_ssn:
-        query = query.filter(Prescription.patient_ssn == patient_ssn)
-    
-    if doctor_license:
-        query = query.filter(Prescription.doctor_license == doctor_license)
-    
-    if status:
-        query = query.filter(Prescription.status == status)
-    
-    if start_date:
-        query = query.filter(Prescription.date_issued >= start_date)
-    
-    if end_date:
-        query = query.filter(Prescription.date_issued <= end_date)
-        
-    # Get total count for pagination info
-    # Need to adapt count() for join query
-    total = query.count()
+    try:
+        page_query = paginate_prescription_query(query, limit, cursor=cursor, skip=skip)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    results, next_cursor = split_prescription_page((await db.execute(page_query)).all(), limit)
     
-    # Apply pagination and fetch results
-    results = query.order_by(Prescription.date_issued.desc()).offset(skip).limit(limit).all()
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
-    # Process results to include names
-    prescriptions = []
-    for result in results:
-        prescription, patient_name, doctor_name = result
-        
-        # Load medications for the prescription
-        medications = db.query(PrescriptionMedication).filter(
-            PrescriptionMedication.prescription_id == prescription.id
-        ).all()
-        
-        # Create a dictionary representation of the prescription with names
-        prescription_dict = {
-            "id": prescription.id,
-            "patient_ssn": prescription.patient_ssn,
-            "doctor_license": prescription.doctor_license,
-            "date_issued": prescription.date_issued,
-            "status": prescription.status,
-            "medications": medications,
-            "patient_name": patient_name,
-            "doctor_name": doctor_name
-        }
-        
-        prescriptions.append(prescription_dict)
+    # The total is opt-in: an exact COUNT over the join, or a cached estimate
+    if total == "exact":
+        response.headers["X-Total-Count"] = str(await count_prescriptions(db, query))
+    elif total == "estimate":
+        cache_key = (patient_ssn, doctor_license, status, start_date, end_date)
+        response.headers["X-Total-Count"] = str(await count_prescriptions(db, query, cache_key=cache_key))
     
-    return prescriptions
+    # Names come from the join, medication lines from a single batched query
+    return await serialize_prescriptions(db, results)
+
+@router.post("/queue/claim", response_model=List[PrescriptionResponse])
+async def claim_prescriptions_endpoint(
+    current_pharmacist: UserInfo = Depends(get_current_pharmacist),
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = Query(10, ge=1, le=50),
+    lease_seconds: int = Query(PRESCRIPTION_LEASE_SECONDS, ge=1, le=MAX_PRESCRIPTION_LEASE_SECONDS)
+):
+    """
+    Lease the next pending prescriptions to the current pharmacist - pharmacists only
+
+    - limit: How many prescriptions to claim
+    - lease_seconds: How long the others skip them; fulfilling or releasing ends the lease early
+
+    Prescriptions that can be dispensed from current stock come first, then the oldest.
+    """
+    return await claim_prescriptions(db, current_pharmacist.license_number, limit, lease_seconds)
+
+@router.post("/queue/release")
+async def release_prescriptions_endpoint(
+    release: PrescriptionRelease,
+    current_pharmacist: UserInfo = Depends(get_current_pharmacist),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Only the pharmacist holding a lease can release it
+    released = await release_prescriptions(db, current_pharmacist.license_number, release.prescription_ids)
+    return {"released": released}
+
+@router.get("/by-ids", response_model=PrescriptionBatchLookup)
+async def get_prescriptions_by_ids_endpoint(
+    ids: List[int] = Query(..., min_length=1, max_length=MAX_LOOKUP_BATCH),
+    current_user: UserInfo = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Look up many prescriptions in one request (?ids=1&ids=2)
+
+    Each prescription is checked like GET /prescriptions/{id}: those that do not
+    exist are listed in missing, those the caller may not view in forbidden.
+    """
+    scope = viewer_scope(current_user)
+    ids = list(dict.fromkeys(ids))
+    by_id = {prescription["id"]: prescription for prescription in await get_prescriptions_details(db, ids)}
+
+    visible, missing, forbidden = [], [], []
+    for prescription_id in ids:
+        prescription = by_id.get(prescription_id)
+        if prescription is None:
+            missing.append(prescription_id)
+        elif view_denied(prescription, scope):
+            forbidden.append(prescription_id)
+        else:
+            visible.append(prescription)
+    return {"prescriptions": visible, "missing": missing, "forbidden": forbidden}
 
 # Variable path parameter routes come AFTER the fixed routes
 @router.get("/{prescription_id}", response_model=PrescriptionResponse)
 async def get_prescription_endpoint(
     prescription_id: int, 
     current_user: UserInfo = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Query prescription with join to get patient and doctor names
-    result = db.query(
-        Prescription, 
-        Patient.name.label("patient_name"), 
-        Doctor.name.label("doctor_name")
-    ).join(
-        Patient, Prescription.patient_ssn == Patient.ssn
-    ).join(
-        Doctor, Prescription.doctor_license == Doctor.license_number
-    ).filter(
-        Prescription.id == prescription_id
-    ).first()
-    
-    if not result:
+    prescription = await get_prescription_details(db, prescription_id)
+    if not prescription:
         raise HTTPException(status_code=404, detail="Prescription not found")
     
-    prescription, patient_name, doctor_name = result
-    
     # Authorization check: only pharmacists, the prescribing doctor, or the patient can view
-    if current_user.user_type == "pharmacist":
-        # Pharmacists can view all prescriptions
-        pass
-    elif current_user.user_type == "doctor":
-        # Only the doctor who wrote the prescription can view it
-        doctor = db.query(Doctor).filter(Doctor.email == current_user.email).first()
-        if doctor.license_number != prescription.doctor_license:
-            raise HTTPException(status_code=403, detail="You can only view prescriptions you created")
-    elif current_user.user_type == "patient":
-        # Only the patient to whom the prescription belongs can view it
-        patient = db.query(Patient).filter(Patient.email == current_user.email).first()
-        if patient.ssn != prescription.patient_ssn:
-            raise HTTPException(status_code=403, detail="You can only view your own prescriptions")
-    else:
-        raise HTTPException(status_code=403, detail="Unauthorized")
+    denied = view_denied(prescription, viewer_scope(current_user))
+    if denied:
+        raise HTTPException(status_code=403, detail=denied)
     
-    # Load medications for the prescription with complete details
-    medications_data = db.query(PrescriptionMedication).filter(
-        PrescriptionMedication.prescription_id == prescription.id
-    ).all()
-    
-    # Create the formatted medications list with complete information
-    medications = []
-    for med in medications_data:
-        medications.append({
-            "id": med.id,
-            "prescription_id": med.prescription_id,
-            "medication_name": med.medication_name,
-            "dosage": med.dosage,
-            "frequency": med.frequency,
-            "duration": med.duration
-        })
-    
-    # Create response with names included
-    prescription_dict = {
-        "id": prescription.id,
-        "patient_ssn": prescription.patient_ssn,
-        "doctor_license": prescription.doctor_license,
-        "date_issued": prescription.date_issued,
-        "status": prescription.status,
-        "medications": medications,
-        "patient_name": patient_name,
-        "doctor_name": doctor_name
-    }
-    
-    return prescription_dict
+    return prescription
+
+@router.post("/fulfill-batch", response_model=PrescriptionBatchFulfillResponse)
+def fulfill_prescriptions_endpoint(
+    batch: PrescriptionBatchFulfill,
+    current_pharmacist: UserInfo = Depends(get_current_pharmacist),
+    db: Session = Depends(get_db)
+):
+    # One authenticated request and one commit for a whole counter queue
+    outcome = fulfill_prescriptions(
+        db,
+        batch.prescription_ids,
+        all_or_nothing=batch.mode == "all_or_nothing",
+        pharmacist_license=current_pharmacist.license_number
+    )
+    return {"mode": batch.mode, **outcome}
 
 @router.patch("/{prescription_id}/fulfill", response_model=PrescriptionResponse)
 def fulfill_prescription_endpoint(
     prescription_id: int, 
-    current_pharmacist: Pharmacist = Depends(get_current_pharmacist),
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_IDEMPOTENCY_KEY_LENGTH),
+    current_pharmacist: UserInfo = Depends(get_current_pharmacist),
     db: Session = Depends(get_db)
 ):
     # Only pharmacists can fulfill prescriptions
     # The get_current_pharmacist dependency already ensures this
-    return fulfill_prescription(db, prescription_id)
+    # A retry with the same Idempotency-Key gets the first outcome back rather than "already fulfilled"
+    return run_idempotent(
+        db,
+        f"pharmacist:{current_pharmacist.email}",
+        idempotency_key,
+        request_fingerprint(request.method, request.url.path),
+        lambda: fulfill_prescription(db, prescription_id, pharmacist_license=current_pharmacist.license_number),
+        serialize_prescription
+    )
 
 @router.patch("/{prescription_id}", response_model=PrescriptionResponse)
 def update_prescription_endpoint(
     prescription_id: int, 
     prescription_update: PrescriptionUpdate,
-    current_doctor: Doctor = Depends(get_current_doctor),
+    current_doctor: UserInfo = Depends(get_current_doctor),
     db: Session = Depends(get_db)
 ):
     # First check if the prescription exists
@@ -252,7 +339,7 @@ def update_prescription_endpoint(
 @router.delete("/{prescription_id}", status_code=204)
 def delete_prescription_endpoint(
     prescription_id: int,
-    current_doctor: Doctor = Depends(get_current_doctor),
+    current_doctor: UserInfo = Depends(get_current_doctor),
     db: Session = Depends(get_db)
 ):
     """
@@ -284,5 +371,7 @@ def delete_prescription_endpoint(
     # Delete the prescription
     db.query(Prescription).filter(Prescription.id == prescription_id).delete()
     db.commit()
+    # Its stock reservations went with it
+    catalog_cache.invalidate()
     
     return None  # 204 No Content response doesn't need a body
\ No newline at end of file
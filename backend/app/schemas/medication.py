@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import List, Optional
 
 class MedicationCreate(BaseModel):
     name: str
@@ -16,6 +17,8 @@ class MedicationResponse(BaseModel):
     dosage_form: str
     strength: str
     stock_quantity: int
+    reserved_quantity: int = 0  # Held for pending prescriptions
+    available_quantity: int = 0  # stock_quantity - reserved_quantity
     price: float
 
     model_config = {
@@ -29,4 +32,49 @@ class MedicationUpdate(BaseModel):
     dosage_form: Optional[str] = None
     strength: Optional[str] = None
     stock_quantity: Optional[int] = None
-    price: Optional[float] = None
\ No newline at end of file
+    price: Optional[float] = None
+
+class MedicationImport(BaseModel):
+    """One row of a catalog import; stock_quantity is only used for new medications"""
+    name: str = Field(min_length=1)
+    description: Optional[str] = None
+    dosage_form: str
+    strength: str
+    price: float = Field(ge=0)
+    stock_quantity: int = Field(0, ge=0)
+
+class MedicationImportError(BaseModel):
+    line: int
+    error: str
+
+class MedicationImportReport(BaseModel):
+    processed: int
+    inserted: int
+    updated: int
+    failed: int
+    errors: List[MedicationImportError]  # The first 1000
+
+# Most keys a batch lookup accepts
+MAX_LOOKUP_BATCH = 200
+
+class MedicationBatchLookup(BaseModel):
+    medications: List[MedicationResponse]  # In request order
+    missing: List[str]  # Names that match no medication
+
+class ReorderReportItem(BaseModel):
+    medication_id: int
+    name: str
+    stock_quantity: int
+    forecast_daily_demand: float  # Expected units dispensed per day
+    safety_stock: float
+    reorder_point: int  # Stock below this should be reordered
+    reorder: bool
+    order_quantity: int  # Units that cover the reorder point and one review period of demand
+
+class ReorderReport(BaseModel):
+    generated_at: datetime
+    method: str  # "ewma" or "sma"
+    history_days: int
+    lead_time_days: float
+    review_period_days: float
+    items: List[ReorderReportItem]
@@ -1,12 +1,14 @@
-from pydantic import BaseModel
-from typing import List, Optional
-from datetime import date
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+from datetime import date, datetime
 from app.schemas.prescription_medication import PrescriptionMedicationCreate, PrescriptionMedicationResponse
 
 class PrescriptionCreate(BaseModel):
     patient_ssn: str
     doctor_license: str
     medications: List[PrescriptionMedicationCreate]
+    # Hold the prescribed stock until the prescription is fulfilled or the hold expires
+    reserve_stock: bool = False
 
 # Schema for updating prescriptions - status is excluded as it can only be changed 
 # by pharmacists during fulfillment
@@ -25,6 +27,58 @@ class PrescriptionResponse(BaseModel):
     medications: List[PrescriptionMedicationResponse]
     patient_name: Optional[str] = None  # Add patient name field
     doctor_name: Optional[str] = None   # Add doctor name field
+    claimed_by: Optional[str] = None  # Pharmacist holding the work-queue lease
+    lease_expires_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# Largest batch an integration can create in one request
+MAX_CREATE_BATCH = 500
+
+class PrescriptionBulkCreate(BaseModel):
+    prescriptions: List[PrescriptionCreate] = Field(min_length=1, max_length=MAX_CREATE_BATCH)
+    # "best_effort" creates the valid prescriptions, "all_or_nothing" creates none if any is invalid
+    mode: Literal["best_effort", "all_or_nothing"] = "best_effort"
+
+class PrescriptionCreateResult(BaseModel):
+    index: int  # Position in the request
+    created: bool
+    prescription_id: Optional[int] = None
+    detail: Optional[str] = None  # Why the prescription was not created
+
+class PrescriptionBulkCreateResponse(BaseModel):
+    mode: str
+    committed: bool
+    created: int
+    results: List[PrescriptionCreateResult]
+
+# Most leases a pharmacist can hand back in one request
+MAX_RELEASE_BATCH = 200
+
+class PrescriptionRelease(BaseModel):
+    prescription_ids: List[int] = Field(min_length=1, max_length=MAX_RELEASE_BATCH)
+
+# Largest batch a pharmacist can fulfill in one request
+MAX_FULFILL_BATCH = 200
+
+class PrescriptionBatchFulfill(BaseModel):
+    prescription_ids: List[int] = Field(min_length=1, max_length=MAX_FULFILL_BATCH)
+    # "best_effort" commits what can be dispensed, "all_or_nothing" rolls back on any failure
+    mode: Literal["best_effort", "all_or_nothing"] = "best_effort"
+
+class PrescriptionBatchLookup(BaseModel):
+    prescriptions: List[PrescriptionResponse]  # In request order
+    missing: List[int]  # Ids that match no prescription
+    forbidden: List[int]  # Prescriptions the caller is not allowed to view
+
+class PrescriptionFulfillResult(BaseModel):
+    prescription_id: int
+    fulfilled: bool
+    detail: Optional[str] = None  # Why the prescription was not fulfilled
+
+class PrescriptionBatchFulfillResponse(BaseModel):
+    mode: str
+    committed: bool
+    fulfilled: int
+    results: List[PrescriptionFulfillResult]
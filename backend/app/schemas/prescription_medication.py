@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import Optional
 
 class PrescriptionMedicationCreate(BaseModel):
     medication_name: str  
@@ -9,10 +10,16 @@ class PrescriptionMedicationCreate(BaseModel):
 class PrescriptionMedicationResponse(BaseModel):
     id: int
     prescription_id: int
+    medication_id: Optional[int] = None
     medication_name: str  # Added medication_name field
     dosage: str
     frequency: str
     duration: str
+    # Parsed at write time, used for stock deduction
+    units_per_dose: Optional[float] = None
+    doses_per_day: Optional[float] = None
+    days: Optional[float] = None
+    quantity: Optional[int] = None
 
     class Config:
         from_attributes = True
\ No newline at end of file
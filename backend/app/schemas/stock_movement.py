@@ -0,0 +1,24 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import List, Optional
+
+class StockMovementResponse(BaseModel):
+    id: int
+    medication_id: int
+    kind: str  # "dispense", "receive", "adjust", "return"
+    quantity: int
+    prescription_id: Optional[int] = None
+    note: Optional[str] = None
+    created_at: datetime
+
+    model_config = {
+    "from_attributes": True
+}
+
+class StockReceiptLine(BaseModel):
+    medication_id: int
+    quantity: int = Field(gt=0)
+
+class StockReceipt(BaseModel):
+    lines: List[StockReceiptLine] = Field(min_length=1)
+    note: Optional[str] = None  # e.g. the supplier's delivery note number
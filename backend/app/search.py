@@ -0,0 +1,226 @@
+# app/search.py
+"""
+Medication search by name, description and strength.
+
+SQLite keeps an FTS5 table with the trigram tokenizer in sync through
+triggers; PostgreSQL uses a pg_trgm GIN index over the same text. Both
+answer substring (and so prefix) queries from the index. When nothing
+matches, the query is retried as a fuzzy one, so a typo such as "asprin"
+still finds Aspirin.
+
+The index objects are created by migration 0008 and, for databases built
+with create_all (tests, reset_database), by the DDL events at the bottom of
+this module.
+"""
+import os
+import re
+from typing import List
+
+from sqlalchemy import event, func, literal, literal_column, select, table, column, text
+from sqlalchemy.orm import Session
+
+from app.models.medication import Medication
+
+SEARCH_TABLE = "medications_fts"
+SEARCH_INDEX = "ix_medications_search_trgm"
+
+# Substring matches ranked per query; broader queries rank their first matches only
+SEARCH_RANK_WINDOW = int(os.environ.get("SEARCH_RANK_WINDOW", "1000"))
+# Trigram candidates scored when nothing contains the query
+FUZZY_CANDIDATES = 200
+# Share of a query word's trigrams that a document word must have
+FUZZY_MIN_SIMILARITY = 0.4
+# bm25 weights for name, description and strength
+SQLITE_RANK_WEIGHTS = (10.0, 1.0, 5.0)
+
+SEARCH_DDL = {
+    "sqlite": [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+        "name, description, strength, content='medications', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS medications_fts_insert AFTER INSERT ON medications BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}(rowid, name, description, strength) "
+        "VALUES (new.id, new.name, new.description, new.strength); END",
+        f"CREATE TRIGGER IF NOT EXISTS medications_fts_delete AFTER DELETE ON medications BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, name, description, strength) "
+        "VALUES ('delete', old.id, old.name, old.description, old.strength); END",
+        # Only the searched columns: stock compaction rewrites every row and must not touch the index
+        f"CREATE TRIGGER IF NOT EXISTS medications_fts_update AFTER UPDATE OF name, description, strength "
+        f"ON medications BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, name, description, strength) "
+        "VALUES ('delete', old.id, old.name, old.description, old.strength); "
+        f"INSERT INTO {SEARCH_TABLE}(rowid, name, description, strength) "
+        "VALUES (new.id, new.name, new.description, new.strength); END",
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')",
+    ],
+    "postgresql": [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        f"CREATE INDEX IF NOT EXISTS {SEARCH_INDEX} ON medications USING gin ("
+        "(lower(name || ' ' || coalesce(description, '') || ' ' || coalesce(strength, ''))) gin_trgm_ops)",
+    ],
+}
+
+DROP_SEARCH_DDL = {
+    "sqlite": [
+        "DROP TRIGGER IF EXISTS medications_fts_insert",
+        "DROP TRIGGER IF EXISTS medications_fts_delete",
+        "DROP TRIGGER IF EXISTS medications_fts_update",
+        f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+    ],
+    "postgresql": [f"DROP INDEX IF EXISTS {SEARCH_INDEX}"],
+}
+
+def create_search_index(connection):
+    for statement in SEARCH_DDL.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+
+def drop_search_index(connection):
+    for statement in DROP_SEARCH_DDL.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+
+def is_search_object(name: str) -> bool:
+    """Index objects that live outside Base.metadata, for Alembic's autogenerate"""
+    return name.startswith(SEARCH_TABLE) or name == SEARCH_INDEX
+
+def _words(q: str) -> List[str]:
+    return [word for word in re.split(r"\s+", q.lower().strip()) if word]
+
+def _trigrams(word: str) -> set:
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+def _fuzzy_terms(word: str) -> set:
+    """Substrings of which a word with one typo still contains at least one"""
+    if len(word) < 6:
+        return _trigrams(word)
+    # A single edit lands in one half, so the other half is intact
+    middle = len(word) // 2
+    return {word[:middle], word[middle:]}
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+def _similarity(word: str, document: str) -> float:
+    """Best trigram overlap between a query word and any word of the document, padded like pg_trgm"""
+    grams = _trigrams(f"  {word} ")
+    best = 0.0
+    for candidate in _words(document):
+        other = _trigrams(f"  {candidate} ")
+        if grams and other:
+            best = max(best, len(grams & other) / len(grams | other))
+    return best
+
+def _score(words: List[str], name: str, description: str, strength: str) -> float:
+    # Name matches count fully, description and strength ones half
+    document = " ".join(filter(None, (description, strength)))
+    return sum(max(_similarity(word, name or ""), _similarity(word, document) / 2) for word in words) / len(words)
+
+def _search_document():
+    # Same expression as the PostgreSQL index, so the planner can use it
+    space = literal_column("' '")
+    return func.lower(
+        Medication.name + space + func.coalesce(Medication.description, "") + space + func.coalesce(Medication.strength, "")
+    )
+
+def _fts():
+    return table(SEARCH_TABLE, column("rowid"), column("name"), column("description"), column("strength"))
+
+def _matches_sqlite(words: List[str], window: int):
+    fts = _fts()
+    # Each word as a substring of any column; the tokenizer needs three characters
+    match = " AND ".join(_fts_phrase(word) for word in words if len(word) >= 3)
+    query = select(
+        fts.c.rowid.label("id"),
+        func.bm25(literal_column(SEARCH_TABLE), *SQLITE_RANK_WEIGHTS).label("score")
+    ).where(literal_column(SEARCH_TABLE).op("MATCH")(match))
+    for word in words:
+        if len(word) < 3:
+            query = query.where(
+                fts.c.name.contains(word, autoescape=True)
+                | fts.c.description.contains(word, autoescape=True)
+                | fts.c.strength.contains(word, autoescape=True)
+            )
+    # Lower bm25 is better
+    return query.limit(window).subquery(), False
+
+def _candidates_sqlite(words: List[str]):
+    fts = _fts()
+    terms = sorted(set().union(*(_fuzzy_terms(word) for word in words)))
+    # Typos are looked for in names only, which keeps the candidate set small
+    match = "name : (" + " OR ".join(_fts_phrase(term) for term in terms) + ")"
+    return (
+        select(fts.c.rowid, fts.c.name, fts.c.description, fts.c.strength)
+        .where(literal_column(SEARCH_TABLE).op("MATCH")(match))
+        .order_by(func.bm25(literal_column(SEARCH_TABLE), *SQLITE_RANK_WEIGHTS))
+        .limit(FUZZY_CANDIDATES)
+    )
+
+def _matches_postgresql(words: List[str], window: int):
+    document = _search_document()
+    query = select(Medication.id.label("id"), func.word_similarity(" ".join(words), document).label("score"))
+    for word in words:
+        query = query.where(document.contains(word, autoescape=True))
+    return query.limit(window).subquery(), True
+
+def _candidates_postgresql(words: List[str]):
+    document = _search_document()
+    q = " ".join(words)
+    return (
+        select(Medication.id, Medication.name, Medication.description, Medication.strength)
+        .where(literal(q).op("<%")(document))
+        .order_by(func.word_similarity(q, document).desc())
+        .limit(FUZZY_CANDIDATES)
+    )
+
+SEARCH_QUERIES = {
+    "sqlite": (_matches_sqlite, _candidates_sqlite),
+    "postgresql": (_matches_postgresql, _candidates_postgresql),
+}
+
+def _load(db: Session, ids: List[int]) -> List[Medication]:
+    medications = {medication.id: medication for medication in db.query(Medication).filter(Medication.id.in_(ids))}
+    return [medications[medication_id] for medication_id in ids if medication_id in medications]
+
+def search_medications(db: Session, q: str, skip: int = 0, limit: int = 20) -> List[Medication]:
+    """Names starting with q first, then other substring matches; close spellings when there are none"""
+    words = _words(q)
+    if not words:
+        return []
+    prefix = " ".join(words)
+    if all(len(word) < 3 for word in words):
+        # Too short for trigrams: a name prefix, walked in index order
+        return (
+            db.query(Medication)
+            .filter(func.lower(Medication.name).startswith(prefix, autoescape=True))
+            .order_by(Medication.name)
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+
+    matches_query, candidates_query = SEARCH_QUERIES[db.get_bind().dialect.name]
+    # Only a bounded window of matches is ranked, so broad queries cost the same as narrow ones
+    matches, higher_is_better = matches_query(words, max(SEARCH_RANK_WINDOW, skip + limit))
+    ranked = (
+        select(matches.c.id)
+        .join(Medication, Medication.id == matches.c.id)
+        .order_by(
+            func.lower(Medication.name).startswith(prefix, autoescape=True).desc(),
+            matches.c.score.desc() if higher_is_better else matches.c.score,
+            matches.c.id
+        )
+    )
+    ids = db.execute(ranked.offset(skip).limit(limit)).scalars().all()
+    if ids or (skip and db.execute(ranked.limit(1)).first()):
+        return _load(db, ids)
+
+    # Nothing contains every word: score a bounded set of trigram candidates
+    scored = []
+    for medication_id, name, description, strength in db.execute(candidates_query(words)):
+        score = _score(words, name, description, strength)
+        if score >= FUZZY_MIN_SIMILARITY:
+            scored.append((-score, medication_id))
+    scored.sort()
+    return _load(db, [medication_id for _, medication_id in scored[skip:skip + limit]])
+
+# Databases created from the metadata get the index objects too
+event.listen(Medication.__table__, "after_create", lambda target, connection, **kw: create_search_index(connection))
+event.listen(Medication.__table__, "before_drop", lambda target, connection, **kw: drop_search_index(connection))
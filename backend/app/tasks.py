@@ -0,0 +1,69 @@
+"""
+Background jobs started with the application.
+
+Each job runs on the event loop and hands its database work to a thread, so
+the sync sessions it uses never block request handling.
+"""
+import asyncio
+import logging
+import os
+from typing import Callable
+
+from app.database import SessionLocal
+from app.crud.stock import compact_stock, release_expired_reservations
+from app.forecast import refresh_reorder_report
+from app.idempotency import purge_expired_idempotency_keys
+
+logger = logging.getLogger(__name__)
+
+# Seconds between stock snapshot compactions, 0 disables it
+STOCK_COMPACTION_INTERVAL = float(os.environ.get("STOCK_COMPACTION_INTERVAL", "300"))
+# Seconds between sweeps releasing expired stock reservations, 0 disables it
+RESERVATION_SWEEP_INTERVAL = float(os.environ.get("RESERVATION_SWEEP_INTERVAL", "60"))
+# Seconds between demand forecast runs refreshing the reorder report, 0 disables it
+REORDER_REPORT_INTERVAL = float(os.environ.get("REORDER_REPORT_INTERVAL", "3600"))
+# Seconds between purges of idempotency keys past their replay window, 0 disables it
+IDEMPOTENCY_PURGE_INTERVAL = float(os.environ.get("IDEMPOTENCY_PURGE_INTERVAL", "600"))
+
+def run_with_session(job: Callable):
+    db = SessionLocal()
+    try:
+        return job(db)
+    finally:
+        db.close()
+
+async def run_periodically(name: str, interval: float, job: Callable):
+    """Run a sync job(db) every `interval` seconds until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(run_with_session, job)
+            logger.debug("%s done", name)
+        except Exception:
+            # A failed run is retried at the next interval
+            logger.exception("%s failed", name)
+
+def start_background_tasks() -> list:
+    tasks = []
+    if STOCK_COMPACTION_INTERVAL > 0:
+        tasks.append(asyncio.create_task(
+            run_periodically("stock compaction", STOCK_COMPACTION_INTERVAL, compact_stock)
+        ))
+    if RESERVATION_SWEEP_INTERVAL > 0:
+        tasks.append(asyncio.create_task(
+            run_periodically("reservation sweep", RESERVATION_SWEEP_INTERVAL, release_expired_reservations)
+        ))
+    if REORDER_REPORT_INTERVAL > 0:
+        tasks.append(asyncio.create_task(
+            run_periodically("reorder report", REORDER_REPORT_INTERVAL, refresh_reorder_report)
+        ))
+    if IDEMPOTENCY_PURGE_INTERVAL > 0:
+        tasks.append(asyncio.create_task(
+            run_periodically("idempotency key purge", IDEMPOTENCY_PURGE_INTERVAL, purge_expired_idempotency_keys)
+        ))
+    return tasks
+
+async def stop_background_tasks(tasks: list):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,12 +1,109 @@
 # app/utils.py
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Optional, Tuple
 from passlib.context import CryptContext
+from passlib.hash import bcrypt
+
+logger = logging.getLogger(__name__)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Milliseconds one password hash should take; the bcrypt cost is calibrated to it at startup
+PASSWORD_HASH_TARGET_MS = float(os.environ.get("PASSWORD_HASH_TARGET_MS", "250"))
+# Fixed bcrypt cost, which skips the calibration
+BCRYPT_ROUNDS = os.environ.get("BCRYPT_ROUNDS")
+# Whatever the hardware, the cost stays within these
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 16
+# Cheap cost the calibration measures at; each extra round doubles the time
+CALIBRATION_ROUNDS = 8
+
+# bcrypt computations allowed at once. bcrypt releases the GIL, so each one can use a core;
+# further requests wait in the pool's queue instead of competing for the CPU
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get("PASSWORD_HASH_CONCURRENCY", str(os.cpu_count() or 1)))
+
+class PasswordHasher:
+    """Runs password hashing on its own bounded thread pool, counting what is queued and running"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        """Hashes waiting for a free worker"""
+        return self.submitted - self.started
+
+    @property
+    def running(self) -> int:
+        return self.started - self.completed
+
+    def _run(self, function: Callable, *args):
+        with self._lock:
+            self.started += 1
+        try:
+            return function(*args)
+        finally:
+            with self._lock:
+                self.completed += 1
+
+    def submit(self, function: Callable, *args) -> Future:
+        with self._lock:
+            self.submitted += 1
+        return self._executor.submit(self._run, function, *args)
+
+    async def run(self, function: Callable, *args):
+        """Await function(*args) on the pool without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(function, *args))
+
+password_hasher = PasswordHasher(PASSWORD_HASH_CONCURRENCY)
+
+def calibrate_bcrypt_rounds(target_ms: float = PASSWORD_HASH_TARGET_MS) -> int:
+    """The highest bcrypt cost whose hash takes no longer than target_ms on this machine"""
+    # Best of three, so one descheduled run does not lower the cost
+    elapsed = min(_time_hash(CALIBRATION_ROUNDS) for _ in range(3))
+    rounds = CALIBRATION_ROUNDS + math.floor(math.log2(target_ms / 1000 / elapsed))
+    return max(BCRYPT_MIN_ROUNDS, min(BCRYPT_MAX_ROUNDS, rounds))
+
+def _time_hash(rounds: int) -> float:
+    start = time.perf_counter()
+    bcrypt.using(rounds=rounds).hash("calibration")
+    return time.perf_counter() - start
+
+def configure_password_hashing(rounds: Optional[int] = None) -> int:
+    """
+    Hash new passwords with the given cost, calibrated when None or pinned by BCRYPT_ROUNDS.
+
+    Stored hashes below that cost, or more than one round above it, then need
+    an update and are replaced at the next login. The round of slack keeps
+    workers whose calibrations differ by one from rehashing back and forth;
+    they settle on the higher cost.
+    """
+    if rounds is None:
+        rounds = int(BCRYPT_ROUNDS) if BCRYPT_ROUNDS else calibrate_bcrypt_rounds()
+    pwd_context.update(bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds + 1)
+    logger.info("Hashing passwords with bcrypt cost %d", rounds)
+    return rounds
+
 def get_password_hash(password: str) -> str:
-    """Hash a password for storing."""
-    return pwd_context.hash(password)
+    """Hash a password for storing. Blocks the calling thread until a worker of the pool has done it."""
+    return password_hasher.submit(pwd_context.hash, password).result()
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """(valid, new_hash): new_hash is set when the password is valid but stored with an outdated cost"""
+    return await password_hasher.run(pwd_context.verify_and_update, plain_password, hashed_password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a stored password against one provided by user."""
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+def utcnow() -> datetime:
+    """Naive UTC, the form lease and reservation expiries are stored in."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
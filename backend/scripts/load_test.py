@@ -0,0 +1,64 @@
+"""
+Concurrency load test for the API.
+
+Fires many concurrent requests at one endpoint of a running server and
+reports throughput and latency percentiles. Run it against the same data set
+before and after a change to compare how well a worker handles concurrency:
+
+    uvicorn app.main:app --workers 1
+    python scripts/load_test.py --token <pharmacist token> \\
+        --path "/prescriptions/all?limit=100" --requests 400 --concurrency 50
+
+A handler that blocks the event loop serialises every in-flight request on
+the worker, which shows up as throughput that does not grow with
+--concurrency and a p95 latency close to the total run time.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def run(base_url: str, path: str, token: str, total: int, concurrency: int):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    latencies = []
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=60) as client:
+        async def one_request():
+            nonlocal failures
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{total} requests, concurrency {concurrency}, {failures} failed")
+    print(f"throughput: {total / elapsed:.1f} req/s over {elapsed:.2f}s")
+    print(f"latency p50: {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"latency p95: {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+    print(f"latency max: {latencies[-1] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", default="/prescriptions/all")
+    parser.add_argument("--token", default="", help="Bearer token sent with every request")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.base_url, args.path, args.token, args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,36 @@
 import pytest
 import os
-from sqlalchemy import create_engine
+import tempfile
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.pool import NullPool
 from pathlib import Path
 from fastapi.testclient import TestClient
 from app.main import app
-from app.database import Base , get_db
+from app.database import Base , get_db, get_async_db, create_db_engine, create_async_db_engine
+from app.cache import catalog_cache, principal_cache
+from app.auth.throttle import login_throttle
 
 
-# In-memory with aggressive cleanup
-TEST_DB_URL = "sqlite:///:memory:"
-engine = create_engine(TEST_DB_URL)
-
-# Critical for SQLite foreign key support
-@event.listens_for(engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
-    cursor.close()
+# A throwaway SQLite file, so the sync engine and the aiosqlite engine see the same data.
+# create_db_engine applies the same per-connection pragmas as production, including foreign_keys=ON
+TEST_DB_PATH = Path(tempfile.mkdtemp()) / "test.db"
+engine = create_db_engine(f"sqlite:///{TEST_DB_PATH}")
+# Each TestClient request runs on its own event loop, so async connections must not be pooled
+async_engine = create_async_db_engine(f"sqlite+aiosqlite:///{TEST_DB_PATH}", poolclass=NullPool)
+AsyncTestingSession = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 @pytest.fixture(scope="function")
 def db():
     # Force fresh metadata state
     Base.metadata.drop_all(engine)
     Base.metadata.create_all(engine)
-    
+    # The caches are process-wide and would outlive the database
+    catalog_cache.invalidate()
+    principal_cache.invalidate()
+    login_throttle.backend.clear()
+
     db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
     try:
         yield db
@@ -41,6 +46,29 @@ def client(db):
             yield db
         finally:
             db.rollback()
+
+    async def override_get_async_db():
+        async with AsyncTestingSession() as async_db:
+            yield async_db
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     yield TestClient(app)
-    app.dependency_overrides.clear()
\ No newline at end of file
+    app.dependency_overrides.clear()
+
+@pytest.fixture(scope="function")
+def query_counter():
+    """Collect every SQL statement sent to the test database while the block runs"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = (engine, async_engine.sync_engine)
+    for target in engines:
+        event.listen(target, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        for target in engines:
+            event.remove(target, "before_cursor_execute", before_cursor_execute)
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+from app.auth.throttle import LOGIN_IP_BURST, MemoryBucketBackend
+from app.models.pharmacist import Pharmacist
+from app.utils import (
+    BCRYPT_MAX_ROUNDS,
+    BCRYPT_MIN_ROUNDS,
+    PasswordHasher,
+    calibrate_bcrypt_rounds,
+    configure_password_hashing,
+    password_hasher,
+    pwd_context,
+)
+
+
+def register_and_login(client):
+    response = client.post("/pharmacists/", json={
+        "license_number": "PH-1", "name": "Pharma", "email": "pharma@example.com", "password": "correct-horse"
+    })
+    assert response.status_code == 200
+    return client.post("/auth/token", data={"username": "pharma@example.com", "password": "correct-horse"})
+
+
+def test_login_round_trip(client):
+    response = register_and_login(client)
+    assert response.status_code == 200
+    token = response.json()["access_token"]
+    me = client.get("/pharmacists/me", headers={"Authorization": f"Bearer {token}"})
+    assert me.json()["license_number"] == "PH-1"
+
+    wrong = client.post("/auth/token", data={"username": "pharma@example.com", "password": "wrong-horse"})
+    assert wrong.status_code == 401
+
+
+def test_hashing_is_capped_and_keeps_the_event_loop_free():
+    hasher = PasswordHasher(max_workers=2)
+    running, peak, lock = [0], [0], threading.Lock()
+    depths = []
+
+    def slow_hash(value):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.1)
+        with lock:
+            running[0] -= 1
+        return value
+
+    async def storm():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        clock = asyncio.create_task(ticker())
+        jobs = [asyncio.ensure_future(hasher.run(slow_hash, i)) for i in range(6)]
+        await asyncio.sleep(0.05)
+        depths.append(hasher.queue_depth)
+        results = await asyncio.gather(*jobs)
+        clock.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(storm())
+    assert results == list(range(6))
+    assert peak[0] == 2
+    # Four of the six waited for a worker, and the loop kept running meanwhile
+    assert depths == [4]
+    assert ticks >= 15
+    assert (hasher.queue_depth, hasher.running, hasher.completed) == (0, 0, 6)
+
+
+def test_bad_password_bursts_are_throttled_before_hashing(client):
+    register_and_login(client)
+    bad = {"username": "Pharma@example.com", "password": "wrong-horse"}
+    # The successful login gave its tokens back, so the whole burst is left for failures
+    assert [client.post("/auth/token", data=bad).status_code for _ in range(5)] == [401] * 5
+
+    hashed = password_hasher.submitted
+    throttled = client.post("/auth/token", data=bad)
+    assert throttled.status_code == 429
+    assert int(throttled.headers["Retry-After"]) > 0
+    assert password_hasher.submitted == hashed
+    # Other accounts from the same client are still served
+    other = client.post("/auth/token", data={"username": "other@example.com", "password": "x"})
+    assert other.status_code == 401
+
+
+def test_client_ip_bucket_spans_accounts(client):
+    burst = int(LOGIN_IP_BURST)
+    statuses = [
+        client.post("/auth/doctor-token", data={"username": f"user{i}@example.com", "password": "x"}).status_code
+        for i in range(burst + 1)
+    ]
+    assert statuses == [401] * burst + [429]
+
+
+def test_memory_buckets_refill_and_evict():
+    backend = MemoryBucketBackend(max_keys=2)
+    with patch("app.auth.throttle.time.monotonic", return_value=100.0):
+        assert [backend.take("a", 2, 0.5) for _ in range(3)] == [0, 0, 2.0]
+    with patch("app.auth.throttle.time.monotonic", return_value=102.0):
+        # One token back after 2 seconds at 0.5 per second
+        assert backend.take("a", 2, 0.5) == 0
+        backend.take("b", 2, 0.5)
+        backend.take("c", 2, 0.5)
+        # "a" was least recently used and is forgotten, which leaves it full
+        assert backend.take("a", 2, 0.5) == 0
+        assert len(backend._buckets) == 2
+
+
+def test_calibration_fits_the_cost_to_the_budget():
+    # 4 ms at cost 8 doubles per round: cost 13 takes 128 ms, cost 14 would take 256 ms
+    with patch("app.utils._time_hash", return_value=0.004):
+        assert calibrate_bcrypt_rounds(target_ms=250) == 13
+    # Slow machines still get the minimum, fast ones no more than the maximum
+    with patch("app.utils._time_hash", return_value=1.0):
+        assert calibrate_bcrypt_rounds(target_ms=250) == BCRYPT_MIN_ROUNDS
+    with patch("app.utils._time_hash", return_value=0.00001):
+        assert calibrate_bcrypt_rounds(target_ms=250) == BCRYPT_MAX_ROUNDS
+
+
+def test_login_rehashes_outdated_costs(client, db):
+    saved = pwd_context.to_string()
+    try:
+        configure_password_hashing(11)
+        assert register_and_login(client).status_code == 200
+        pharmacist = db.query(Pharmacist).one()
+        assert pharmacist.hashed_password.startswith("$2b$11$")
+
+        # One round more is within the slack, so it is left alone
+        configure_password_hashing(10)
+        assert client.post("/auth/token", data={"username": "pharma@example.com", "password": "correct-horse"}).status_code == 200
+        db.refresh(pharmacist)
+        assert pharmacist.hashed_password.startswith("$2b$11$")
+
+        configure_password_hashing(12)
+        assert client.post("/auth/token", data={"username": "pharma@example.com", "password": "correct-horse"}).status_code == 200
+        db.refresh(pharmacist)
+        assert pharmacist.hashed_password.startswith("$2b$12$")
+    finally:
+        pwd_context.load(saved)
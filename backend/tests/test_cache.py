@@ -0,0 +1,135 @@
+from unittest.mock import patch
+
+from app.auth.jwt import create_access_token
+from app.cache import LRUCache, MemoryVersionBackend, VersionedCache, catalog_cache, etag_matches, principal_cache
+from app.crud.pharmacist import delete_pharmacist, update_pharmacist
+from app.models.pharmacist import Pharmacist
+from app.schemas.pharmacist import PharmacistUpdate
+
+PHARMACIST = {"Authorization": "Bearer " + create_access_token(
+    data={"sub": "pharma@example.com", "user_type": "pharmacist"}
+)}
+
+
+def add_aspirin(client, db):
+    db.add(Pharmacist(license_number="PH-1", name="Pharma", email="pharma@example.com", hashed_password="x"))
+    db.commit()
+    response = client.post("/medications/", headers=PHARMACIST, json={
+        "name": "Aspirin", "dosage_form": "tablet", "strength": "100mg", "stock_quantity": 50, "price": 2.5
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_catalog_is_served_from_cache_and_revalidated(client, db, query_counter):
+    add_aspirin(client, db)
+
+    first = client.get("/medications/")
+    assert first.status_code == 200
+    assert [m["name"] for m in first.json()] == ["Aspirin"]
+    etag = first.headers["etag"]
+
+    query_counter.clear()
+    hits = catalog_cache.hits
+    second = client.get("/medications/")
+    assert second.content == first.content and second.headers["etag"] == etag
+    assert catalog_cache.hits == hits + 1
+    assert query_counter == []
+
+    not_modified = client.get("/medications/", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+
+def test_writes_invalidate_the_catalog(client, db):
+    aspirin = add_aspirin(client, db)
+    etag = client.get("/medications/").headers["etag"]
+
+    assert client.patch(f"/medications/{aspirin}", headers=PHARMACIST, json={"stock_quantity": 42}).status_code == 200
+    response = client.get("/medications/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()[0]["stock_quantity"] == 42
+    etag = response.headers["etag"]
+
+    response = client.post("/medications/receive", headers=PHARMACIST, json={"lines": [{"medication_id": aspirin, "quantity": 8}]})
+    assert response.status_code == 200
+    response = client.get("/medications/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()[0]["stock_quantity"] == 50
+
+
+def test_workers_sharing_a_backend_see_each_others_invalidations():
+    backend = MemoryVersionBackend()
+    builds = []
+    worker_a, worker_b = VersionedCache("catalog", backend), VersionedCache("catalog", backend)
+
+    def build():
+        builds.append(1)
+        return b"[%d]" % len(builds)
+
+    assert worker_a.get(build) == worker_a.get(build)
+    worker_b.get(build)
+    assert len(builds) == 2
+
+    worker_b.invalidate()
+    payload, etag = worker_a.get(build)
+    assert payload == b"[3]"
+    assert (worker_a.hits, worker_a.misses) == (1, 2)
+
+
+def test_etag_matching():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_principals_are_cached_per_token(client, db, query_counter):
+    add_aspirin(client, db)
+    query_counter.clear()
+    hits = principal_cache.hits
+
+    response = client.get("/pharmacists/me", headers=PHARMACIST)
+    assert response.json()["license_number"] == "PH-1"
+    # Only the profile itself is read, the pharmacist was authenticated from the cache
+    assert len(query_counter) == 1
+    assert principal_cache.hits == hits + 1
+
+
+def test_account_changes_invalidate_principals(client, db):
+    add_aspirin(client, db)
+    pharmacist = db.query(Pharmacist).one()
+
+    update_pharmacist(db, pharmacist.id, PharmacistUpdate(email="new@example.com"))
+    assert client.get("/pharmacists/me", headers=PHARMACIST).status_code == 401
+    renamed = {"Authorization": "Bearer " + create_access_token(
+        data={"sub": "new@example.com", "user_type": "pharmacist"}
+    )}
+    assert client.get("/pharmacists/me", headers=renamed).status_code == 200
+
+    delete_pharmacist(db, pharmacist.id)
+    assert client.get("/pharmacists/me", headers=renamed).status_code == 401
+
+
+def test_lru_cache_bounds_and_expiry():
+    backend = MemoryVersionBackend()
+    cache = LRUCache("test", backend, maxsize=2, ttl=60)
+    for key in ("a", "b"):
+        cache.put(key, key.upper(), cache.version())
+    assert cache.get("a") == "A"
+    # "b" is the least recently used
+    cache.put("c", "C", cache.version())
+    assert (cache.get("b"), cache.get("c")) == (None, "C")
+
+    # A value loaded before an invalidation is never served
+    stale = cache.version()
+    backend.bump("test")
+    cache.put("d", "D", stale)
+    assert cache.get("d") is None
+
+    cache.put("e", "E", cache.version(), ttl=10)
+    with patch("app.cache.time.monotonic", return_value=10 ** 9):
+        assert cache.get("e") is None
+    assert (cache.hits, cache.misses) == (2, 3)
+    assert cache.hit_rate == 0.4
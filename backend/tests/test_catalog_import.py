@@ -0,0 +1,74 @@
+import io
+
+from app.auth.jwt import create_access_token
+from app.catalog_import import import_medications
+from app.crud.stock import reconcile_stock
+from app.models.medication import Medication
+from app.models.pharmacist import Pharmacist
+
+PHARMACIST = {"Authorization": "Bearer " + create_access_token(
+    data={"sub": "pharma@example.com", "user_type": "pharmacist"}
+)}
+
+CATALOG_CSV = """name,description,dosage_form,strength,price,stock_quantity
+Aspirin,Pain,tablet,100mg,2.5,50
+Ibuprofen,,tablet,200mg,3.0,
+Broken,,tablet,1mg,not a price,1
+,,tablet,1mg,1.0,1
+"""
+
+
+def test_csv_upload_inserts_updates_and_reports_bad_rows(client, db):
+    db.add(Pharmacist(license_number="PH-1", name="Pharma", email="pharma@example.com", hashed_password="x"))
+    db.commit()
+
+    response = client.post("/medications/import", headers=PHARMACIST,
+                           files={"file": ("catalog.csv", CATALOG_CSV.encode(), "text/csv")})
+
+    assert response.status_code == 200
+    report = response.json()
+    assert {key: report[key] for key in ("processed", "inserted", "updated", "failed")} == \
+        {"processed": 4, "inserted": 2, "updated": 0, "failed": 2}
+    assert [error["line"] for error in report["errors"]] == [4, 5]
+    assert report["errors"][0]["error"].startswith("price:")
+
+    # Re-importing updates the details but never the stock, which only moves through the ledger
+    updated = CATALOG_CSV.replace("Aspirin,Pain,tablet,100mg,2.5,50", "Aspirin,Pain relief,tablet,100mg,2.0,999")
+    report = client.post("/medications/import", headers=PHARMACIST,
+                         files={"file": ("catalog.csv", updated.encode(), "text/csv")}).json()
+    assert (report["inserted"], report["updated"]) == (0, 2)
+
+    db.expire_all()
+    aspirin = db.query(Medication).filter(Medication.name == "Aspirin").one()
+    assert (aspirin.description, aspirin.price, aspirin.stock_quantity) == ("Pain relief", 2.0, 50)
+    assert db.query(Medication).filter(Medication.name == "Ibuprofen").one().stock_quantity == 0
+    assert reconcile_stock(db, apply=False) == []
+
+
+def test_ndjson_is_imported_chunk_by_chunk(db):
+    lines = [
+        '{"name": "A", "dosage_form": "tablet", "strength": "1mg", "price": 1, "stock_quantity": 5}',
+        "not json",
+        '{"name": "B", "dosage_form": "tablet", "strength": "1mg", "price": 1}',
+        "",
+        '{"name": "A", "dosage_form": "syrup", "strength": "1mg", "price": 1}',
+        '["not", "an", "object"]',
+    ]
+
+    report = import_medications(db, io.StringIO("\n".join(lines)), "ndjson", chunk_size=2)
+
+    assert (report["processed"], report["inserted"], report["updated"], report["failed"]) == (5, 2, 1, 2)
+    assert [(error["line"], error["error"][:12]) for error in report["errors"]] == [(2, "Invalid JSON"), (6, "Expected a J")]
+    assert dict(db.query(Medication.name, Medication.dosage_form).all()) == {"A": "syrup", "B": "tablet"}
+
+
+def test_unsupported_databases_are_refused_with_a_400(client, db, monkeypatch):
+    db.add(Pharmacist(license_number="PH-1", name="Pharma", email="pharma@example.com", hashed_password="x"))
+    db.commit()
+    monkeypatch.setattr(db.get_bind().dialect, "name", "mssql")
+
+    response = client.post("/medications/import", headers=PHARMACIST,
+                           files={"file": ("catalog.csv", CATALOG_CSV.encode(), "text/csv")})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Bulk import is not supported on mssql databases"
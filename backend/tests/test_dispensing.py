@@ -0,0 +1,33 @@
+import pytest
+
+from app.dispensing import dispensing_quantities, parse_days, parse_doses_per_day, parse_units_per_dose
+
+
+@pytest.mark.parametrize("dosage, expected", [
+    ("1 tablet", 1), ("2 tablets", 2), ("1/2 tablet", 0.5), ("two puffs", 2),
+    ("500mg", 1), ("10 ml", 1), ("2 comprimés", 2), ("", 1), ("nn", 1),
+])
+def test_units_per_dose(dosage, expected):
+    assert parse_units_per_dose(dosage) == expected
+
+
+@pytest.mark.parametrize("frequency, expected", [
+    ("once a day", 1), ("twice daily", 2), ("3 times a day", 3), ("TID", 3), ("bid", 2),
+    ("every 8 hours", 3), ("q12h", 2), ("every other day", 0.5), ("once a week", 1 / 7),
+    ("2x/day", 2), ("3 fois /jour", 3), ("toutes les 6 heures", 4), ("as often as needed", 1),
+])
+def test_doses_per_day(frequency, expected):
+    assert parse_doses_per_day(frequency) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("duration, expected", [
+    ("5 days", 5), ("2 weeks", 14), ("1 month", 30), ("10", 10), ("4 jours", 4), ("ongoing", 1),
+])
+def test_days(duration, expected):
+    assert parse_days(duration) == expected
+
+
+def test_quantity_is_rounded_up():
+    assert dispensing_quantities("1 tablet", "twice a day", "5 days")["quantity"] == 10
+    assert dispensing_quantities("1/2 tablet", "once a day", "5 days")["quantity"] == 3
+    assert dispensing_quantities("1 tablet", "once a week", "4 weeks")["quantity"] == 4
@@ -0,0 +1,114 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app import forecast
+from app.auth.jwt import create_access_token
+from app.crud.stock import adjust_stock_to
+from app.models.doctor import Doctor
+from app.models.medication import Medication
+from app.models.patient import Patient
+from app.models.pharmacist import Pharmacist
+from app.models.prescription import Prescription
+from app.models.prescription_medication import PrescriptionMedication
+from app.models.stock_movement import StockMovement
+
+PHARMACIST = {"Authorization": "Bearer " + create_access_token(
+    data={"sub": "pharma@example.com", "user_type": "pharmacist"}
+)}
+
+
+def test_exponential_smoothing_matches_the_recursion():
+    demand = np.array([[1.0, 2.0, 3.0, 4.0], [0.0, 0.0, 0.0, 10.0]])
+    smoothed = demand[:, 0].copy()
+    for day in range(1, demand.shape[1]):
+        smoothed = 0.3 * demand[:, day] + 0.7 * smoothed
+
+    assert forecast.forecast_daily_demand(demand, "ewma", alpha=0.3) == pytest.approx(smoothed)
+    assert forecast.forecast_daily_demand(demand, "sma", window=2) == pytest.approx([3.5, 5.0])
+
+
+def test_reorder_point_covers_lead_time_and_variability():
+    demand = np.array([[2.0, 2.0, 2.0], [0.0, 3.0, 6.0]])
+    safety_stock, reorder_point = forecast.reorder_points(demand, np.array([2.0, 3.0]), lead_time_days=4, service_level_z=2)
+
+    assert safety_stock == pytest.approx([0.0, 2 * 3.0 * 2])
+    assert reorder_point == pytest.approx([8.0, 24.0])
+
+
+@pytest.fixture
+def history(db, monkeypatch):
+    """Aspirin dispensed 5 a day over the whole history window, Ibuprofen never"""
+    monkeypatch.setattr(forecast, "_reorder_report", None)
+    db.add_all([
+        Pharmacist(license_number="PH-1", name="Pharma", email="pharma@example.com", hashed_password="x"),
+        Doctor(license_number="DOC-1", name="Dr. House", email="house@example.com", hashed_password="x"),
+        Patient(ssn="123-45-6789", name="John Doe", date_of_birth=date(1990, 1, 1), email="john@example.com"),
+        Medication(name="Aspirin", dosage_form="tablet", strength="100mg", price=2.5),
+        Medication(name="Ibuprofen", dosage_form="tablet", strength="200mg", price=3.0),
+    ])
+    db.flush()
+    adjust_stock_to(db, 1, 20)
+    adjust_stock_to(db, 2, 20)
+    for day in range(forecast.REORDER_HISTORY_DAYS):
+        prescription = Prescription(patient_ssn="123-45-6789", doctor_license="DOC-1",
+                                    date_issued=date.today() - timedelta(days=day), status="fulfilled")
+        db.add(prescription)
+        db.flush()
+        db.add(PrescriptionMedication(prescription_id=prescription.id, medication_id=1, medication_name="Aspirin",
+                                      dosage="1 tablet", frequency="once a day", duration="5 days", quantity=5))
+    db.commit()
+    return db
+
+
+def test_reorder_report_flags_medications_below_reorder_point(client, history):
+    response = client.get("/medications/reorder-report", headers=PHARMACIST)
+
+    assert response.status_code == 200
+    aspirin, ibuprofen = response.json()["items"]
+    # Steady demand needs no safety stock: 7 days of lead time at 5 a day
+    assert (aspirin["forecast_daily_demand"], aspirin["safety_stock"]) == (5, 0)
+    # The order tops the 20 in stock up to the reorder point plus 7 days of review period
+    assert (aspirin["reorder_point"], aspirin["reorder"], aspirin["order_quantity"]) == (35, True, 50)
+    assert (ibuprofen["reorder_point"], ibuprofen["reorder"]) == (0, False)
+
+    only = client.get("/medications/reorder-report?only_reorder=true", headers=PHARMACIST).json()
+    assert [item["name"] for item in only["items"]] == ["Aspirin"]
+
+
+def test_demand_is_counted_on_the_day_it_was_dispensed(db):
+    db.add_all([
+        Doctor(license_number="DOC-1", name="Dr. House", email="house@example.com", hashed_password="x"),
+        Patient(ssn="123-45-6789", name="John Doe", date_of_birth=date(1990, 1, 1), email="john@example.com"),
+        Medication(name="Aspirin", dosage_form="tablet", strength="100mg", price=2.5),
+    ])
+    today = date.today()
+    # Issued before the window, dispensed three days ago through the ledger
+    ledgered = Prescription(patient_ssn="123-45-6789", doctor_license="DOC-1",
+                            date_issued=today - timedelta(days=400), status="fulfilled")
+    # Fulfilled before the ledger existed, so only its issue date is known
+    legacy = Prescription(patient_ssn="123-45-6789", doctor_license="DOC-1",
+                          date_issued=today - timedelta(days=1), status="fulfilled")
+    db.add_all([ledgered, legacy])
+    db.flush()
+    for prescription in (ledgered, legacy):
+        db.add(PrescriptionMedication(prescription_id=prescription.id, medication_id=1, medication_name="Aspirin",
+                                      dosage="1 tablet", frequency="once a day", duration="4 days", quantity=4))
+    dispensed_at = datetime.combine(today - timedelta(days=3), datetime.min.time()) + timedelta(hours=10)
+    db.add(StockMovement(medication_id=1, kind="dispense", quantity=-4, prescription_id=ledgered.id, created_at=dispensed_at))
+    db.commit()
+
+    _, demand = forecast.load_demand(db, history_days=10, today=today)
+
+    assert demand.tolist() == [[0] * 6 + [4, 0, 4, 0]]
+
+
+def test_reorder_report_is_served_from_the_last_run(client, history):
+    first = client.get("/medications/reorder-report", headers=PHARMACIST).json()
+    adjust_stock_to(history, 1, 100)
+    history.commit()
+
+    assert client.get("/medications/reorder-report", headers=PHARMACIST).json() == first
+    forecast.refresh_reorder_report(history)
+    assert client.get("/medications/reorder-report", headers=PHARMACIST).json()["items"][0]["reorder"] is False
@@ -0,0 +1,708 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import sessionmaker
+
+from app.auth.jwt import create_access_token, principal_claims
+from app.crud.prescription import fulfill_prescription, prescription_count_cache
+from app.crud.stock import adjust_stock_to, release_expired_reservations
+from app.idempotency import purge_expired_idempotency_keys, run_idempotent
+from app.models.doctor import Doctor
+from app.models.idempotency_key import IdempotencyKey
+from app.models.medication import Medication
+from app.models.patient import Patient
+from app.models.pharmacist import Pharmacist
+from app.models.prescription import Prescription
+from app.models.prescription_medication import PrescriptionMedication
+from app.models.stock_reservation import StockReservation
+from app.utils import utcnow
+
+
+def auth_headers(email, user_type):
+    token = create_access_token(data={"sub": email, "user_type": user_type})
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def pharmacy(db):
+    """A pharmacist, a doctor, a patient and two medications"""
+    db.add_all([
+        Pharmacist(license_number="PH-1", name="Pharma", email="pharma@example.com", hashed_password="x"),
+        Doctor(license_number="DOC-1", name="Dr. House", specialization="General",
+               contact_info="555", email="house@example.com", hashed_password="x"),
+        Patient(ssn="123-45-6789", name="John Doe", date_of_birth=date(1990, 1, 1),
+                contact_info="555", email="john@example.com", hashed_password="x"),
+        Medication(name="Aspirin", description="Pain", dosage_form="tablet", strength="100mg", price=2.5),
+        Medication(name="Ibuprofen", description="Pain", dosage_form="tablet", strength="200mg", price=3.0),
+    ])
+    db.flush()
+    set_stock(db, "Aspirin", 50)
+    set_stock(db, "Ibuprofen", 50)
+    db.commit()
+    return db
+
+
+def set_stock(db, name, level):
+    medication = db.query(Medication).filter(Medication.name == name).one()
+    adjust_stock_to(db, medication.id, level)
+
+
+def add_prescriptions(db, count, status="pending"):
+    for i in range(count):
+        prescription = Prescription(
+            patient_ssn="123-45-6789",
+            doctor_license="DOC-1",
+            date_issued=date.today() - timedelta(days=i),
+            status=status
+        )
+        db.add(prescription)
+        db.flush()
+        for medication_id, name in ((1, "Aspirin"), (2, "Ibuprofen")):
+            db.add(PrescriptionMedication(
+                prescription_id=prescription.id,
+                medication_id=medication_id,
+                medication_name=name,
+                dosage="1 tablet",
+                frequency="twice a day",
+                duration="5 days"
+            ))
+    db.commit()
+
+
+@pytest.mark.parametrize("path, email, user_type, expected_queries", [
+    # auth lookup + page + medication lines
+    ("/prescriptions/all", "pharma@example.com", "pharmacist", 3),
+    # auth lookup + prescriptions + medication lines
+    ("/prescriptions/doctor", "house@example.com", "doctor", 3),
+    ("/prescriptions/patient", "john@example.com", "patient", 3),
+])
+@pytest.mark.parametrize("rows", [1, 25])
+def test_listing_query_count_is_constant(client, pharmacy, query_counter, path, email, user_type, expected_queries, rows):
+    add_prescriptions(pharmacy, rows)
+    query_counter.clear()
+
+    response = client.get(path, headers=auth_headers(email, user_type))
+
+    assert response.status_code == 200
+    assert len(response.json()) == rows
+    assert all(len(item["medications"]) == 2 for item in response.json())
+    assert len(query_counter) == expected_queries
+
+
+def test_get_prescription_query_count(client, pharmacy, query_counter):
+    add_prescriptions(pharmacy, 3)
+    query_counter.clear()
+
+    response = client.get("/prescriptions/2", headers=auth_headers("house@example.com", "doctor"))
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["patient_name"] == "John Doe"
+    assert body["doctor_name"] == "Dr. House"
+    assert [med["medication_name"] for med in body["medications"]] == ["Aspirin", "Ibuprofen"]
+    # auth lookup + prescription + medication lines; the license comes with the principal
+    assert len(query_counter) == 3
+
+
+def test_token_claims_authorize_without_reading_the_user(client, pharmacy, query_counter):
+    add_prescriptions(pharmacy, 1)
+    doctor = pharmacy.query(Doctor).one()
+    token = create_access_token(data=principal_claims(doctor, "doctor"))
+    headers = {"Authorization": f"Bearer {token}"}
+    query_counter.clear()
+
+    assert client.get("/prescriptions/1", headers=headers).status_code == 200
+    # Active check by primary key + prescription + medication lines
+    assert len(query_counter) == 3
+    assert "WHERE doctors.id = ?" in query_counter[0]
+
+    query_counter.clear()
+    assert client.get("/prescriptions/1", headers=headers).status_code == 200
+    # The principal is cached for the token's lifetime
+    assert len(query_counter) == 2
+
+
+def test_get_prescriptions_by_ids_checks_each_row(client, pharmacy, query_counter):
+    add_prescriptions(pharmacy, 3)
+    pharmacy.add(Doctor(license_number="DOC-2", name="Dr. Who", specialization="General",
+                        contact_info="555", email="who@example.com", hashed_password="x"))
+    pharmacy.flush()
+    pharmacy.query(Prescription).filter(Prescription.id == 2).update({"doctor_license": "DOC-2"})
+    pharmacy.commit()
+    query_counter.clear()
+
+    response = client.get("/prescriptions/by-ids?ids=3&ids=2&ids=99&ids=1&ids=3",
+                          headers=auth_headers("house@example.com", "doctor"))
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [prescription["id"] for prescription in body["prescriptions"]] == [3, 1]
+    assert all(len(prescription["medications"]) == 2 for prescription in body["prescriptions"])
+    assert (body["missing"], body["forbidden"]) == ([99], [2])
+    # auth lookup + prescriptions + medication lines
+    assert len(query_counter) == 3
+
+    response = client.get("/prescriptions/by-ids?ids=1&ids=2", headers=auth_headers("pharma@example.com", "pharmacist"))
+    assert [prescription["id"] for prescription in response.json()["prescriptions"]] == [1, 2]
+    assert client.get("/prescriptions/by-ids", headers=auth_headers("pharma@example.com", "pharmacist")).status_code == 422
+
+
+def test_all_prescriptions_keyset_pagination(client, pharmacy):
+    add_prescriptions(pharmacy, 7)
+    headers = auth_headers("pharma@example.com", "pharmacist")
+
+    seen = []
+    response = client.get("/prescriptions/all?limit=3&total=exact", headers=headers)
+    assert response.headers["X-Total-Count"] == "7"
+    while True:
+        assert response.status_code == 200
+        seen.extend(item["id"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        response = client.get(f"/prescriptions/all?limit=3&cursor={cursor}", headers=headers)
+        assert "X-Total-Count" not in response.headers
+
+    # Newest first, every row exactly once
+    assert seen == list(range(1, 8))
+
+    # Legacy offset clients still get the same rows
+    legacy = client.get("/prescriptions/all?skip=3&limit=3", headers=headers)
+    assert [item["id"] for item in legacy.json()] == seen[3:6]
+
+    assert client.get("/prescriptions/all?cursor=garbage", headers=headers).status_code == 400
+
+
+def test_estimated_totals_are_cached_in_bounded_space(client, pharmacy, monkeypatch):
+    add_prescriptions(pharmacy, 3)
+    monkeypatch.setattr(prescription_count_cache, "maxsize", 2)
+    prescription_count_cache.invalidate()
+    headers = auth_headers("pharma@example.com", "pharmacist")
+
+    totals = [
+        client.get(f"/prescriptions/all?total=estimate&doctor_license={license}", headers=headers).headers["X-Total-Count"]
+        for license in ("DOC-1", "DOC-2", "DOC-3", "DOC-4")
+    ]
+    assert totals == ["3", "0", "0", "0"]
+    assert len(prescription_count_cache._entries) == 2
+
+
+def test_fulfill_rolls_back_every_line_on_shortfall(client, pharmacy):
+    add_prescriptions(pharmacy, 1)
+    set_stock(pharmacy, "Ibuprofen", 0)
+    pharmacy.commit()
+
+    response = client.patch("/prescriptions/1/fulfill", headers=auth_headers("pharma@example.com", "pharmacist"))
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Ibuprofen out of stock"
+    pharmacy.expire_all()
+    assert pharmacy.query(Medication).filter(Medication.name == "Aspirin").one().stock_quantity == 50
+    assert pharmacy.get(Prescription, 1).status == "pending"
+
+
+def test_concurrent_fulfillment_never_oversells(pharmacy):
+    # 30 single-line prescriptions compete for 10 units
+    set_stock(pharmacy, "Aspirin", 10)
+    for _ in range(30):
+        prescription = Prescription(patient_ssn="123-45-6789", doctor_license="DOC-1", status="pending")
+        pharmacy.add(prescription)
+        pharmacy.flush()
+        pharmacy.add(PrescriptionMedication(
+            prescription_id=prescription.id, medication_id=1, medication_name="Aspirin",
+            dosage="1 tablet", frequency="once a day", duration="1 day"
+        ))
+    pharmacy.commit()
+    prescription_ids = [p.id for p in pharmacy.query(Prescription).all()]
+
+    Session = sessionmaker(bind=pharmacy.get_bind())
+
+    def fulfill(prescription_id):
+        session = Session()
+        try:
+            fulfill_prescription(session, prescription_id)
+            return True
+        except HTTPException:
+            return False
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        # Every prescription is attempted twice to also race duplicate fulfills
+        outcomes = list(executor.map(fulfill, prescription_ids + prescription_ids))
+
+    pharmacy.expire_all()
+    assert sum(outcomes) == 10
+    assert pharmacy.query(Medication).filter(Medication.name == "Aspirin").one().stock_quantity == 0
+    assert pharmacy.query(Prescription).filter(Prescription.status == "fulfilled").count() == 10
+
+
+def test_fulfill_deducts_parsed_quantities(client, pharmacy):
+    response = client.post("/prescriptions/", headers=auth_headers("house@example.com", "doctor"), json={
+        "patient_ssn": "123-45-6789",
+        "doctor_license": "DOC-1",
+        "medications": [
+            {"medication_name": "Aspirin", "dosage": "1 tablet", "frequency": "twice a day", "duration": "5 days"},
+            {"medication_name": "Ibuprofen", "dosage": "2 tablets", "frequency": "3 fois /jour", "duration": "2 jours"},
+        ]
+    })
+    assert response.status_code == 200
+    lines = response.json()["medications"]
+    assert [line["quantity"] for line in lines] == [10, 12]
+
+    response = client.patch(
+        f"/prescriptions/{response.json()['id']}/fulfill",
+        headers=auth_headers("pharma@example.com", "pharmacist")
+    )
+
+    assert response.status_code == 200
+    pharmacy.expire_all()
+    stock = dict(pharmacy.query(Medication.name, Medication.stock_quantity).all())
+    assert stock == {"Aspirin": 40, "Ibuprofen": 38}
+
+
+def test_lines_follow_the_medication_id_after_a_rename(client, pharmacy):
+    response = client.post("/prescriptions/", headers=auth_headers("house@example.com", "doctor"), json={
+        "patient_ssn": "123-45-6789",
+        "doctor_license": "DOC-1",
+        "medications": [{"medication_name": "Aspirin", "dosage": "1 tablet", "frequency": "once a day", "duration": "3 days"}]
+    })
+    assert response.status_code == 200
+    assert response.json()["medications"][0]["medication_id"] == 1
+
+    pharmacy.get(Medication, 1).name = "Aspirin 100"
+    pharmacy.commit()
+    response = client.patch(
+        f"/prescriptions/{response.json()['id']}/fulfill",
+        headers=auth_headers("pharma@example.com", "pharmacist")
+    )
+
+    assert response.status_code == 200
+    # The line keeps the name it was prescribed under
+    assert response.json()["medications"][0]["medication_name"] == "Aspirin"
+    pharmacy.expire_all()
+    assert pharmacy.get(Medication, 1).stock_quantity == 47
+
+
+def test_medications_on_pending_prescriptions_cannot_be_deleted(client, pharmacy):
+    add_prescriptions(pharmacy, 1)
+    headers = auth_headers("pharma@example.com", "pharmacist")
+
+    refused = client.delete("/medications/1", headers=headers)
+    assert refused.status_code == 409
+    assert pharmacy.get(Medication, 1) is not None
+
+    # Once dispensed, the line is history and the medication may go
+    assert client.patch("/prescriptions/1/fulfill", headers=headers).status_code == 200
+    assert client.delete("/medications/1", headers=headers).status_code == 200
+
+
+def test_unknown_medication_creates_nothing(client, pharmacy):
+    response = client.post("/prescriptions/", headers=auth_headers("house@example.com", "doctor"), json={
+        "patient_ssn": "123-45-6789",
+        "doctor_license": "DOC-1",
+        "medications": [
+            {"medication_name": "Aspirin", "dosage": "1 tablet", "frequency": "once a day", "duration": "3 days"},
+            {"medication_name": "Unobtainium", "dosage": "1 tablet", "frequency": "once a day", "duration": "3 days"},
+        ]
+    })
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Medication Unobtainium not found"
+    assert pharmacy.query(Prescription).count() == 0
+
+
+def test_fulfill_batch_best_effort_reports_each_prescription(client, pharmacy):
+    add_prescriptions(pharmacy, 4)
+    add_prescriptions(pharmacy, 1, status="fulfilled")
+    # One unit of Ibuprofen left: the first prescription gets it, the second falls short
+    set_stock(pharmacy, "Ibuprofen", 1)
+    pharmacy.commit()
+
+    response = client.post("/prescriptions/fulfill-batch", headers=auth_headers("pharma@example.com", "pharmacist"),
+                           json={"prescription_ids": [1, 2, 5, 99, 1]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["mode"], body["committed"], body["fulfilled"]) == ("best_effort", True, 1)
+    assert [(r["prescription_id"], r["fulfilled"], r["detail"]) for r in body["results"]] == [
+        (1, True, None),
+        (2, False, "Ibuprofen out of stock"),
+        (5, False, "Prescription is already fulfilled"),
+        (99, False, "Prescription not found"),
+    ]
+    pharmacy.expire_all()
+    assert [p.status for p in pharmacy.query(Prescription).order_by(Prescription.id)][:3] == ["fulfilled", "pending", "pending"]
+    assert dict(pharmacy.query(Medication.name, Medication.stock_quantity).all()) == {"Aspirin": 49, "Ibuprofen": 0}
+
+
+def test_fulfill_batch_all_or_nothing_rolls_back(client, pharmacy):
+    add_prescriptions(pharmacy, 3)
+    set_stock(pharmacy, "Aspirin", 2)
+    pharmacy.commit()
+
+    response = client.post("/prescriptions/fulfill-batch", headers=auth_headers("pharma@example.com", "pharmacist"),
+                           json={"prescription_ids": [1, 2, 3], "mode": "all_or_nothing"})
+
+    body = response.json()
+    assert (body["committed"], body["fulfilled"]) == (False, 0)
+    assert body["results"][2] == {"prescription_id": 3, "fulfilled": False, "detail": "Aspirin out of stock"}
+    assert body["results"][0]["detail"] == "Rolled back: another prescription in the batch failed"
+    pharmacy.expire_all()
+    assert {p.status for p in pharmacy.query(Prescription)} == {"pending"}
+    assert pharmacy.query(Medication).filter(Medication.name == "Aspirin").one().stock_quantity == 2
+
+
+@pytest.mark.parametrize("count", [2, 20])
+def test_fulfill_batch_query_count_is_constant(client, pharmacy, query_counter, count):
+    add_prescriptions(pharmacy, count)
+    headers = auth_headers("pharma@example.com", "pharmacist")
+    query_counter.clear()
+
+    response = client.post("/prescriptions/fulfill-batch", headers=headers,
+                           json={"prescription_ids": list(range(1, count + 1))})
+
+    assert response.json()["fulfilled"] == count
+    # Pharmacist lookup, claim, lines, medication lock, stock, lease release, movement insert
+    assert len(query_counter) == 7
+
+
+def test_fulfill_batch_keeps_the_lease_of_prescriptions_it_could_not_fill(client, pharmacy):
+    add_prescriptions(pharmacy, 2)
+    set_stock(pharmacy, "Ibuprofen", 1)
+    pharmacy.commit()
+    headers = auth_headers("pharma@example.com", "pharmacist")
+    assert len(client.post("/prescriptions/queue/claim?limit=2", headers=headers).json()) == 2
+
+    response = client.post("/prescriptions/fulfill-batch", headers=headers, json={"prescription_ids": [1, 2]})
+
+    assert response.json()["fulfilled"] == 1
+    pharmacy.expire_all()
+    fulfilled, short = pharmacy.query(Prescription).order_by(Prescription.id).all()
+    assert (fulfilled.status, fulfilled.claimed_by, fulfilled.lease_expires_at) == ("fulfilled", None, None)
+    assert (short.status, short.claimed_by) == ("pending", "PH-1")
+    assert short.lease_expires_at is not None
+    # Still leased, so the queue does not hand it to anyone else
+    assert client.post("/prescriptions/queue/claim", headers=headers).json() == []
+
+
+def test_queue_claims_are_disjoint_and_fillable_first(client, pharmacy):
+    pharmacy.add(Pharmacist(license_number="PH-2", name="Other", email="other@example.com", hashed_password="x"))
+    add_prescriptions(pharmacy, 4)
+    # The newest prescription asks for a medication that is out of stock, so it is served last
+    rare = Medication(name="Rare", dosage_form="tablet", strength="1mg", price=1.0)
+    pharmacy.add(rare)
+    pharmacy.flush()
+    pharmacy.add(PrescriptionMedication(prescription_id=4, medication_id=rare.id, medication_name="Rare",
+                                        dosage="1 tablet", frequency="once a day", duration="1 day"))
+    pharmacy.commit()
+
+    first = client.post("/prescriptions/queue/claim?limit=2", headers=auth_headers("pharma@example.com", "pharmacist"))
+    second = client.post("/prescriptions/queue/claim?limit=5", headers=auth_headers("other@example.com", "pharmacist"))
+
+    # add_prescriptions dates each one a day older than the previous
+    assert [p["id"] for p in first.json()] == [3, 2]
+    assert [p["id"] for p in second.json()] == [1, 4]
+    assert {p["claimed_by"] for p in first.json()} == {"PH-1"}
+
+    # Someone else's lease blocks fulfillment; fulfilling your own releases it
+    response = client.patch("/prescriptions/1/fulfill", headers=auth_headers("pharma@example.com", "pharmacist"))
+    assert response.status_code == 409
+    response = client.patch("/prescriptions/3/fulfill", headers=auth_headers("pharma@example.com", "pharmacist"))
+    assert (response.json()["status"], response.json()["claimed_by"]) == ("fulfilled", None)
+
+    response = client.post("/prescriptions/queue/release", headers=auth_headers("pharma@example.com", "pharmacist"),
+                           json={"prescription_ids": [1, 2]})
+    assert response.json() == {"released": 1}
+    response = client.post("/prescriptions/queue/release", headers=auth_headers("pharma@example.com", "pharmacist"),
+                           json={"prescription_ids": list(range(1, 202))})
+    assert response.status_code == 422
+
+
+def test_expired_leases_return_to_the_queue(client, pharmacy):
+    add_prescriptions(pharmacy, 1)
+    headers = auth_headers("pharma@example.com", "pharmacist")
+
+    assert len(client.post("/prescriptions/queue/claim", headers=headers).json()) == 1
+    assert client.post("/prescriptions/queue/claim", headers=headers).json() == []
+
+    pharmacy.query(Prescription).update({"lease_expires_at": datetime(2000, 1, 1)})
+    pharmacy.commit()
+    assert [p["id"] for p in client.post("/prescriptions/queue/claim", headers=headers).json()] == [1]
+
+
+def create_reserved_prescription(client, medications, reserve_stock=True):
+    return client.post("/prescriptions/", headers=auth_headers("house@example.com", "doctor"), json={
+        "patient_ssn": "123-45-6789",
+        "doctor_license": "DOC-1",
+        "reserve_stock": reserve_stock,
+        "medications": [
+            {"medication_name": name, "dosage": "1 tablet", "frequency": "once a day", "duration": f"{days} days"}
+            for name, days in medications
+        ]
+    })
+
+
+def test_reserved_stock_is_held_for_its_prescription(client, pharmacy):
+    set_stock(pharmacy, "Aspirin", 10)
+    pharmacy.commit()
+    reserved = create_reserved_prescription(client, [("Aspirin", 8)])
+    unreserved = create_reserved_prescription(client, [("Aspirin", 5)], reserve_stock=False)
+    assert reserved.status_code == unreserved.status_code == 200
+
+    aspirin = client.get("/medications/by-name/Aspirin").json()
+    assert (aspirin["stock_quantity"], aspirin["reserved_quantity"], aspirin["available_quantity"]) == (10, 8, 2)
+
+    headers = auth_headers("pharma@example.com", "pharmacist")
+    assert client.patch(f"/prescriptions/{unreserved.json()['id']}/fulfill", headers=headers).status_code == 400
+    assert client.patch(f"/prescriptions/{reserved.json()['id']}/fulfill", headers=headers).status_code == 200
+
+    aspirin = client.get("/medications/by-name/Aspirin").json()
+    assert (aspirin["stock_quantity"], aspirin["reserved_quantity"], aspirin["available_quantity"]) == (2, 0, 2)
+
+
+def test_editing_a_reserved_prescription_moves_its_hold(client, pharmacy):
+    set_stock(pharmacy, "Aspirin", 10)
+    pharmacy.commit()
+    prescription_id = create_reserved_prescription(client, [("Aspirin", 4)]).json()["id"]
+    headers = auth_headers("house@example.com", "doctor")
+
+    def edit(medications):
+        return client.patch(f"/prescriptions/{prescription_id}", headers=headers, json={"medications": [
+            {"medication_name": name, "dosage": "1 tablet", "frequency": "once a day", "duration": f"{days} days"}
+            for name, days in medications
+        ]})
+
+    def reserved(name):
+        return client.get(f"/medications/by-name/{name}").json()["reserved_quantity"]
+
+    assert edit([("Aspirin", 7), ("Ibuprofen", 3)]).status_code == 200
+    assert (reserved("Aspirin"), reserved("Ibuprofen")) == (7, 3)
+
+    # More than the shelf holds: the edit is refused and the previous lines keep their hold
+    short = edit([("Aspirin", 11)])
+    assert (short.status_code, short.json()["detail"]) == (400, "Aspirin not available to reserve")
+    assert (reserved("Aspirin"), reserved("Ibuprofen")) == (7, 3)
+    pharmacy.expire_all()
+    assert len(pharmacy.get(Prescription, prescription_id).medications) == 2
+
+
+def test_failed_reservation_keeps_nothing(client, pharmacy):
+    response = create_reserved_prescription(client, [("Aspirin", 5), ("Ibuprofen", 60)])
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Ibuprofen not available to reserve"
+    pharmacy.expire_all()
+    assert pharmacy.query(Prescription).count() == 0
+    assert pharmacy.query(StockReservation).count() == 0
+
+
+def test_sweeper_releases_expired_reservations(client, pharmacy):
+    create_reserved_prescription(client, [("Aspirin", 5)])
+    create_reserved_prescription(client, [("Aspirin", 7)])
+    pharmacy.query(StockReservation).filter(StockReservation.quantity == 5).update({"expires_at": datetime(2000, 1, 1)})
+    pharmacy.commit()
+
+    assert release_expired_reservations(pharmacy, batch_size=1) == 1
+    assert release_expired_reservations(pharmacy) == 0
+    pharmacy.expire_all()
+    aspirin = pharmacy.query(Medication).filter(Medication.name == "Aspirin").one()
+    assert (aspirin.reserved_quantity, aspirin.available_quantity) == (7, 43)
+
+
+def test_fulfill_batch_honours_reservations(client, pharmacy):
+    set_stock(pharmacy, "Aspirin", 10)
+    pharmacy.commit()
+    unreserved = create_reserved_prescription(client, [("Aspirin", 5)], reserve_stock=False).json()["id"]
+    reserved = create_reserved_prescription(client, [("Aspirin", 8)]).json()["id"]
+
+    response = client.post("/prescriptions/fulfill-batch", headers=auth_headers("pharma@example.com", "pharmacist"),
+                           json={"prescription_ids": [unreserved, reserved]})
+
+    assert [r["fulfilled"] for r in response.json()["results"]] == [False, True]
+    pharmacy.expire_all()
+    aspirin = pharmacy.query(Medication).filter(Medication.name == "Aspirin").one()
+    assert (aspirin.stock_quantity, aspirin.reserved_quantity) == (2, 0)
+
+
+def bulk_item(medications, patient_ssn="123-45-6789", doctor_license="DOC-1", reserve_stock=False):
+    return {
+        "patient_ssn": patient_ssn,
+        "doctor_license": doctor_license,
+        "reserve_stock": reserve_stock,
+        "medications": [
+            {"medication_name": name, "dosage": "1 tablet", "frequency": "once a day", "duration": f"{days} days"}
+            for name, days in medications
+        ]
+    }
+
+
+def test_create_writes_once(client, pharmacy, query_counter):
+    query_counter.clear()
+    response = create_reserved_prescription(client, [("Aspirin", 2), ("Ibuprofen", 3)], reserve_stock=False)
+
+    assert response.status_code == 200
+    assert [line["quantity"] for line in response.json()["medications"]] == [2, 3]
+    inserts = [statement.split(" (")[0] for statement in query_counter if statement.startswith("INSERT")]
+    assert inserts == ["INSERT INTO prescriptions", "INSERT INTO prescription_medications"]
+
+
+def test_bulk_create_reports_each_prescription(client, pharmacy):
+    set_stock(pharmacy, "Ibuprofen", 5)
+    pharmacy.commit()
+
+    response = client.post("/prescriptions/bulk", headers=auth_headers("house@example.com", "doctor"), json={
+        "prescriptions": [
+            bulk_item([("Aspirin", 3), ("Ibuprofen", 1)]),
+            bulk_item([("Aspirin", 1)], patient_ssn="000-00-0000"),
+            bulk_item([("Unobtainium", 1)]),
+            bulk_item([("Aspirin", 1)], doctor_license="DOC-9"),
+            # Only 4 Ibuprofen left to hold once the first is in
+            bulk_item([("Aspirin", 2), ("Ibuprofen", 7)], reserve_stock=True),
+            bulk_item([("Ibuprofen", 2)], reserve_stock=True),
+        ]
+    })
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["committed"], body["created"]) == (True, 2)
+    assert [(result["created"], result["detail"]) for result in body["results"]] == [
+        (True, None),
+        (False, "Patient not found"),
+        (False, "Medication Unobtainium not found"),
+        (False, "You can only create prescriptions with your own license number"),
+        (False, "Ibuprofen not available to reserve"),
+        (True, None),
+    ]
+    created = [result["prescription_id"] for result in body["results"] if result["created"]]
+    assert sorted(p.id for p in pharmacy.query(Prescription)) == created
+    assert pharmacy.query(PrescriptionMedication).count() == 3
+    # The failed reservation left no partial hold behind
+    assert [(r.prescription_id, r.quantity) for r in pharmacy.query(StockReservation)] == [(created[1], 2)]
+
+
+def test_bulk_create_all_or_nothing(client, pharmacy):
+    response = client.post("/prescriptions/bulk", headers=auth_headers("house@example.com", "doctor"), json={
+        "mode": "all_or_nothing",
+        "prescriptions": [bulk_item([("Aspirin", 1)]), bulk_item([("Unobtainium", 1)])]
+    })
+
+    body = response.json()
+    assert (body["committed"], body["created"]) == (False, 0)
+    assert body["results"][0]["detail"] == "Rolled back: another prescription in the batch failed"
+    assert pharmacy.query(Prescription).count() == 0
+
+
+@pytest.mark.parametrize("count", [1, 100])
+def test_bulk_create_query_count_is_constant(client, pharmacy, query_counter, count):
+    query_counter.clear()
+    response = client.post("/prescriptions/bulk", headers=auth_headers("house@example.com", "doctor"), json={
+        "prescriptions": [bulk_item([("Aspirin", 1), ("Ibuprofen", 2)]) for _ in range(count)]
+    })
+
+    assert response.json()["created"] == count
+    # Doctor lookup, patients, doctors, medications, lines; plus the headers, batched
+    # on PostgreSQL but one per row on SQLite, which cannot order a batch's RETURNING rows
+    headers = [statement for statement in query_counter if statement.startswith("INSERT INTO prescriptions ")]
+    assert len(query_counter) - len(headers) == 5
+    assert pharmacy.query(PrescriptionMedication).count() == 2 * count
+
+
+def test_retried_create_replays_the_first_response(client, pharmacy, query_counter):
+    headers = {**auth_headers("house@example.com", "doctor"), "Idempotency-Key": "create-1"}
+    body = bulk_item([("Aspirin", 2)])
+    first = client.post("/prescriptions/", headers=headers, json=body)
+    query_counter.clear()
+    retry = client.post("/prescriptions/", headers=headers, json=body)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.content == first.content
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    # Doctor lookup, then the claim and the stored response; no prescription table is read
+    assert not [statement for statement in query_counter if "prescription" in statement]
+    assert pharmacy.query(Prescription).count() == 1
+
+    # The same key for another body is refused, another key creates a new prescription
+    reused = client.post("/prescriptions/", headers=headers, json=bulk_item([("Aspirin", 3)]))
+    assert reused.status_code == 422
+    other = client.post("/prescriptions/", headers={**headers, "Idempotency-Key": "create-2"}, json=body)
+    assert other.json()["id"] != first.json()["id"]
+
+
+def test_retried_fulfill_replays_success(client, pharmacy):
+    add_prescriptions(pharmacy, 1)
+    headers = {**auth_headers("pharma@example.com", "pharmacist"), "Idempotency-Key": "fulfill-1"}
+    first = client.patch("/prescriptions/1/fulfill", headers=headers)
+    retry = client.patch("/prescriptions/1/fulfill", headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    # Without the key a second fulfill is still an error
+    again = client.patch("/prescriptions/1/fulfill", headers=auth_headers("pharma@example.com", "pharmacist"))
+    assert again.status_code == 400
+    pharmacy.expire_all()
+    # Deducted once
+    assert pharmacy.query(Medication).filter(Medication.name == "Aspirin").one().stock_quantity == 49
+
+
+def test_retried_fulfill_runs_again_after_a_transient_failure(client, pharmacy):
+    add_prescriptions(pharmacy, 1)
+    set_stock(pharmacy, "Aspirin", 0)
+    pharmacy.commit()
+    headers = {**auth_headers("pharma@example.com", "pharmacist"), "Idempotency-Key": "fulfill-1"}
+
+    short = client.patch("/prescriptions/1/fulfill", headers=headers)
+    assert (short.status_code, short.json()["detail"]) == (400, "Aspirin out of stock")
+    assert pharmacy.query(IdempotencyKey).count() == 0
+
+    # Restocked, the retry with the same key dispenses instead of replaying the shortfall
+    set_stock(pharmacy, "Aspirin", 5)
+    pharmacy.commit()
+    retry = client.patch("/prescriptions/1/fulfill", headers=headers)
+    assert (retry.status_code, retry.json()["status"]) == (200, "fulfilled")
+    assert "Idempotent-Replayed" not in retry.headers
+
+    # A deterministic error is still replayed
+    missing = {**headers, "Idempotency-Key": "fulfill-2"}
+    assert client.patch("/prescriptions/99/fulfill", headers=missing).status_code == 404
+    assert client.patch("/prescriptions/99/fulfill", headers=missing).headers["Idempotent-Replayed"] == "true"
+
+
+def test_concurrent_duplicates_execute_once(pharmacy):
+    Session = sessionmaker(bind=pharmacy.get_bind())
+    executions = []
+
+    def execute():
+        executions.append(1)
+        time.sleep(0.3)
+        return "done"
+
+    def call(_):
+        session = Session()
+        try:
+            return run_idempotent(session, "doctor:house@example.com", "key", "fingerprint", execute, json.dumps).body
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        bodies = list(executor.map(call, range(5)))
+
+    assert len(executions) == 1
+    assert bodies == [b'"done"'] * 5
+
+
+def test_expired_keys_run_again_and_are_purged(pharmacy):
+    calls = []
+    run_idempotent(pharmacy, "doctor:house@example.com", "key", "fingerprint", lambda: calls.append(1), json.dumps)
+    pharmacy.query(IdempotencyKey).update({IdempotencyKey.expires_at: utcnow() - timedelta(seconds=1)})
+    pharmacy.commit()
+
+    run_idempotent(pharmacy, "doctor:house@example.com", "key", "fingerprint", lambda: calls.append(1), json.dumps)
+    assert len(calls) == 2
+    pharmacy.query(IdempotencyKey).update({IdempotencyKey.expires_at: utcnow() - timedelta(seconds=1)})
+    pharmacy.commit()
+    assert purge_expired_idempotency_keys(pharmacy) == 1
+    assert pharmacy.query(IdempotencyKey).count() == 0
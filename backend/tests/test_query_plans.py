@@ -0,0 +1,77 @@
+import re
+from datetime import date
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, select, tuple_
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import sessionmaker
+
+from app.crud.prescription import build_prescription_query, prescription_lines_query, units_needed_query
+from app.models.medication import Medication
+from app.models.prescription import Prescription
+
+# A full pass over one of the big tables, as opposed to "SCAN x USING INDEX"
+# or "SEARCH x USING INDEX"
+TABLE_SCAN = re.compile(r"\bSCAN (prescriptions|prescription_medications|stock_movements|stock_reservations)\b(?! USING (COVERING )?INDEX)")
+
+
+@pytest.fixture(scope="module")
+def migrated_session(tmp_path_factory):
+    """A session on a database built by the Alembic migrations, not create_all"""
+    url = f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}"
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", url)
+    command.upgrade(config, "head")
+
+    engine = create_engine(url)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def explain(session, query):
+    sql = query.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True})
+    return [row[-1] for row in session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def hot_queries(session):
+    """The statements behind the prescription read endpoints"""
+    def page(after=None, **filters):
+        query = build_prescription_query(**filters).order_by(
+            Prescription.date_issued.desc(), Prescription.id.desc()
+        )
+        if after:
+            query = query.where(tuple_(Prescription.date_issued, Prescription.id) < after)
+        return query.limit(101)
+
+    return {
+        "all": page(),
+        "by status": page(status="pending"),
+        "by doctor": page(doctor_license="DOC-1"),
+        "by patient": page(patient_ssn="123-45-6789"),
+        "after cursor": page(after=(date(2026, 1, 1), 500), status="pending"),
+        "by id": build_prescription_query().where(Prescription.id == 1),
+        "medication lines": prescription_lines_query([1, 2, 3]),
+        # What fulfillment dispenses, read from the covering index alone
+        "units needed": units_needed_query(1),
+        # Snapshot plus ledger tail
+        "current stock": select(Medication.stock_quantity).where(Medication.name == "Aspirin"),
+        # ... minus the active reservations, from the partial index
+        "available stock": select(Medication.available_quantity).where(Medication.name == "Aspirin"),
+    }
+
+
+@pytest.mark.parametrize("name", [
+    "all", "by status", "by doctor", "by patient", "after cursor", "by id", "medication lines", "units needed",
+    "current stock", "available stock"
+])
+def test_hot_queries_use_indexes(migrated_session, name):
+    plan = explain(migrated_session, hot_queries(migrated_session)[name])
+
+    scans = [step for step in plan if TABLE_SCAN.search(step)]
+    assert not scans, f"{name} falls back to a table scan: {plan}"
+    assert not any("TEMP B-TREE" in step for step in plan if name != "medication lines"), \
+        f"{name} sorts in a temporary b-tree instead of reading the index in order: {plan}"
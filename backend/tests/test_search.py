@@ -0,0 +1,77 @@
+import pytest
+
+from app.crud.medication import upsert_medications
+from app.crud.stock import compact_stock, record_movement
+from app.models.medication import Medication
+
+
+@pytest.fixture
+def catalog(db):
+    rows = [
+        {"name": "Aspirin", "description": "Pain and fever", "dosage_form": "tablet", "strength": "100mg", "price": 2.5, "stock_quantity": 10},
+        {"name": "Aspirin Forte", "description": "Pain and fever", "dosage_form": "tablet", "strength": "500mg", "price": 3.0, "stock_quantity": 10},
+        {"name": "Paracetamol", "description": "Pain relief", "dosage_form": "tablet", "strength": "500mg", "price": 1.5, "stock_quantity": 10},
+        {"name": "Ibuprofen", "description": "Anti-inflammatory, not with aspirin", "dosage_form": "tablet", "strength": "200mg", "price": 4.0, "stock_quantity": 10},
+        {"name": "Amoxicillin", "description": "Antibiotic", "dosage_form": "capsule", "strength": "500mg", "price": 6.0, "stock_quantity": 10},
+    ]
+    upsert_medications(db, rows)
+    return {medication.name: medication.id for medication in db.query(Medication)}
+
+
+def names(response):
+    assert response.status_code == 200
+    return [medication["name"] for medication in response.json()]
+
+
+def test_substring_search_ranks_name_prefixes_first(client, catalog):
+    found = names(client.get("/medications/search", params={"q": "aspi"}))
+    # Aspirin is also mentioned in the ibuprofen description, which ranks last
+    assert found[-1] == "Ibuprofen"
+    assert sorted(found[:2]) == ["Aspirin", "Aspirin Forte"]
+
+    assert names(client.get("/medications/search", params={"q": "CETAMOL"})) == ["Paracetamol"]
+    assert sorted(names(client.get("/medications/search", params={"q": "500mg pain"}))) == ["Aspirin Forte", "Paracetamol"]
+
+
+def test_typos_fall_back_to_close_spellings(client, catalog):
+    assert names(client.get("/medications/search", params={"q": "asprin"}))[0] == "Aspirin"
+    assert names(client.get("/medications/search", params={"q": "amoxicilin"})) == ["Amoxicillin"]
+    assert names(client.get("/medications/search", params={"q": "zzzzzz"})) == []
+
+
+def test_short_queries_match_name_prefixes(client, catalog):
+    assert names(client.get("/medications/search", params={"q": "am"})) == ["Amoxicillin"]
+
+
+def test_pagination(client, catalog):
+    first = names(client.get("/medications/search", params={"q": "500", "limit": 2}))
+    rest = names(client.get("/medications/search", params={"q": "500", "skip": 2, "limit": 2}))
+    assert len(first) == 2 and len(rest) == 1
+    assert sorted(first + rest) == ["Amoxicillin", "Aspirin Forte", "Paracetamol"]
+
+
+def test_index_follows_writes(client, db, catalog):
+    medication = db.get(Medication, catalog["Ibuprofen"])
+    medication.name = "Nurofen"
+    db.commit()
+    assert names(client.get("/medications/search", params={"q": "ibuprofen"})) == []
+    assert names(client.get("/medications/search", params={"q": "nurofen"})) == ["Nurofen"]
+
+    # Stock changes do not rewrite the index
+    record_movement(db, catalog["Paracetamol"], "receive", 5)
+    db.commit()
+    compact_stock(db)
+
+    db.delete(db.get(Medication, catalog["Paracetamol"]))
+    db.commit()
+    assert names(client.get("/medications/search", params={"q": "paracetamol"})) == []
+
+
+def test_lookup_by_names_reports_missing_ones(client, catalog, query_counter):
+    query_counter.clear()
+    response = client.get("/medications/by-names", params={"names": ["Paracetamol", "Nope", "Aspirin", "Paracetamol"]})
+
+    assert response.status_code == 200
+    assert [medication["name"] for medication in response.json()["medications"]] == ["Paracetamol", "Aspirin"]
+    assert response.json()["missing"] == ["Nope"]
+    assert len(query_counter) == 1
@@ -0,0 +1,104 @@
+import pytest
+
+from app.auth.jwt import create_access_token
+from app.crud.stock import compact_stock, reconcile_stock, record_movement
+from app.models.medication import Medication
+from app.models.pharmacist import Pharmacist
+from app.models.stock_movement import StockMovement
+
+PHARMACIST = {"Authorization": "Bearer " + create_access_token(
+    data={"sub": "pharma@example.com", "user_type": "pharmacist"}
+)}
+
+
+@pytest.fixture
+def aspirin(client, db):
+    db.add(Pharmacist(license_number="PH-1", name="Pharma", email="pharma@example.com", hashed_password="x"))
+    db.commit()
+    response = client.post("/medications/", headers=PHARMACIST, json={
+        "name": "Aspirin", "dosage_form": "tablet", "strength": "100mg", "stock_quantity": 50, "price": 2.5
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def stock(db, medication_id):
+    db.expire_all()
+    return db.get(Medication, medication_id).stock_quantity
+
+
+def test_every_change_is_a_movement(client, db, aspirin):
+    response = client.patch(f"/medications/{aspirin}", headers=PHARMACIST, json={"stock_quantity": 42})
+    assert response.status_code == 200
+    assert response.json()["stock_quantity"] == 42
+
+    response = client.get(f"/medications/{aspirin}/movements", headers=PHARMACIST)
+    assert [(m["kind"], m["quantity"]) for m in response.json()] == [("adjust", -8), ("adjust", 50)]
+
+
+def test_compaction_keeps_stock_and_empties_the_tail(db, aspirin):
+    record_movement(db, aspirin, "receive", 20)
+    record_movement(db, aspirin, "dispense", -5)
+    db.commit()
+
+    assert compact_stock(db) == 1
+    medication = db.get(Medication, aspirin)
+    assert (medication.stock_snapshot, medication.stock_quantity) == (65, 65)
+    assert medication.snapshot_movement_id == db.query(StockMovement.id).order_by(StockMovement.id.desc()).first()[0]
+
+    # Movements after the snapshot are still counted, and nothing is left to compact twice
+    record_movement(db, aspirin, "return", 3)
+    db.commit()
+    assert stock(db, aspirin) == 68
+    assert compact_stock(db) == 1
+    assert compact_stock(db) == 0
+    assert stock(db, aspirin) == 68
+
+
+def test_reconciliation_reports_and_repairs_drift(db, aspirin):
+    compact_stock(db)
+    # A write that bypasses the ledger
+    db.query(Medication).filter(Medication.id == aspirin).update({"stock_snapshot": 45})
+    db.commit()
+
+    report = reconcile_stock(db, apply=False)
+    assert report == [{"medication_id": aspirin, "name": "Aspirin", "snapshot": 45, "ledger": 50, "drift": -5}]
+    assert stock(db, aspirin) == 45
+
+    assert reconcile_stock(db) == report
+    assert stock(db, aspirin) == 50
+    assert reconcile_stock(db, apply=False) == []
+
+
+def test_receive_books_a_whole_delivery_at_once(client, db, aspirin, query_counter):
+    response = client.post("/medications/", headers=PHARMACIST, json={
+        "name": "Ibuprofen", "dosage_form": "tablet", "strength": "200mg", "stock_quantity": 0, "price": 3.0
+    })
+    ibuprofen = response.json()["id"]
+    query_counter.clear()
+
+    response = client.post("/medications/receive", headers=PHARMACIST, json={
+        "note": "DN-1042",
+        "lines": [
+            {"medication_id": ibuprofen, "quantity": 30},
+            {"medication_id": aspirin, "quantity": 10},
+            {"medication_id": aspirin, "quantity": 5},
+        ]
+    })
+
+    assert response.status_code == 200
+    assert [(m["id"], m["stock_quantity"]) for m in response.json()] == [(aspirin, 65), (ibuprofen, 30)]
+    # Existence check, one executemany insert, reload; the pharmacist was cached by the first request
+    assert len(query_counter) == 3
+    movements = db.query(StockMovement.medication_id, StockMovement.quantity).filter(StockMovement.kind == "receive")
+    assert sorted(movements) == [(aspirin, 15), (ibuprofen, 30)]
+
+
+def test_receive_rejects_unknown_medications_without_booking_anything(client, db, aspirin):
+    response = client.post("/medications/receive", headers=PHARMACIST, json={
+        "lines": [{"medication_id": aspirin, "quantity": 10}, {"medication_id": 999, "quantity": 1}]
+    })
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Medications not found: 999"
+    assert stock(db, aspirin) == 50